@@ -387,31 +387,14 @@ def filter_four_fold(aln):
 
 
 def calc_four_fold_dist_matrix(aln):
-    names = aln.keys()
-
-    mat = []
-    # calc upper triangular
-    for i in range(len(names)):
-        mat.append([0.0] * (i+1))
-        for j in range(i+1, len(names)):
-            ind = find_four_fold(aln.get([names[i], names[j]]))
-
-            mismatches = 0
-            for k in ind:
-                if aln[names[i]][k] != aln[names[j]][k]:
-                    mismatches += 1
-            
-            if len(ind) == 0:
-                mat[-1].append(1.0)
-            else:            
-                mat[-1].append(mismatches / float(len(ind)))
-
-    # make symmetric
-    for j in range(len(names)):
-        for i in range(j):
-            mat[j][i] = mat[i][j]
+    """Returns a matrix of the proportion of differences at four-fold
+       degenerate sites between each pair of sequences
 
-    return mat
+       Four-fold sites are found for each pair as by find_four_fold().
+       Pairs without four-fold sites have distance 1.0.  Requires numpy.
+    """
+    from .seqarray import calc_four_fold_dist_matrix
+    return calc_four_fold_dist_matrix(aln, aln.keys())
 
 
 def find_degen(aln):
@@ -0,0 +1,285 @@
+"""
+
+   Allele frequency transition kernels
+
+Array-backed versions of the Kimura diffusion series in coal.py
+(freq_CDF, freq_pdf, prob_fix, sample_freq_CDF).  The coal.py functions
+build Legendre polynomials through closures for one (p, t) pair at a time.
+Here Legendre tables are computed for whole arrays of frequencies at once
+and the table over a grid of CDF upper limits is computed once per kernel,
+so densities, CDFs and samples for many loci reduce to a few matrix
+products.
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+from __future__ import division
+
+# numpy imports
+import numpy as np
+
+
+#=============================================================================
+# Legendre tables
+
+
+def legendre_table(r, k):
+    """
+    Returns an array of Legendre polynomials P_0(r) .. P_k(r)
+
+    r -- array of values in [-1, 1]
+    k -- maximum polynomial order
+
+    The result has shape r.shape + (k+1,).  Evaluation uses the same
+    three-term recurrence as coal.legendre().
+    """
+
+    r = np.asarray(r, dtype=float)
+    table = np.empty(r.shape + (k + 1,))
+    table[..., 0] = 1.0
+    if k >= 1:
+        table[..., 1] = r
+    for n in xrange(2, k + 1):
+        table[..., n] = ((2 * n - 1) * r * table[..., n - 1] -
+                         (n - 1) * table[..., n - 2]) / n
+    return table
+
+
+#=============================================================================
+# transition kernel
+
+
+class FreqKernel (object):
+    """
+    Kimura diffusion transition kernel for a population of size 'N'
+
+    N     -- population size
+    k     -- number of terms of the series (as in coal.freq_CDF)
+    ngrid -- number of grid points used for CDF inversion
+
+    All methods accept numpy arrays (or scalars) for frequencies and times
+    and broadcast them against each other.
+    """
+
+    def __init__(self, N, k=50, ngrid=2001):
+        self.N = N
+        self.k = k
+
+        i = np.arange(1, k + 1)
+        self._orders = i
+        self._rates = i * (i + 1) / (4.0 * N)
+        self._signs = (-1.0) ** i
+
+        # Legendre table for the grid of CDF upper limits, shared by
+        # all calls to sample()
+        self.grid = np.linspace(0.0, 1.0, ngrid)
+        self._grid_legs = legendre_table(1.0 - 2.0 * self.grid, k)[:, 1:]
+
+    def _coeffs(self, p, t):
+        """
+        Returns the series terms .5 * (P_{i-1}(r) - P_{i+1}(r)) *
+        exp(-i(i+1) t / 4N) for r = 1 - 2p and i = 1..k
+        """
+        legs = legendre_table(1.0 - 2.0 * p, self.k + 1)
+        diffs = .5 * (legs[..., :-2] - legs[..., 2:])
+        return diffs * np.exp(-np.multiply.outer(t, self._rates))
+
+    def prob_fix(self, p, t):
+        """Probability of fixation by time 't' starting at frequency 'p'"""
+        p, t = np.broadcast_arrays(np.asarray(p, dtype=float),
+                                   np.asarray(t, dtype=float))
+        return p + np.dot(self._coeffs(p, t), self._signs)
+
+    def prob_extinct(self, p, t):
+        """Probability of extinction by time 't' starting at frequency 'p'"""
+        p, t = np.broadcast_arrays(np.asarray(p, dtype=float),
+                                   np.asarray(t, dtype=float))
+        # P_i(-r) = (-1)^i P_i(r) turns prob_fix(1-p) into this form
+        return (1.0 - p) - self._coeffs(p, t).sum(axis=-1)
+
+    def cdf(self, p, t, T, ends=True):
+        """
+        CDF of the allele frequency at time 't' starting from 'p',
+        evaluated at upper limit 'T'
+
+        If ends is False, the point masses at 0 and 1 are not included
+        (as in coal.freq_CDF_legs_noends).
+        """
+        p, t, T = np.broadcast_arrays(np.asarray(p, dtype=float),
+                                      np.asarray(t, dtype=float),
+                                      np.asarray(T, dtype=float))
+        coeffs = self._coeffs(p, t)
+        legs_T = legendre_table(1.0 - 2.0 * T, self.k)[..., 1:]
+        s = (coeffs * (1.0 - legs_T)).sum(axis=-1)
+
+        if ends:
+            s += (1.0 - p) - coeffs.sum(axis=-1)
+            s += np.where(T >= 1.0, p + np.dot(coeffs, self._signs), 0.0)
+        return s
+
+    def prob_range(self, p, t, T1, T2):
+        """Probability the frequency at time 't' lies in (T1, T2]"""
+        return (self.cdf(p, t, T2, ends=False) -
+                self.cdf(p, t, T1, ends=False))
+
+    def pdf(self, x, p, t, k=None):
+        """
+        Density of the allele frequency 'x' at time 't' starting from 'p'
+        (excluding the point masses at 0 and 1)
+
+        k -- number of series terms (default: the kernel's k).
+             coal.freq_pdf() uses k=8 by default.
+        """
+        if k is None:
+            k = self.k
+        x, p, t = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                      np.asarray(p, dtype=float),
+                                      np.asarray(t, dtype=float))
+
+        # F(1-i, i+2; 2; z) = (P_{i-1}(r) - P_{i+1}(r)) / (2(2i+1) z(1-z))
+        # with r = 1 - 2z, so the hypergeometric terms of coal.freq_pdf()
+        # reduce to differences of Legendre polynomials.
+        i = self._orders[:k]
+        legs_x = legendre_table(1.0 - 2.0 * x, k + 1)
+        legs_p = legendre_table(1.0 - 2.0 * p, k + 1)
+        dx = legs_x[..., :-2] - legs_x[..., 2:]
+        dp = legs_p[..., :-2] - legs_p[..., 2:]
+        decay = np.exp(-np.multiply.outer(t, self._rates[:k]))
+
+        terms = i * (i + 1) / (4.0 * (2 * i + 1)) * dx * dp * decay
+        return terms.sum(axis=-1) / (x * (1.0 - x))
+
+    def sample(self, p, t, rng=np.random, chunksize=1024):
+        """
+        Sample new allele frequencies at time 't' starting from 'p'
+
+        Uses inverse transform sampling.  The interior CDF of every
+        (p, t) pair is evaluated over the kernel's grid with one matrix
+        product and inverted by linear interpolation.
+        """
+        p, t = np.broadcast_arrays(np.asarray(p, dtype=float),
+                                   np.asarray(t, dtype=float))
+        shape = p.shape
+        p = p.ravel()
+        t = t.ravel()
+        y = rng.random_sample(len(p))
+        result = p.copy()
+
+        for start in xrange(0, len(p), chunksize):
+            rows = slice(start, start + chunksize)
+            result[rows] = self._sample_chunk(p[rows], t[rows], y[rows])
+
+        return result.reshape(shape)
+
+    def _sample_chunk(self, p, t, y):
+        """Inverse CDF sampling for one chunk of (p, t) pairs"""
+
+        coeffs = self._coeffs(p, t)
+        extinct = (1.0 - p) - coeffs.sum(axis=-1)
+        fixed = p + np.dot(coeffs, self._signs)
+
+        # interior CDF over the grid, forced to be monotone since the
+        # truncated series may ring for small t
+        cdfs = coeffs.sum(axis=-1)[:, np.newaxis] - np.dot(
+            coeffs, self._grid_legs.T)
+        cdfs = np.maximum.accumulate(cdfs, axis=1)
+
+        target = (y - extinct)[:, np.newaxis]
+        j = (cdfs < target).sum(axis=1)
+        j = np.clip(j, 1, len(self.grid) - 1)
+        rows = np.arange(len(p))
+        c0 = cdfs[rows, j - 1]
+        c1 = cdfs[rows, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.where(c1 > c0, (target[:, 0] - c0) / (c1 - c0), 0.0)
+        x = self.grid[j - 1] + np.clip(frac, 0.0, 1.0) * (
+            self.grid[j] - self.grid[j - 1])
+
+        x = np.where(y < extinct, 0.0, x)
+        x = np.where(y > 1.0 - fixed, 1.0, x)
+
+        # special cases
+        x = np.where((p <= 0.0) | (p >= 1.0) | (t == 0.0), p, x)
+        return x
+
+
+#=============================================================================
+# convenience functions
+
+
+def freq_CDF(p, N, t, T, k=50):
+    """Vectorized version of coal.freq_CDF()"""
+    return FreqKernel(N, k=k, ngrid=2).cdf(p, t, T)
+
+
+def prob_fix(p, N, t, k=50):
+    """Vectorized version of coal.prob_fix()"""
+    return FreqKernel(N, k=k, ngrid=2).prob_fix(p, t)
+
+
+def freq_pdf(x, p, N, t, k=8):
+    """Vectorized version of coal.freq_pdf()"""
+    return FreqKernel(N, k=k, ngrid=2).pdf(x, p, t)
+
+
+def sample_freq_CDF(p, N, t, k=50, rng=np.random):
+    """Vectorized version of coal.sample_freq_CDF()"""
+    return FreqKernel(N, k=k).sample(p, t, rng=rng)
+
+
+#=============================================================================
+
+if __name__ == "__main__":
+    import random
+
+    from rasmus import util
+    from compbio import coal
+
+    #========================
+    # benchmark against coal.py
+
+    N = 1000
+    nloci = 2000
+    p = np.array([random.uniform(.05, .95) for i in xrange(nloci)])
+    t = np.array([random.uniform(10, 500) for i in xrange(nloci)])
+    kernel = FreqKernel(N)
+
+    util.tic("coal.prob_fix (%d loci)" % nloci)
+    for i in xrange(nloci):
+        coal.prob_fix(p[i], N, t[i])
+    util.toc()
+
+    util.tic("FreqKernel.prob_fix (%d loci)" % nloci)
+    kernel.prob_fix(p, t)
+    util.toc()
+
+    util.tic("coal.freq_CDF (%d loci)" % nloci)
+    for i in xrange(nloci):
+        coal.freq_CDF(p[i], N, t[i], .5)
+    util.toc()
+
+    util.tic("FreqKernel.cdf (%d loci)" % nloci)
+    kernel.cdf(p, t, .5)
+    util.toc()
+
+    util.tic("coal.freq_pdf (%d loci)" % nloci)
+    for i in xrange(nloci):
+        coal.freq_pdf(.5, p[i], N, t[i])
+    util.toc()
+
+    util.tic("FreqKernel.pdf (%d loci)" % nloci)
+    kernel.pdf(.5, p, t, k=8)
+    util.toc()
+
+    util.tic("coal.sample_freq_CDF (%d loci)" % (nloci // 10))
+    for i in xrange(nloci // 10):
+        coal.sample_freq_CDF(p[i], N, t[i])
+    util.toc()
+
+    util.tic("FreqKernel.sample (%d loci)" % nloci)
+    kernel.sample(p, t)
+    util.toc()
@@ -23,6 +23,7 @@ from . import fasta
 # rasmus libs
 from rasmus import treelib
 from rasmus import util
+from rasmus.progress import iter_progress
 
 
 #=============================================================================
@@ -2242,27 +2243,50 @@ def make_alignment(arg, mutations, infinite_sites=True,
     return aln
 
 
+def _find_column_split(names, col):
+    # returns (number of characters, split) of a column with mutations
+    chars = util.unique(col)
+    if len(chars) < 2:
+        return len(chars), None
+    part1 = tuple(sorted(names[i] for i, c in enumerate(col)
+                         if c == chars[0]))
+    part2 = tuple(sorted(names[i] for i, c in enumerate(col)
+                         if c != chars[0]))
+    if len(part1) > len(part2):
+        part1, part2 = part2, part1
+    return len(chars), (part1, part2)
+
+
 def iter_align_splits(aln, warn=False):
-    """Iterates through the splits in an alignment"""
-    names = aln.keys()
+    """Iterates through the splits in an alignment
+
+    'aln' is a dict of sequences or a seqarray.SitePatterns.  The split of
+    each distinct column is only found once.
+    """
 
-    for j in xrange(aln.alignlen()):
-        col = [x[j] for x in aln.itervalues()]
-        chars = util.unique(col)
-        if len(chars) > 1:
+    if isinstance(aln, dict):
+        names = aln.keys()
+        seqs = aln.values()
+        ncols = aln.alignlen()
+        cols = (tuple(seq[j] for seq in seqs) for j in xrange(ncols))
+        splits = {}
+    else:
+        # site patterns
+        names = aln.names
+        cols = aln.index
+        splits = dict((i, _find_column_split(names, list(col)))
+                      for i, col in enumerate(aln.patterns.T))
+
+    for j, col in enumerate(cols):
+        nchars, split = splits.get(col, (None, None))
+        if nchars is None:
+            nchars, split = splits[col] = _find_column_split(names, col)
+        if split is not None:
             # column has mutations
             # check bi-allelic
-            if warn and len(chars) != 2:
+            if warn and nchars != 2:
                 print >>sys.stderr, "warning: not bi-allelic (site=%d)" % j
 
-            part1 = tuple(sorted(names[i] for i, c in enumerate(col)
-                                 if c == chars[0]))
-            part2 = tuple(sorted(names[i] for i, c in enumerate(col)
-                                 if c != chars[0]))
-            if len(part1) > len(part2):
-                part1, part2 = part2, part1
-            split = (part1, part2)
-
             yield j, split
 
 
@@ -2389,9 +2413,9 @@ def read_arg(filename, arg=None):
 
 def write_tree_tracks(filename, arg, start=None, end=None, verbose=False):
     out = util.open_stream(filename, "w")
-    for block, tree in iter_local_trees(arg, start, end):
-        if verbose:
-            print >>sys.stderr, "writing block", block
+    for block, tree in iter_progress(iter_local_trees(arg, start, end),
+                                     name="tree tracks", enabled=verbose,
+                                     unit="blocks"):
         remove_single_lineages(tree)
         tree = tree.get_tree()
         out.write(str(int(block[0]))+"\t"+str(int(block[1]))+"\t")
@@ -15,7 +15,21 @@ from . import phylip
 
 
 
-def bionj(aln=None, labels=None, distmat=None, seqtype="pep", verbose=True):
+def bionj(aln=None, labels=None, distmat=None, seqtype="pep", verbose=True,
+          external=True):
+    """
+    Build a BIONJ tree from an alignment or a distance matrix
+
+    If external is False and distmat is given, the tree is built in-process
+    with nj.bionj() instead of the bionj program.
+    """
+
+    if distmat is not None and not external:
+        from . import nj
+        if labels is None:
+            labels = aln.keys()
+        return nj.bionj(distmat, labels)
+
     # make temp files
     distfile = util.tempfile(".", "bionj-in", ".dist")
     treefile = util.tempfile(".", "bionj-out", ".tree")
@@ -0,0 +1,429 @@
+"""
+
+   Batch sampling of multispecies coalescent gene trees
+
+The samplers in coal.py return one treelib.Tree per call and rebuild
+population sizes and species tree ages every time.  Here the species tree
+is laid out once into flat arrays and replicate gene trees are drawn in
+batches, with all coalescent waiting times of a batch drawn at once.
+
+Gene trees are returned in a compact parent array form (GeneTreeBatch),
+which can be converted to newick strings or treelib.Tree objects on demand.
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+from __future__ import division
+
+# python imports
+import random
+from itertools import izip
+from multiprocessing import Pool
+
+# numpy imports
+import numpy as np
+
+# rasmus imports
+from rasmus import treelib
+from rasmus.progress import ProgressMeter
+
+# compbio imports
+from . import coal
+
+
+#=============================================================================
+# gene tree batches
+
+
+class GeneTreeBatch (object):
+    """
+    A batch of gene trees stored as parent arrays
+
+    parents    -- (ntrees, nnodes) array of parent node ids (-1 for the root)
+    ages       -- (ntrees, nnodes) array of node ages
+    recon      -- (ntrees, nnodes) array of species indices (see 'species')
+    leaf_names -- names of the leaves.  Nodes 0..nleaves-1 are leaves and
+                  the remaining nodes are coalescences.  Every coalescence
+                  node has a larger id than its children.
+    species    -- names of the species tree nodes
+    """
+
+    def __init__(self, parents, ages, recon, leaf_names, species):
+        self.parents = parents
+        self.ages = ages
+        self.recon = recon
+        self.leaf_names = leaf_names
+        self.species = species
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __iter__(self):
+        return self.iter_newick()
+
+    def root_ages(self):
+        """Returns an array of the root age of each tree"""
+        return self.ages.max(axis=1)
+
+    def get_newick(self, i):
+        """Returns the i'th tree as a one line newick string"""
+
+        parents = self.parents[i].tolist()
+        ages = self.ages[i].tolist()
+        nleaves = len(self.leaf_names)
+
+        children = [[] for node in parents]
+        root = 0
+        for node, parent in enumerate(parents):
+            if parent == -1:
+                root = node
+            else:
+                children[parent].append(node)
+
+        # children always have smaller ids than their parents
+        strings = list(self.leaf_names) + [None] * (len(parents) - nleaves)
+        for node in xrange(nleaves, len(parents)):
+            age = ages[node]
+            strings[node] = "(" + ",".join(
+                "%s:%f" % (strings[child], age - ages[child])
+                for child in children[node]) + ")"
+
+        return strings[root] + ";"
+
+    def iter_newick(self):
+        """Iterate over the trees of the batch as newick strings"""
+        for i in xrange(len(self)):
+            yield self.get_newick(i)
+
+    def get_tree(self, i, stree=None):
+        """
+        Returns the i'th tree as a tuple (tree, recon)
+
+        If 'stree' is given, recon maps to species tree nodes, otherwise
+        recon maps to species names.
+        """
+
+        parents = self.parents[i].tolist()
+        ages = self.ages[i].tolist()
+        recon = self.recon[i].tolist()
+        nleaves = len(self.leaf_names)
+
+        tree = treelib.Tree()
+        nodes = []
+        for node in xrange(len(parents)):
+            if node < nleaves:
+                nodes.append(tree.add(treelib.TreeNode(self.leaf_names[node])))
+            else:
+                nodes.append(tree.new_node())
+
+        gene_recon = {}
+        for node, parent in enumerate(parents):
+            if parent == -1:
+                tree.root = nodes[node]
+            else:
+                tree.add_child(nodes[parent], nodes[node])
+                nodes[node].dist = ages[parent] - ages[node]
+
+            sp = self.species[recon[node]]
+            gene_recon[nodes[node]] = stree.nodes[sp] if stree else sp
+
+        return tree, gene_recon
+
+    def select(self, rows):
+        """Returns a new batch of the trees selected by 'rows'"""
+        return GeneTreeBatch(self.parents[rows], self.ages[rows],
+                             self.recon[rows], self.leaf_names, self.species)
+
+    @classmethod
+    def concat(cls, batches):
+        """Concatenate several batches into one batch"""
+        batches = list(batches)
+        return cls(np.concatenate([b.parents for b in batches]),
+                   np.concatenate([b.ages for b in batches]),
+                   np.concatenate([b.recon for b in batches]),
+                   batches[0].leaf_names, batches[0].species)
+
+
+#=============================================================================
+# batch sampler
+
+
+class MultiCoalSampler (object):
+    """
+    Sampler of gene trees from a multi-species coalescent process
+
+    stree       -- species tree
+    n           -- population size (int or dict)
+                   If n is a dict it must map from species name to
+                   population size.
+    leaf_counts -- dict of species names to a starting gene count.
+                   Default is 1 gene per extant species.
+    T           -- optional deadline for complete coalescence.  Trees whose
+                   root is older than T are rejected, as in
+                   coal.sample_bounded_multicoal_tree_reject().
+
+    The species tree is stored as flat lists, so samplers are cheap to
+    pickle into worker processes.
+    """
+
+    def __init__(self, stree, n, leaf_counts=None, T=None):
+        snodes = list(stree.postorder())
+        index = dict((snode, i) for i, snode in enumerate(snodes))
+        popsizes = coal.init_popsizes(stree, n)
+        ages = treelib.get_tree_ages(stree)
+
+        if leaf_counts is None:
+            leaf_counts = dict((name, 1) for name in stree.leaf_names())
+
+        self.T = T
+        self.species = [snode.name for snode in snodes]
+        self.children = [[index[child] for child in snode.children]
+                         for snode in snodes]
+        self.popsizes = np.array([float(popsizes[snode.name])
+                                  for snode in snodes])
+        self.ages = np.array([ages[snode] for snode in snodes])
+        self.dists = np.array([snode.dist if snode.parent else np.inf
+                               for snode in snodes])
+
+        # name genes as in coal.sample_multicoal_tree()
+        self.leaf_names = []
+        self.leaf_recon = []
+        self.leaf_genes = []
+        for i, snode in enumerate(snodes):
+            genes = []
+            if snode.is_leaf():
+                for j in xrange(leaf_counts.get(snode.name, 0)):
+                    genes.append(len(self.leaf_names))
+                    self.leaf_names.append("%s_%d" % (snode.name, j + 1))
+                    self.leaf_recon.append(i)
+            self.leaf_genes.append(genes)
+
+    def sample(self, size, rng=np.random):
+        """Returns a GeneTreeBatch of 'size' trees sampled with 'rng'"""
+
+        if self.T is None:
+            counts, ncoals, times = self._sample_times(size, rng)
+            return self._build_trees(ncoals, times, np.arange(size), rng)
+
+        # reject trees that do not coalesce before the deadline
+        batches = []
+        needed = size
+        while needed > 0:
+            counts, ncoals, times = self._sample_times(needed, rng)
+            rows = np.nonzero(self._root_ages(ncoals, times) < self.T)[0]
+            rows = rows[:needed]
+            batches.append(self._build_trees(ncoals, times, rows, rng))
+            needed -= len(rows)
+        return GeneTreeBatch.concat(batches)
+
+    def _sample_times(self, size, rng):
+        """
+        Sample coalescent times for each species branch.
+
+        Waiting times of all replicates are drawn at once per branch.
+        Returns lists (counts, ncoals, times) indexed by species, where
+        counts are the lineages entering the branch, ncoals the number of
+        coalescences on the branch and times the (size, kmax-1) matrix of
+        coalescence ages.
+        """
+
+        nspecies = len(self.species)
+        counts = [None] * nspecies
+        ncoals = [None] * nspecies
+        times = [None] * nspecies
+
+        for i in xrange(nspecies):
+            if self.children[i]:
+                k = sum(counts[c] - ncoals[c] for c in self.children[i])
+            else:
+                k = np.repeat(len(self.leaf_genes[i]), size)
+            kmax = k.max() if size > 0 else 0
+
+            if kmax < 2:
+                t = np.zeros((size, 0))
+                ncoal = np.zeros(size, dtype=int)
+            else:
+                # rates of the j'th coalescence given k starting lineages
+                ks = k[:, np.newaxis] - np.arange(kmax - 1)[np.newaxis, :]
+                rates = np.maximum(ks * (ks - 1), 0) / (2.0 * self.popsizes[i])
+                with np.errstate(divide="ignore"):
+                    t = np.cumsum(
+                        rng.standard_exponential((size, kmax - 1)) / rates,
+                        axis=1)
+                ncoal = (t < self.dists[i]).sum(axis=1)
+                t += self.ages[i]
+
+            counts[i] = k
+            ncoals[i] = ncoal
+            times[i] = t
+
+        return counts, ncoals, times
+
+    def _root_ages(self, ncoals, times):
+        """Returns the age of the last coalescence of each replicate"""
+
+        root_ages = np.zeros(len(ncoals[0]))
+        for ncoal, t in izip(ncoals, times):
+            if t.shape[1] == 0:
+                continue
+            valid = np.arange(t.shape[1])[np.newaxis, :] < ncoal[:, np.newaxis]
+            root_ages = np.maximum(root_ages,
+                                   np.where(valid, t, -np.inf).max(axis=1))
+        return root_ages
+
+    def _build_trees(self, ncoals, times, rows, rng):
+        """Build parent arrays by merging random pairs of lineages"""
+
+        nleaves = len(self.leaf_names)
+        nnodes = max(2 * nleaves - 1, 0)
+        ntrees = len(rows)
+
+        parents = np.empty((ntrees, nnodes), dtype=int)
+        parents.fill(-1)
+        ages = np.zeros((ntrees, nnodes))
+        recon = np.zeros((ntrees, nnodes), dtype=int)
+        recon[:, :nleaves] = self.leaf_recon
+        picks = rng.random_sample((ntrees, max(nleaves - 1, 0), 2)).tolist()
+
+        ncoals = [ncoal.tolist() for ncoal in ncoals]
+
+        for j, r in enumerate(rows):
+            par = parents[j]
+            age = ages[j]
+            rec = recon[j]
+            pick = picks[j]
+            node = nleaves
+            lineages = []
+
+            for i, children in enumerate(self.children):
+                if children:
+                    lins = []
+                    for child in children:
+                        lins.extend(lineages[child])
+                else:
+                    lins = list(self.leaf_genes[i])
+
+                t = times[i][r]
+                for m in xrange(ncoals[i][r]):
+                    # choose a random pair of distinct lineages
+                    k = len(lins)
+                    u, v = pick[node - nleaves]
+                    a = int(u * k)
+                    b = int(v * (k - 1))
+                    if b >= a:
+                        b += 1
+
+                    par[lins[a]] = node
+                    par[lins[b]] = node
+                    age[node] = t[m]
+                    rec[node] = i
+
+                    lins[a] = node
+                    lins[b] = lins[-1]
+                    lins.pop()
+                    node += 1
+
+                lineages.append(lins)
+
+        return GeneTreeBatch(parents, ages, recon,
+                             self.leaf_names, self.species)
+
+    def iter_batches(self, ntrees, seed=None, batchsize=1000, nproc=1,
+                     newick=False, verbose=False):
+        """
+        Iterate over batches of 'ntrees' sampled gene trees.
+
+        Batch i is sampled with its own random state seeded by (seed, i),
+        so results are reproducible for a given seed and batchsize
+        regardless of 'nproc'.  If 'newick' is True, each batch is a list
+        of newick strings formatted by the workers.  If 'verbose' is True,
+        sampling throughput is reported with a ProgressMeter.
+        """
+
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+
+        jobs = [(self, min(batchsize, ntrees - start), seed, i, newick)
+                for i, start in enumerate(xrange(0, ntrees, batchsize))]
+
+        if nproc > 1:
+            pool = Pool(nproc)
+            batches = pool.imap(_sample_batch, jobs)
+        else:
+            pool = None
+            batches = (_sample_batch(job) for job in jobs)
+
+        meter = (ProgressMeter(ntrees, "coalsim", unit="trees")
+                 if verbose else None)
+        try:
+            for batch in batches:
+                yield batch
+                if meter:
+                    meter.update(len(batch))
+            if meter:
+                meter.finish()
+        finally:
+            if pool:
+                pool.terminate()
+
+    def iter_newick(self, ntrees, seed=None, batchsize=1000, nproc=1,
+                    verbose=False):
+        """Iterate over 'ntrees' sampled gene trees as newick strings"""
+        for batch in self.iter_batches(ntrees, seed=seed, batchsize=batchsize,
+                                       nproc=nproc, newick=True,
+                                       verbose=verbose):
+            for newick in batch:
+                yield newick
+
+
+def _sample_batch(args):
+    """Sample one batch of trees (used by worker processes)"""
+    sampler, size, seed, index, newick = args
+    batch = sampler.sample(size, np.random.RandomState([seed, index]))
+    if newick:
+        return list(batch.iter_newick())
+    return batch
+
+
+#=============================================================================
+# convenience functions
+
+
+def sample_multicoal_trees(stree, n, ntrees, leaf_counts=None, T=None,
+                           seed=None, batchsize=1000, nproc=1,
+                           verbose=False):
+    """
+    Returns a GeneTreeBatch of 'ntrees' gene trees from a multi-species
+    coalescent process
+
+    stree       -- species tree
+    n           -- population size (int or dict)
+    ntrees      -- number of replicate gene trees
+    leaf_counts -- dict of species names to a starting gene count.
+                   Default is 1 gene per extant species.
+    T           -- optional deadline for complete coalescence
+    seed        -- random seed for reproducible sampling
+    nproc       -- number of worker processes
+    verbose     -- report sampling throughput
+    """
+    sampler = MultiCoalSampler(stree, n, leaf_counts=leaf_counts, T=T)
+    return GeneTreeBatch.concat(sampler.iter_batches(
+        ntrees, seed=seed, batchsize=batchsize, nproc=nproc,
+        verbose=verbose))
+
+
+def write_multicoal_trees(out, stree, n, ntrees, leaf_counts=None, T=None,
+                          seed=None, batchsize=1000, nproc=1, verbose=False):
+    """
+    Write 'ntrees' gene trees from a multi-species coalescent process as
+    newick strings to stream 'out', one per line
+    """
+    sampler = MultiCoalSampler(stree, n, leaf_counts=leaf_counts, T=T)
+    for newick in sampler.iter_newick(ntrees, seed=seed, batchsize=batchsize,
+                                      nproc=nproc, verbose=verbose):
+        out.write(newick)
+        out.write("\n")
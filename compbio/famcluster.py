@@ -0,0 +1,414 @@
+"""
+
+   Streaming gene family clustering over a species tree
+
+genecluster.mergeTree() merges gene partitions up a species tree using
+BLAST hits, but it re-reads every BLAST file at each merge and keeps
+dict-of-dict score tables for all partition pairs in memory.
+
+Here every m8 file is read once.  A hit between genomes A and B is only
+needed by lca(A, B), where it scores the two sides being merged, and by
+the two children of lca(A, B), where it is an outgroup hit.  So each
+passing hit is stored in a compact bucket for its lca node (gene ids as
+int32, scores as float32) and buckets spill to disk whenever the memory
+budget is exceeded.  Merges then aggregate each bucket by partition pair
+with numpy and run in parallel over species tree nodes whose children
+are done.  The merge rule is that of genecluster.mergeAvg().
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+from __future__ import division
+
+# python imports
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from multiprocessing import Pool
+
+# numpy imports
+import numpy as np
+
+# rasmus imports
+from rasmus import tablelib
+from rasmus import treelib
+from rasmus import util
+
+
+#=============================================================================
+# hit buckets
+
+
+class HitBuckets (object):
+    """
+    Compact storage of BLAST hits grouped by species tree node
+
+    Each hit is a gene id pair, a bit score and a flag for whether it
+    passed the hit cutoffs.  Hits are kept in typed arrays and are
+    appended to per-node files in 'tmpdir' when more than 'maxmem' bytes
+    are buffered.
+    """
+
+    HIT_BYTES = 4 + 4 + 4 + 1
+
+    def __init__(self, tmpdir, maxmem=500e6):
+        self.tmpdir = tmpdir
+        self.maxmem = maxmem
+        self.buckets = {}
+        self.spilled = set()
+        self.nhits = 0
+
+    def get(self, name):
+        """Returns the arrays (gene1, gene2, score, passed) of a bucket"""
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            bucket = self.buckets[name] = (
+                array("i"), array("i"), array("f"), array("b"))
+        return bucket
+
+    def nbytes(self):
+        return self.nhits * self.HIT_BYTES
+
+    def check_memory(self, nhits):
+        """Record 'nhits' new hits and spill buckets if over budget"""
+        self.nhits += nhits
+        if self.nbytes() > self.maxmem:
+            self.spill()
+
+    def get_filename(self, name, field):
+        return os.path.join(self.tmpdir, "%s.%s" % (name, field))
+
+    def spill(self):
+        """Append all buffered hits to disk"""
+        if not os.path.exists(self.tmpdir):
+            os.makedirs(self.tmpdir)
+        for name, bucket in self.buckets.iteritems():
+            for field, data in zip(("gene1", "gene2", "score", "passed"),
+                                   bucket):
+                out = open(self.get_filename(name, field), "ab")
+                data.tofile(out)
+                out.close()
+            self.spilled.add(name)
+        self.buckets = {}
+        self.nhits = 0
+
+    def load(self, name):
+        """Returns the hits of a bucket as numpy arrays"""
+        dtypes = (np.int32, np.int32, np.float32, np.int8)
+        fields = []
+        bucket = self.buckets.get(name)
+        for i, (field, dtype) in enumerate(zip(
+                ("gene1", "gene2", "score", "passed"), dtypes)):
+            parts = []
+            if name in self.spilled:
+                parts.append(np.fromfile(self.get_filename(name, field),
+                                         dtype=dtype))
+            if bucket is not None:
+                parts.append(np.frombuffer(bucket[i], dtype=dtype))
+            if len(parts) == 0:
+                parts.append(np.zeros(0, dtype=dtype))
+            fields.append(np.concatenate(parts))
+        gene1, gene2, score, passed = fields
+        return gene1, gene2, score, passed.astype(bool)
+
+
+#=============================================================================
+# reading hits
+
+
+def blastfile_genomes(filename):
+    """Returns the genomes (genome1, genome2) of a file 'genome1_genome2.*'"""
+    m = re.match(r"(|.*/)(?P<genome1>[^/_]+)_(?P<genome2>[^/\.]+)\.[\/]*",
+                 filename)
+    if m is None:
+        raise Exception("cannot determine genomes of '%s'" % filename)
+    return m.group("genome1"), m.group("genome2")
+
+
+def read_hits(conf, genes, geneids, stree, blastfiles, buckets,
+              chunksize=100000):
+    """
+    Read m8 files once and store their hits by the lca of their genomes
+
+    In the bucket of node 'node', gene1 is always from the subtree of
+    node.children[0].  Hits are flagged as passed if they pass the
+    cutoffs of genecluster.mergeAvg().
+    """
+
+    accept = conf.get("accept", False)
+    bitspersite = conf["bitspersite"]
+    coveragesmall = conf["coveragesmall"]
+    coveragebig = conf["coveragebig"]
+    signif = conf["signif"]
+
+    for blastfile in blastfiles:
+        genome1, genome2 = blastfile_genomes(os.path.basename(blastfile))
+        if genome1 == genome2:
+            continue
+        snode = treelib.lca([stree.nodes[genome1], stree.nodes[genome2]])
+        flip = genome1 not in snode.children[0].leaf_names()
+        bgene1, bgene2, bscore, bpassed = buckets.get(snode.name)
+        nhits = 0
+
+        util.tic("read hits '%s'" % os.path.basename(blastfile))
+        for line in util.open_stream(blastfile):
+            if line[0] in "#\n":
+                continue
+            hit = line.rstrip("\n").split("\t")
+            if flip:
+                gene1, gene2 = hit[1], hit[0]
+                alnlen1 = int(hit[9]) - int(hit[8])
+                alnlen2 = int(hit[7]) - int(hit[6])
+            else:
+                gene1, gene2 = hit[0], hit[1]
+                alnlen1 = int(hit[7]) - int(hit[6])
+                alnlen2 = int(hit[9]) - int(hit[8])
+            score = float(hit[11])
+
+            cov1 = alnlen1 / float(genes[gene1]["length"])
+            cov2 = alnlen2 / float(genes[gene2]["length"])
+            passed = not (
+                score / float(hit[3]) < bitspersite or
+                min(cov1, cov2) < coveragesmall or
+                max(cov1, cov2) < coveragebig or
+                float(hit[10]) > signif or
+                (accept and (gene1 not in accept or gene2 not in accept)))
+
+            bgene1.append(geneids[gene1])
+            bgene2.append(geneids[gene2])
+            bscore.append(score)
+            bpassed.append(passed)
+            nhits += 1
+
+            if nhits == chunksize:
+                # buckets may be spilled, so fetch their arrays again
+                buckets.check_memory(nhits)
+                bgene1, bgene2, bscore, bpassed = buckets.get(snode.name)
+                nhits = 0
+        util.toc()
+
+        buckets.check_memory(nhits)
+
+
+#=============================================================================
+# merging partitions
+
+
+def find_roots(parent, i):
+    """Find the root of item i in an array-based union-find"""
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def merge_parts(parts1, parts2, hits, outhits, ngenes):
+    """
+    Merge two partitions of gene ids by average hit score
+
+    parts1, parts2 -- lists of gene id lists for each side of the merge
+    hits           -- (gene1, gene2, score, passed) between the two sides
+    outhits        -- (ingene, score) from either side to the outgroup
+
+    Every partition is joined with the partition of the other side that
+    has the best average score, if that score is better than both of
+    their average outgroup scores (as in genecluster.mergeAvg()).
+    Returns the merged partition.
+    """
+
+    gene1, gene2, score, passed = hits
+    gene1 = gene1[passed]
+    gene2 = gene2[passed]
+    score = score[passed].astype(float)
+
+    # lookup partition of each gene, adding singletons for new genes
+    lookups = []
+    parts = []
+    for side, sidegenes in ((parts1, gene1), (parts2, gene2)):
+        side = list(side)
+        lookup = np.empty(ngenes, dtype=np.int64)
+        lookup.fill(-1)
+        for i, part in enumerate(side):
+            lookup[part] = i
+        for gene in np.unique(sidegenes[lookup[sidegenes] == -1]):
+            lookup[gene] = len(side)
+            side.append([gene])
+        lookups.append(lookup)
+        parts.append(side)
+    n1, n2 = len(parts[0]), len(parts[1])
+
+    # average score of each partition pair
+    part1 = lookups[0][gene1]
+    part2 = lookups[1][gene2]
+    keys, inv = np.unique(part1 * n2 + part2, return_inverse=True)
+    avg = (np.bincount(inv, weights=score, minlength=len(keys)) /
+           np.bincount(inv, minlength=len(keys)))
+    part1 = keys // n2
+    part2 = keys % n2
+
+    # average outgroup score of each partition
+    outavgs = []
+    ingene, outscore = outhits
+    outscore = outscore.astype(float)
+    for lookup, n in zip(lookups, (n1, n2)):
+        inpart = lookup[ingene]
+        found = inpart != -1
+        total = np.bincount(inpart[found], weights=outscore[found],
+                            minlength=n)
+        count = np.bincount(inpart[found], minlength=n)
+        outavgs.append(total / np.maximum(count, 1))
+
+    # join each partition with its best partner
+    valid = ((avg > outavgs[0][part1]) & (avg > outavgs[1][part2]) &
+             (avg > 0))
+    part1, part2, avg = part1[valid], part2[valid], avg[valid]
+
+    parent = range(n1 + n2)
+    for mine, other, offset in ((part1, part2 + n1, 0),
+                                (part2 + n1, part1, n1)):
+        order = np.lexsort((-avg, mine))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = mine[order][1:] != mine[order][:-1]
+        for i in order[first]:
+            a = find_roots(parent, mine[i])
+            b = find_roots(parent, other[i])
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    # collect merged partitions in order of their first member
+    merged = {}
+    order = []
+    allparts = parts[0] + parts[1]
+    for i in xrange(n1 + n2):
+        root = find_roots(parent, i)
+        if root not in merged:
+            merged[root] = []
+            order.append(root)
+        merged[root].extend(allparts[i])
+    return [map(int, merged[x]) for x in order]
+
+
+def _merge_node(args):
+    """Merge the partitions of the children of a species tree node"""
+    name, parts1, parts2, buckets, outgroup, ngenes = args
+
+    hits = buckets.load(name)
+    if outgroup is not None:
+        parentname, side = outgroup
+        gene1, gene2, score, passed = buckets.load(parentname)
+        outhits = ((gene1 if side == 0 else gene2), score)
+    else:
+        outhits = (np.zeros(0, dtype=np.int32), np.zeros(0))
+
+    return name, merge_parts(parts1, parts2, hits, outhits, ngenes)
+
+
+def cluster_families(conf, genes, stree, blastfiles, nproc=1,
+                     tmpdir=None, maxmem=500e6, outprefix=None):
+    """
+    Cluster genes into families up a species tree
+
+    conf       -- cutoffs of genecluster.mergeAvg() ('bitspersite',
+                  'coveragesmall', 'coveragebig', 'signif' and optional
+                  'accept')
+    genes      -- dict from gene name to gene info with key 'length'
+    stree      -- binary species tree
+    blastfiles -- m8 files named 'genome1_genome2.*' (query in genome1)
+    nproc      -- number of processes for merging
+    tmpdir     -- directory for spilled hits (default: a new temp dir)
+    maxmem     -- memory budget for buffered hits in bytes
+    outprefix  -- if given, write the partition of each node to
+                  '<outprefix><node name>.part'
+
+    Returns the partition at the root as a list of gene name lists.
+    """
+
+    genenames = list(genes)
+    geneids = dict((gene, i) for i, gene in enumerate(genenames))
+
+    cleantmp = tmpdir is None
+    if tmpdir is None:
+        tmpdir = tempfile.mkdtemp(prefix="famcluster-")
+    buckets = HitBuckets(tmpdir, maxmem)
+
+    try:
+        util.tic("read hits")
+        read_hits(conf, genes, geneids, stree, blastfiles, buckets)
+        util.toc()
+
+        # workers read hits from disk
+        if nproc > 1:
+            buckets.spill()
+            pool = Pool(nproc)
+            mapfunc = pool.map
+        else:
+            pool = None
+            mapfunc = map
+
+        # merge nodes whose children are done
+        util.tic("merge partitions")
+        parts = dict((node, []) for node in stree.leaves())
+        ready = [node for node in stree
+                 if not node.is_leaf() and
+                 all(child.is_leaf() for child in node.children)]
+        while len(ready) > 0:
+            jobs = []
+            for node in ready:
+                if node.parent:
+                    side = node.parent.children.index(node)
+                    outgroup = (node.parent.name, side)
+                else:
+                    outgroup = None
+                jobs.append((node.name, parts[node.children[0]],
+                             parts[node.children[1]], buckets, outgroup,
+                             len(genenames)))
+
+            for name, nodeparts in mapfunc(_merge_node, jobs):
+                node = stree.nodes[name]
+                parts[node] = nodeparts
+                util.logger("merged node %s: %d parts" %
+                            (name, len(nodeparts)))
+                if outprefix is not None and len(nodeparts) > 0:
+                    util.write_delim(
+                        outprefix + str(name) + ".part",
+                        [[genenames[i] for i in part] for part in nodeparts])
+
+            ready = [x.parent for x in ready
+                     if x.parent and x.parent not in parts and
+                     all(child in parts for child in x.parent.children)]
+            ready = list(util.unique(ready))
+        util.toc()
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    finally:
+        if cleantmp:
+            shutil.rmtree(tmpdir)
+
+    return [[genenames[i] for i in part] for part in parts[stree.root]]
+
+
+#=============================================================================
+# output
+
+
+def make_famtab(parts, famid=0):
+    """Make a family table (same format as genecluster.makeFamtab())"""
+    famtab = tablelib.Table(headers=["famid", "genes"])
+    for i, part in enumerate(parts):
+        famtab.add(famid=str(famid + i), genes=",".join(part))
+    return famtab
+
+
+def write_famtab(filename, parts, famid=0):
+    make_famtab(parts, famid).write(filename)
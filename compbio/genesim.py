@@ -0,0 +1,416 @@
+"""
+
+   Bulk simulation of gene families under duplication, loss, transfer
+   and recombination (DLTR)
+
+phylo.sample_dltr_gene_tree() recomputes species tree ages and scans every
+species branch for each transfer.  Here a SpeciesTimeline is computed once
+per species tree and shared by every simulated family.  Families are
+simulated in a process pool, each with its own deterministic seed, and
+their trees, reconciliations and events are streamed to output files in
+family order.
+
+With transrate = recombrate = 0 the process is the duplication-loss
+birth-death process of birthdeath.sample_birth_death_gene_tree().
+
+"""
+
+#=============================================================================
+# imports
+
+# python imports
+import os
+import random
+from collections import OrderedDict
+from multiprocessing import Pool
+from StringIO import StringIO
+
+# rasmus imports
+from rasmus import treelib
+from rasmus import util
+
+# compbio imports
+from . import phylo
+
+
+#=============================================================================
+# species tree precomputation
+
+
+class SpeciesTimeline (object):
+    """
+    Precomputed ages and time slices of a species tree
+
+    spec_times -- speciation ages from oldest to youngest, ending with 0.0
+    alive      -- alive[i] is the list of species branches that span the
+                  time slice between spec_times[i-1] and spec_times[i]
+    """
+
+    def __init__(self, stree):
+        self.stree = stree
+        self.stimes = treelib.get_tree_ages(stree)
+        self.spec_times = sorted(set(x for x in self.stimes.itervalues()
+                                     if x > 0.0), reverse=True)
+        self.spec_times.append(0.0)
+
+        self.alive = [[]]
+        for i in xrange(1, len(self.spec_times)):
+            top = self.spec_times[i-1]
+            bottom = self.spec_times[i]
+            self.alive.append([
+                snode for snode in stree
+                if self.stimes[snode] <= bottom and
+                self.stimes[snode] + snode.dist >= top])
+
+
+#=============================================================================
+# gene tree simulation
+
+
+def sample_dltr_gene_tree(timeline, duprate, lossrate, transrate, recombrate,
+                          genename=lambda sp, x: sp + "_" + str(x),
+                          removeloss=True, rng=random):
+    """
+    Simulate a gene tree within a species tree with dup, loss, transfer and
+    recombination
+
+    Same process as phylo.sample_dltr_gene_tree(), but uses a precomputed
+    SpeciesTimeline and draws random numbers from 'rng'.
+
+    Returns (tree, brecon, doomed), where doomed is the number of nodes
+    removed with lost lineages.
+    """
+
+    stree = timeline.stree
+    stimes = timeline.stimes
+    spec_times = timeline.spec_times
+
+    # initialize gene tree
+    tree = treelib.Tree()
+    tree.make_root()
+    times = {tree.root: stimes[stree.root]}
+    brecon = {tree.root: [(stree.root, "spec")]}
+
+    totalrate = duprate + lossrate + transrate + recombrate
+    cumrates = [duprate, duprate + lossrate,
+                duprate + lossrate + transrate]
+
+    # lineages are (node, snode) pairs in a list for O(1) random choice
+    lineages = [(tree.root, schild) for schild in stree.root.children]
+    age = stimes[stree.root]
+    i = 1
+
+    def new_child(node, snode, event):
+        child = tree.add_child(node, tree.new_node())
+        child.dist = times[node] - age
+        times[child] = age
+        brecon[child] = [(snode, event)]
+        return child
+
+    def remove_lineage(j):
+        lineages[j] = lineages[-1]
+        lineages.pop()
+
+    while len(lineages) > 0:
+        if totalrate > 0.0:
+            age -= rng.expovariate(totalrate * len(lineages))
+        else:
+            age = 0.0
+
+        if age <= spec_times[i]:
+            age = spec_times[i]
+            if age == 0.0:
+                # create leaves
+                for node, snode in lineages:
+                    child = new_child(node, snode, "gene")
+                    tree.rename(child.name, genename(snode.name, child.name))
+                break
+            else:
+                # speciation
+                i += 1
+                lineages2 = []
+                for node, snode in lineages:
+                    if stimes[snode] == age:
+                        child = new_child(node, snode, "spec")
+                        for schild in snode.children:
+                            lineages2.append((child, schild))
+                    else:
+                        lineages2.append((node, snode))
+                lineages = lineages2
+                continue
+
+        # choose event type and lineage
+        j = rng.randrange(len(lineages))
+        node, snode = lineages[j]
+        pick = rng.random() * totalrate
+
+        if pick < cumrates[0]:
+            # duplication
+            child = new_child(node, snode, "dup")
+            remove_lineage(j)
+            lineages.append((child, snode))
+            lineages.append((child, snode))
+
+        elif pick < cumrates[1]:
+            # loss
+            new_child(node, snode, "loss")
+            remove_lineage(j)
+
+        else:
+            # transfer or recombination: choose destination species
+            others = [snode2 for snode2 in timeline.alive[i]
+                      if snode2 != snode]
+            if len(others) == 0:
+                continue
+            dest = others[rng.randrange(len(others))]
+
+            if pick >= cumrates[2]:
+                # recombination: find gene to replace
+                genes = [k for k, (node2, snode2) in enumerate(lineages)
+                         if snode2 == dest]
+                if len(genes) == 0:
+                    # nothing to replace, no recombination
+                    continue
+                k = genes[rng.randrange(len(genes))]
+                gene_node, gene_snode = lineages[k]
+
+                # mark gene as loss
+                new_child(gene_node, gene_snode, "loss")
+                remove_lineage(k)
+                if j == len(lineages):
+                    j = k
+
+            # make transfer node
+            child = new_child(node, snode, "trans")
+            remove_lineage(j)
+            lineages.append((child, dest))
+            lineages.append((child, snode))
+
+    doomed = 0
+    if removeloss:
+        keep = [x for x in tree.leaves() if isinstance(x.name, str)]
+        doomed = phylo.subtree_brecon_by_leaves(tree, brecon, keep)
+
+    return tree, brecon, doomed
+
+
+def rename_nodes_preorder(tree):
+    """Rename internal nodes by preorder traversal"""
+
+    internals = [node for node in tree.preorder() if not node.is_leaf()]
+
+    # rename all nodes to something else
+    for node in internals:
+        tree.rename(node.name, "__rename__" + str(node.name))
+
+    for name, node in enumerate(internals):
+        tree.rename(node.name, name + 1)
+
+
+#=============================================================================
+# gene families
+
+
+def simulate_family(timeline, famid, seed, duprate, lossrate,
+                    transrate=0.0, recombrate=0.0, subrate=1.0,
+                    minsize=4, maxsize=util.INF,
+                    genelen=0, bgfreq=(.25, .25, .25, .25), kappa=1.0,
+                    gene2species=lambda gene: gene.split("_")[0]):
+    """
+    Simulate one gene family and return its output files as strings
+
+    The family is simulated with a random state seeded by (seed, famid), so
+    results do not depend on which process simulates the family.
+
+    Returns a dict with keys 'newick' (one line newick), 'tree',
+    'times.tree', 'recon', 'brecon', 'events', 'info' and, if genelen > 0,
+    'align' (FASTA).
+    """
+
+    rng = random.Random((seed, famid))
+    stree = timeline.stree
+    info = StringIO()
+
+    while True:
+        tree, brecon, doomed = sample_dltr_gene_tree(
+            timeline, duprate, lossrate, transrate, recombrate,
+            removeloss=False, rng=rng)
+        pretree = tree.copy()
+
+        # trim brecon structure to only remaining nodes
+        keep = [x for x in tree.leaves() if isinstance(x.name, str)]
+        doomed = phylo.subtree_brecon_by_leaves(tree, brecon, keep)
+
+        # try again if there is total extinction
+        if not (minsize <= len(tree.leaves()) <= maxsize):
+            info.write("tree wrong size. size: %d\n" % len(tree.nodes))
+            if len(tree.nodes) == 0:
+                info.write("extinction\n")
+        else:
+            break
+
+    # apply substitution rates
+    for node in tree:
+        if node != tree.root:
+            node.dist *= subrate
+
+    info.write("doomed: %d\n" % doomed)
+    recon, events = phylo.brecon2recon_events(brecon)
+    recon2 = phylo.reconcile(tree, stree, gene2species)
+    info.write("parsimonious reconciliation: %s\n" % str(recon2 == recon))
+
+    # rename doomed leaves
+    for node in pretree.leaves():
+        if isinstance(node.name, int):
+            pretree.rename(node.name, "doom_%d" % node.name)
+
+    rename_nodes_preorder(tree)
+
+    # order records by preorder so that output is reproducible
+    order = list(tree.preorder())
+    brecon = OrderedDict((node, brecon[node]) for node in order)
+    recon = OrderedDict((node, recon[node]) for node in order)
+
+    outputs = {"info": info.getvalue(),
+               "newick": tree.get_one_line_newick()}
+
+    out = StringIO()
+    tree.write(out)
+    outputs["tree"] = out.getvalue()
+
+    out = StringIO()
+    pretree.write(out)
+    outputs["times.tree"] = out.getvalue()
+
+    out = StringIO()
+    phylo.write_recon_events(out, recon, events)
+    outputs["recon"] = out.getvalue()
+
+    out = StringIO()
+    phylo.write_brecon(out, brecon)
+    outputs["brecon"] = out.getvalue()
+
+    out = StringIO()
+    phylo.write_bevents(out, phylo.find_bevents(brecon))
+    outputs["events"] = out.getvalue()
+
+    if genelen > 0:
+        import numpy as np
+        from . import seqsim
+
+        def matrix_func(t):
+            return phylo.make_hky_matrix(t, bgfreq=bgfreq, kappa=kappa)
+
+        align = seqsim.sim_seq_tree(
+            tree, genelen, matrix_func=matrix_func, bgfreq=bgfreq,
+            rng=np.random.RandomState([seed % 2**32, famid % 2**32]))
+        out = StringIO()
+        align.write_fasta(out)
+        outputs["align"] = out.getvalue()
+
+    return outputs
+
+
+# per-process state of the worker pool
+_timeline = None
+_params = None
+
+
+def _init_worker(timeline, params):
+    global _timeline, _params
+    _timeline = timeline
+    _params = params
+
+
+def _simulate_job(args):
+    famid, seed = args
+    return famid, simulate_family(_timeline, famid, seed, **_params)
+
+
+def iter_families(stree, famids, seed=None, nproc=1, **params):
+    """
+    Simulate gene families and iterate over (famid, outputs) in order
+
+    stree  -- species tree
+    famids -- family ids (ints), used with 'seed' to seed each family
+    seed   -- random seed for reproducible simulation
+    nproc  -- number of worker processes
+    params -- parameters of simulate_family()
+    """
+
+    if seed is None:
+        seed = random.randint(0, 2**31 - 1)
+    timeline = SpeciesTimeline(stree)
+    jobs = [(famid, seed) for famid in famids]
+
+    if nproc > 1:
+        pool = Pool(nproc, _init_worker, (timeline, params))
+        try:
+            for result in pool.imap(_simulate_job, jobs, chunksize=16):
+                yield result
+        finally:
+            pool.terminate()
+    else:
+        for famid, seed in jobs:
+            yield famid, simulate_family(timeline, famid, seed, **params)
+
+
+#=============================================================================
+# output
+
+
+def write_family_dirs(outdir, families, exts, nodir=False):
+    """
+    Write each gene family into its own files
+
+    outdir   -- output directory
+    families -- iterator of (famid, outputs) from iter_families()
+    exts     -- dict from output kind to file extension, or to a list of
+                extensions to write the output to several files
+                (e.g. {'tree': '.tree', 'align': ['.align', '.fasta']})
+    nodir    -- if True, do not create a sub-directory per family
+    """
+
+    for famid, outputs in families:
+        dirname = outdir if nodir else os.path.join(outdir, str(famid))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        prefix = os.path.join(dirname, str(famid))
+
+        for kind, kind_exts in exts.iteritems():
+            if kind not in outputs:
+                continue
+            if isinstance(kind_exts, basestring):
+                kind_exts = [kind_exts]
+            for ext in kind_exts:
+                out = open(prefix + ext, "w")
+                out.write(outputs[kind])
+                out.close()
+
+
+def write_family_streams(prefix, families, kinds=("recon", "events")):
+    """
+    Stream gene families into one set of files
+
+    prefix.trees  -- famid and one line newick per family
+    prefix.<kind> -- the lines of each output 'kind' prefixed with famid
+
+    Returns the number of families written.
+    """
+
+    trees_out = open(prefix + ".trees", "w")
+    outs = dict((kind, open(prefix + "." + kind, "w")) for kind in kinds)
+    count = 0
+
+    for famid, outputs in families:
+        famid = str(famid)
+        trees_out.write(famid + "\t" + outputs["newick"] + "\n")
+        for kind, out in outs.iteritems():
+            for line in outputs[kind].splitlines():
+                out.write(famid + "\t" + line + "\n")
+        count += 1
+
+    trees_out.close()
+    for out in outs.itervalues():
+        out.close()
+    return count
@@ -1,6 +1,10 @@
-import os, StringIO
+import os
+import re
+import StringIO
 from itertools import chain
+from multiprocessing import Pool
 
+from rasmus import stats
 from rasmus import util
 from rasmus import treelib
 from . import fasta
@@ -258,30 +262,258 @@ def readNexusConTree(infile):
 
  
 
-def read_nexus_trees(infile):
+def read_nexus_trees(infile, burnin=0, thin=1):
     """Iterate over trees from trees run file"""
-    
-    infile = iter(infile)
+    return NexusTreeReader(infile, burnin=burnin, thin=thin).iter_trees()
 
-    # skip until translate
-    for line in infile:
-        if "translate" in line:
-            break
 
-    # read translate
-    names = {}
-    for line in infile:
-        if "tree rep" in line:
-            break
-        num, name = line.strip().replace(",", "").replace(";", "").split()
-        names[num] = name
-
-    # read trees
-    for line in chain([line], infile):
-        if "tree rep" not in line:
-            break
-
-        tree = treelib.parse_newick(line.split("=")[1])
-        for oldname in tree.leaf_names():
-            tree.rename(oldname, names[oldname])
-        yield tree
+#=============================================================================
+# streaming tree samples
+#
+# Trees sampled by MrBayes ('.t' files) are read one line at a time.
+# Burn-in and thinning are applied to the lines before any tree is parsed,
+# and taxon numbers are translated with a table built once per file.
+
+
+# tokens of a newick string: brackets, commas, comments, branch lengths and
+# names
+_NEWICK_TOKENS = re.compile(r"[(),]|\[[^\]]*\]|:[^(),;\[]*|[^(),:;\[\s]+")
+
+# a taxon number at a leaf
+_TAXON_NUMBER = re.compile(r"(?<=[(,])\s*(\d+)(?=\s*[:,)\[])")
+
+# a leaf name
+_LEAF_NAME = re.compile(r"(?<=[(,])\s*([^(),:;\[\s]+)")
+
+
+class NexusTreeReader (object):
+    """
+    Streaming reader of the trees sampled in a MrBayes '.t' file
+
+    infile -- filename or stream of lines
+    burnin -- number of samples to discard, or the fraction of samples to
+              discard if less than one (requires a filename)
+    thin   -- keep every 'thin'-th sample after burn-in
+    genstep -- keep only samples whose generation is a multiple of 'genstep'
+
+    Samples can be read as trees, newick strings or sets of splits (see
+    iter_trees(), iter_newick() and iter_splits()).  A reader can only be
+    iterated once.
+    """
+
+    def __init__(self, infile, burnin=0, thin=1, genstep=None):
+        if 0 < burnin < 1:
+            if not isinstance(infile, basestring):
+                raise Exception("fractional burn-in requires a filename")
+            burnin = int(burnin * count_nexus_trees(infile))
+        self.burnin = burnin
+        self.thin = thin
+        self.genstep = genstep
+
+        if isinstance(infile, basestring):
+            infile = util.open_stream(infile)
+        self.infile = iter(infile)
+        self.translate = {}
+        self.names = []
+        self._first = self._read_header()
+
+        # taxa are numbered in the order of the translate table
+        nums = sorted(self.translate, key=int)
+        self.names = [self.translate[num] for num in nums]
+        self._bits = dict((num, 1 << i) for i, num in enumerate(nums))
+
+    def _read_header(self):
+        """Read the translate table and return the first tree line"""
+        for line in self.infile:
+            token = line.strip().lower()
+            if token.startswith("tree "):
+                return line
+            if token.startswith("translate"):
+                break
+        else:
+            return None
+
+        for line in self.infile:
+            token = line.strip()
+            if token.lower().startswith("tree "):
+                return line
+            token = token.rstrip(",;")
+            if token:
+                num, name = token.split(None, 1)
+                self.translate[num] = name.strip("'")
+        return None
+
+    def iter_lines(self):
+        """Yields (generation, newick) with taxon numbers untranslated"""
+        if self._first is None:
+            return
+        lines = chain([self._first], self.infile)
+        self._first = None
+
+        i = 0
+        for line in lines:
+            token = line.lstrip()
+            if not token[:5].lower() == "tree ":
+                if token.lower().startswith("end"):
+                    break
+                continue
+            label, newick = token.split("=", 1)
+            gen = int(label.rsplit(".", 1)[1]) if "." in label else i
+            i += 1
+
+            # apply burn-in and thinning before parsing
+            if i <= self.burnin or (i - self.burnin - 1) % self.thin != 0:
+                continue
+            if self.genstep and gen % self.genstep != 0:
+                continue
+
+            # skip comments such as [&U] before the tree
+            yield gen, newick[newick.index("("):].strip()
+
+    def translate_newick(self, newick):
+        """Returns a newick string with taxon numbers replaced by names"""
+        if not self.translate:
+            return newick
+        translate = self.translate
+        return _TAXON_NUMBER.sub(lambda m: translate[m.group(1)], newick)
+
+    def iter_newick(self):
+        """Yields translated newick strings"""
+        for gen, newick in self.iter_lines():
+            yield self.translate_newick(newick)
+
+    def iter_trees(self):
+        """Yields trees"""
+        for gen, newick in self.iter_lines():
+            tree = treelib.parse_newick(newick)
+            if self.translate:
+                for oldname in tree.leaf_names():
+                    tree.rename(oldname, self.translate[oldname])
+            yield tree
+
+    def iter_splits(self):
+        """
+        Yields the unrooted splits of each tree as a set of bitsets
+
+        Bit i of a split is set for the i-th taxon of 'names'.  Splits are
+        oriented so that they exclude the first taxon (see split_names()).
+        """
+        for gen, newick in self.iter_lines():
+            yield self.get_splits(newick)
+
+    def get_splits(self, newick):
+        """Returns the unrooted splits of an untranslated newick string"""
+        bits = self._bits
+        if not bits:
+            # no translate table: number taxa by the names of the first tree
+            names = sorted(_LEAF_NAME.findall(newick))
+            self.names = names
+            bits = self._bits = dict((name, 1 << i)
+                                     for i, name in enumerate(names))
+        ntaxa = len(bits)
+        full = (1 << ntaxa) - 1
+
+        splits = set()
+        stack = []
+        prev = None
+        for token in _NEWICK_TOKENS.findall(newick):
+            if token == "(":
+                stack.append(0)
+            elif token == ")":
+                mask = stack.pop()
+                if stack:
+                    stack[-1] |= mask
+                if mask & 1:
+                    mask ^= full
+                if 1 < bin(mask).count("1") < ntaxa - 1:
+                    splits.add(mask)
+            elif token == "," or token[0] in ":[":
+                pass
+            elif prev != ")":
+                stack[-1] |= bits[token]
+            if token[0] not in ":[":
+                prev = token
+        return splits
+
+    def split_names(self, split):
+        """Returns the names of the taxa in a split"""
+        return tuple(name for i, name in enumerate(self.names)
+                     if split >> i & 1)
+
+
+def count_nexus_trees(filename):
+    """Returns the number of trees in a MrBayes '.t' file"""
+    count = 0
+    for line in util.open_stream(filename):
+        if line.lstrip()[:5].lower() == "tree ":
+            count += 1
+    return count
+
+
+def _count_splits(args):
+    filename, burnin, thin = args
+    reader = NexusTreeReader(filename, burnin=burnin, thin=thin)
+    counts = {}
+    ntrees = 0
+    for splits in reader.iter_splits():
+        ntrees += 1
+        for split in splits:
+            counts[split] = counts.get(split, 0) + 1
+    return reader.names, counts, ntrees
+
+
+def split_frequencies(filenames, burnin=0, thin=1, nproc=1):
+    """
+    Returns the split frequencies of several MrBayes runs
+
+    Runs are read concurrently in 'nproc' processes.  Returns a list with a
+    dict for each run from splits (tuples of taxon names) to the fraction
+    of trees containing them.
+    """
+
+    jobs = [(filename, burnin, thin) for filename in filenames]
+    if nproc > 1 and len(jobs) > 1:
+        pool = Pool(min(nproc, len(jobs)))
+        try:
+            results = pool.map(_count_splits, jobs)
+        finally:
+            pool.terminate()
+    else:
+        results = map(_count_splits, jobs)
+
+    # runs may number taxa differently, so splits are keyed by names
+    freqs = []
+    for names, counts, ntrees in results:
+        freq = {}
+        for split, count in counts.iteritems():
+            key = tuple(name for i, name in enumerate(names) if split >> i & 1)
+            freq[key] = count / float(ntrees)
+        freqs.append(freq)
+    return freqs
+
+
+def avg_std_split_freq(freqs, minfreq=0.1):
+    """
+    Returns the average standard deviation of split frequencies (ASDSF)
+
+    'freqs' are split frequencies of two or more runs (see
+    split_frequencies()).  Only splits with a frequency of at least
+    'minfreq' in some run are included.  The sample standard deviation
+    (n - 1 denominator) is used, as in MrBayes.  Values near zero indicate
+    that the runs have converged.
+    """
+
+    if len(freqs) < 2:
+        raise Exception("ASDSF requires at least two runs (%d given)" %
+                        len(freqs))
+
+    splits = set()
+    for freq in freqs:
+        splits.update(split for split, f in freq.iteritems() if f >= minfreq)
+    if not splits:
+        return 0.0
+
+    total = 0.0
+    for split in splits:
+        total += stats.sdev([freq.get(split, 0.0) for freq in freqs])
+    return total / len(splits)
@@ -0,0 +1,256 @@
+"""
+
+   Neighbor joining (NJ) and BIONJ on numpy distance matrices
+
+phylo.neighborjoin() keeps distances in nested dicts and compares every
+pair of nodes in python at each merge.  Here distances live in one float
+array whose active rows are kept compact (a merged node takes the slot of
+one child and the last active row fills the other), row sums are updated
+incrementally after each merge, and the Q-matrix minimum is found with
+vectorized operations over blocks of rows.
+
+Memory is O(n^2) and time is O(n^3) with a small constant.
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+from __future__ import division
+
+# numpy imports
+import numpy as np
+
+# rasmus imports
+from rasmus import treelib
+
+
+#=============================================================================
+# neighbor joining
+
+
+def find_min_q(dists, rowsums, m, blocksize=256):
+    """
+    Returns the pair (i, j) minimizing the Q-criterion
+
+      Q(i, j) = (m - 2) d(i, j) - R(i) - R(j)
+
+    over the first 'm' (active) rows of 'dists'.  The diagonal of 'dists'
+    must be +inf.
+    """
+
+    best = np.inf
+    besti = bestj = -1
+    rsums = rowsums[:m]
+
+    for start in xrange(0, m, blocksize):
+        end = min(start + blocksize, m)
+        q = dists[start:end, :m] * (m - 2)
+        q -= rsums
+        cols = q.argmin(axis=1)
+        rowmins = q[np.arange(end - start), cols] - rsums[start:end]
+        i = rowmins.argmin()
+        if rowmins[i] < best:
+            best = rowmins[i]
+            besti = start + i
+            bestj = cols[i]
+
+    return besti, bestj
+
+
+def _usertree_merges(usertree):
+    """Returns the internal nodes of a binary usertree in postorder"""
+    merges = []
+    for node in usertree.postorder():
+        if not node.is_leaf():
+            assert len(node.children) == 2, "usertree is not binary"
+            merges.append(node)
+    return merges
+
+
+def neighborjoin(distmat, genes, usertree=None, bionj=False,
+                 blocksize=256):
+    """
+    Neighbor joining algorithm
+
+    distmat   -- distance matrix (list of lists or numpy array)
+    genes     -- names of the rows of distmat
+    usertree  -- if given, nodes are merged in the order of this binary
+                 tree, as in phylo.neighborjoin()
+    bionj     -- if True, use the BIONJ variance reduction (Gascuel 1997)
+    blocksize -- number of rows per block in the Q-matrix search
+
+    Returns an unrooted tree (rooted as usertree, if usertree is rooted).
+    """
+
+    n = len(genes)
+    dists = np.array(distmat, dtype=float)
+    assert dists.shape == (n, n), "distance matrix does not match genes"
+
+    if bionj:
+        variances = dists.copy()
+        np.fill_diagonal(variances, 0.0)
+    rowsums = dists.sum(axis=1) - dists.diagonal()
+    np.fill_diagonal(dists, np.inf)
+
+    tree = treelib.Tree()
+    nodes = [tree.add(treelib.TreeNode(gene)) for gene in genes]
+    intnames = [gene for gene in genes if isinstance(gene, int)]
+    if intnames:
+        # make sure new internal names do not clash with gene names
+        tree.nextname = max(max(intnames) + 1, tree.nextname)
+    slots = dict((node, i) for i, node in enumerate(nodes))
+
+    # if usertree is given, determine merging order
+    merges = []
+    usernodes = {}
+    if usertree is not None:
+        merges = _usertree_merges(usertree)
+        merges.reverse()
+        for leaf in usertree.leaves():
+            usernodes[leaf] = tree.nodes[leaf.name]
+
+    # join loop
+    m = n
+    while m > 2:
+        if usertree is None:
+            a, b = find_min_q(dists, rowsums, m, blocksize)
+        else:
+            unode = merges.pop()
+            a = slots[usernodes[unode.children[0]]]
+            b = slots[usernodes[unode.children[1]]]
+        if a > b:
+            a, b = b, a
+
+        # branch lengths
+        dab = dists[a, b]
+        dista = .5 * (dab + (rowsums[a] - rowsums[b]) / (m - 2))
+        distb = dab - dista
+
+        # join nodes a and b
+        parent = treelib.TreeNode(tree.new_name())
+        tree.add_child(parent, nodes[a])
+        tree.add_child(parent, nodes[b])
+        nodes[a].dist = dista
+        nodes[b].dist = distb
+        if usertree is not None:
+            usernodes[unode] = parent
+
+        # distances to the new node
+        if bionj:
+            vab = variances[a, b]
+            if vab > 0.0:
+                lam = .5 + (variances[b, :m].sum() -
+                            variances[a, :m].sum()) / (2 * (m - 2) * vab)
+                lam = min(max(lam, 0.0), 1.0)
+            else:
+                lam = .5
+            newvars = (lam * variances[a, :m] + (1 - lam) * variances[b, :m] -
+                       lam * (1 - lam) * vab)
+        else:
+            lam = .5
+        # (entries a and b are undefined and only used after being reset)
+        with np.errstate(invalid="ignore"):
+            newrow = (lam * (dists[a, :m] - dista) +
+                      (1 - lam) * (dists[b, :m] - distb))
+
+            # incremental row sums
+            rowsums[:m] += newrow - dists[a, :m] - dists[b, :m]
+        newrow[a] = newrow[b] = 0.0
+        newsum = newrow.sum()
+
+        # new node takes the slot of a
+        newrow[a] = np.inf
+        dists[a, :m] = newrow
+        dists[:m, a] = newrow
+        rowsums[a] = newsum
+        nodes[a] = parent
+        slots[parent] = a
+        if bionj:
+            newvars[a] = 0.0
+            variances[a, :m] = newvars
+            variances[:m, a] = newvars
+
+        # last active node takes the slot of b
+        last = m - 1
+        if b != last:
+            dists[b, :m] = dists[last, :m]
+            dists[:m, b] = dists[:m, last]
+            dists[b, b] = np.inf
+            rowsums[b] = rowsums[last]
+            if bionj:
+                variances[b, :m] = variances[last, :m]
+                variances[:m, b] = variances[:m, last]
+                variances[b, b] = 0.0
+            nodes[b] = nodes[last]
+            slots[nodes[b]] = b
+        m -= 1
+
+    # join the last two nodes into a tribranch
+    node1, node2 = nodes[0], nodes[1]
+    dist = dists[0, 1]
+    if node1.is_leaf():
+        node1, node2 = node2, node1
+    tree.add_child(node1, node2)
+    node2.dist = dist
+    tree.root = node1
+
+    # root tree according to usertree
+    if usertree is not None and treelib.is_rooted(usertree):
+        roots = set(usernodes[child] for child in usertree.root.children)
+        newroot = None
+        for child in tree.root.children:
+            if child in roots:
+                newroot = child
+        assert newroot is not None
+
+        treelib.reroot(tree, newroot.name, newCopy=False)
+
+    return tree
+
+
+def bionj(distmat, genes, usertree=None, blocksize=256):
+    """BIONJ algorithm (see neighborjoin())"""
+    return neighborjoin(distmat, genes, usertree=usertree, bionj=True,
+                        blocksize=blocksize)
+
+
+#=============================================================================
+
+if __name__ == "__main__":
+    import sys
+
+    from rasmus import util
+    from compbio import phylo
+
+    #========================
+    # benchmark against phylo.neighborjoin
+
+    sizes = map(int, sys.argv[1:]) if len(sys.argv) > 1 else [
+        500, 2000, 10000]
+
+    for n in sizes:
+        # random points give a non-additive but realistic matrix
+        points = np.random.rand(n, 10)
+        sqnorms = (points ** 2).sum(axis=1)
+        distmat = np.sqrt(np.maximum(
+            sqnorms[:, np.newaxis] + sqnorms - 2 * np.dot(points, points.T),
+            0.0))
+        genes = ["g%d" % i for i in xrange(n)]
+
+        # the dict-based version is O(n^3) in python, only time small n
+        if n <= 500:
+            distlists = distmat.tolist()
+            util.tic("phylo.neighborjoin (n=%d)" % n)
+            phylo.neighborjoin(distlists, genes)
+            util.toc()
+
+        util.tic("nj.neighborjoin (n=%d)" % n)
+        neighborjoin(distmat, genes)
+        util.toc()
+
+        util.tic("nj.bionj (n=%d)" % n)
+        bionj(distmat, genes)
+        util.toc()
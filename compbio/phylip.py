@@ -15,7 +15,6 @@ The following programs should be in your PATH
     neighbor    -- Neighbor Joining
     dnadist     -- Distance estimation (nucleotide)
     protdist    -- Distance estimation (peptide)
-    seqboot     -- Sequence bootstrapping
     consense    -- Consensus tree building
 
 """
@@ -23,6 +22,7 @@ The following programs should be in your PATH
 
 # python imports
 import os
+import random
 import shutil
 import sys
 
@@ -178,6 +178,20 @@ def write_phylip_align(out, seqs, strip_names=True):
     return seqs.keys()
 
 
+def write_boot_align(out, seqs, iters, seed=None):
+    """
+    Write bootstrap replicates of an alignment in PHYLIP format
+
+    Writes the same multiple data set format as seqboot, without running
+    it.  Returns the labels of the sequences.  Requires numpy.
+    """
+    from .seqarray import AlignMatrix, BootstrapSampler, find_alphabet
+
+    validate_seqs(seqs)
+    aln = AlignMatrix.from_seqs(seqs, find_alphabet(seqs))
+    return BootstrapSampler(aln, iters, seed).write_phylip(out)
+
+
 def read_logl(filename):
     # parse logl
     logl = None
@@ -400,8 +414,11 @@ def align2tree(prog, seqs, verbose=True, force=False, args=None,
 
     util.tic("%s on %d of length %d" % (prog, len(seqs), len(seqs.values()[0])))
 
-    # create input
-    labels = write_phylip_align(file("infile", "w"), seqs)
+    # create input (bootstrap replicates if needed)
+    if bootiter > 1:
+        labels = write_boot_align("infile", seqs, bootiter, seed)
+    else:
+        labels = write_phylip_align(file("infile", "w"), seqs)
     util.write_list(file("labels", "w"), labels)
 
     # initialize default arguments
@@ -414,13 +431,9 @@ def align2tree(prog, seqs, verbose=True, force=False, args=None,
         args = "u\n" + args # add user tree option
 
 
-    # bootstrap alignment if needed
+    # add bootstrap arguments
     if bootiter > 1:
-    	exec_phylip("seqboot", "r\n%d\ny\n%d" % (bootiter, seed), verbose)
-        os.rename("outfile", "infile")
-    	
-    	# add bootstrap arguments
-    	args = "m\nD\n%d\n%d\n%d\n%s" % (bootiter, seed, jumble, args)
+        args = "m\nD\n%d\n%d\n%d\n%s" % (bootiter, seed, jumble, args)
 
     # run phylip
     exec_phylip(prog, args, verbose)
@@ -660,18 +673,15 @@ def boot_neighbor(seqs, iters=100, seed=None, output=None,
                  verbose=True, force=False):
 
     if seed == None:
-        seed = random.randInt(0, 1000) * 2 + 1
+        seed = random.randint(0, 1000) * 2 + 1
 
     validate_seqs(seqs)
     cwd = create_temp_dir()
     util.tic("boot_neighbor on %d of length %d" % (len(seqs), len(seqs.values()[0])))
 
-    # create input
-    labels = write_phylip_align(file("infile", "w"), seqs)
+    # create bootstrap replicates
+    labels = write_boot_align("infile", seqs, iters, seed)
 
-    exec_phylip("seqboot", "r\n%d\ny\n%d" % (iters, seed), verbose)
-
-    os.rename("outfile", "infile")
     exec_phylip("protdist", "m\nd\n%d\ny" % iters, verbose)
 
     os.rename("outfile", "infile")
@@ -704,12 +714,9 @@ def boot_proml(seqs, iters = 100, seed = 1, jumble=5, output=None,
     cwd = create_temp_dir()
     util.tic("bootProml on %d of length %d" % (len(seqs), len(seqs.values()[0])))
 
-    # create input
-    labels = write_phylip_align(file("infile", "w"), seqs)
+    # create bootstrap replicates
+    labels = write_boot_align("infile", seqs, iters, seed)
 
-    exec_phylip("seqboot", "y\n%d" % seed, verbose)
-
-    os.rename("outfile", "infile")
     exec_phylip("proml", "m\nD\n%d\n%d\n%d\ny" % (iters, seed, jumble), verbose)
 
     util.toc()
@@ -0,0 +1,404 @@
+"""
+
+    Batch execution of phylogeny programs
+
+Runs a phylogeny program (PHYLIP, PhyML, RAxML, MrBayes) on many alignments
+concurrently.  Every job runs in its own working directory, so programs
+that use fixed file names (infile, outfile, outtree, ...) never collide and
+the current directory of the calling process is never changed.
+
+Results are appended to a tab-delimited table as jobs finish
+
+  name     -- job name (usually the alignment's basename)
+  status   -- 'done' or 'error'
+  logl     -- log likelihood of the tree (nan if not given by the program)
+  runtime  -- seconds spent running the job
+  tree     -- tree in one-line newick format ('-' on error)
+
+Rerunning a batch with the same output file skips jobs that are already
+done, so an interrupted batch can be resumed.
+
+"""
+
+# python imports
+import os
+import re
+import shutil
+import subprocess
+import time
+from multiprocessing import Pool
+
+# rasmus imports
+from rasmus import tablelib
+from rasmus import treelib
+from rasmus import util
+
+# compbio imports
+from . import fasta
+from . import mrbayes
+from . import phylip
+
+
+RESULT_HEADERS = ["name", "status", "logl", "runtime", "tree"]
+
+
+#=============================================================================
+# programs
+#
+# A program writes the input files of one job into its working directory,
+# gives the command (and standard input) to run there, and reads the tree
+# and likelihood back from the working directory.  Sequences are renamed to
+# PHYLIP ids and the original names are kept in the file 'labels'.
+
+
+class PhyloProgram (object):
+    """Base class for phylogeny programs run by a batch"""
+
+    def __init__(self, exe, extra=()):
+        self.exe = exe
+        self.extra = list(extra)
+
+    def setup(self, workdir, aln):
+        """
+        Write input files into 'workdir'
+
+        Returns (args, stdin) where 'args' is the command to run within
+        'workdir' and 'stdin' is its input (or None).
+        """
+        raise NotImplementedError()
+
+    def read_result(self, workdir):
+        """Returns (tree, logl) of a finished job ('logl' may be None)"""
+        raise NotImplementedError()
+
+    def write_align(self, workdir, aln, filename="infile"):
+        """Write an alignment in PHYLIP format with the labels file"""
+        out = open(os.path.join(workdir, filename), "w")
+        labels = phylip.write_phylip_align(out, aln)
+        out.close()
+        util.write_list(os.path.join(workdir, "labels"), labels)
+        return labels
+
+    def read_labels(self, workdir):
+        return util.read_strings(os.path.join(workdir, "labels"))
+
+
+class PhylipProgram (PhyloProgram):
+    """
+    A PHYLIP tree building program (dnaml, proml, dnapars, protpars)
+
+    'args' are the menu choices given on standard input.
+    """
+
+    def __init__(self, prog="dnaml", args="y", exe=None):
+        PhyloProgram.__init__(self, exe if exe else prog)
+        self.prog = prog
+        self.args = args
+
+    def setup(self, workdir, aln):
+        self.write_align(workdir, aln)
+        return [self.exe], self.args + "\n"
+
+    def read_result(self, workdir):
+        labels = self.read_labels(workdir)
+        outfile = os.path.join(workdir, "outfile")
+
+        if phylip.is_phylip_give_up(outfile):
+            # make star tree
+            tree = treelib.Tree()
+            tree.make_root()
+            for label in labels:
+                tree.add_child(tree.root, treelib.TreeNode(label))
+            return tree, None
+
+        tree = phylip.read_out_tree(os.path.join(workdir, "outtree"), labels)
+        if self.prog in ("dnaml", "proml"):
+            return tree, phylip.read_logl(outfile)
+        else:
+            return tree, None
+
+
+class PhymlProgram (PhyloProgram):
+    """PhyML with the same default models as phyml.phyml()"""
+
+    def __init__(self, seqtype="dna", model=None, nrates=4, exe="phyml",
+                 extra=()):
+        PhyloProgram.__init__(self, exe, extra)
+        self.seqtype = seqtype
+        self.model = model
+        self.nrates = nrates
+
+    def setup(self, workdir, aln):
+        self.write_align(workdir, aln)
+        if self.seqtype == "dna":
+            args = ["infile", "0", "s", "1", "0", self.model or "HKY",
+                    "e", "e", str(self.nrates), "e", "BIONJ", "y", "y"]
+        elif self.seqtype == "pep":
+            args = ["infile", "1", "s", "1", "0", self.model or "JTT",
+                    "e", str(self.nrates), "e", "BIONJ", "y", "y"]
+        else:
+            raise Exception("unknown sequence type '%s'" % self.seqtype)
+        return [self.exe] + args + self.extra, "y\n"
+
+    def read_result(self, workdir):
+        tree = phylip.read_out_tree(
+            os.path.join(workdir, "infile_phyml_tree.txt"),
+            self.read_labels(workdir))
+        logl = float(open(os.path.join(workdir,
+                                       "infile_phyml_lk.txt")).read())
+        return tree, logl
+
+
+class RaxmlProgram (PhyloProgram):
+    """RAxML with the same default models as bin/run-raxml"""
+
+    def __init__(self, seqtype="dna", model=None, seed=1, exe="raxmlHPC",
+                 extra=()):
+        PhyloProgram.__init__(self, exe, extra)
+        if model is None:
+            model = "GTRGAMMA" if seqtype == "dna" else "PROTGAMMAJTT"
+        self.model = model
+        self.seed = seed
+
+    def setup(self, workdir, aln):
+        self.write_align(workdir, aln)
+        return [self.exe, "-s", "infile", "-n", "out", "-m", self.model,
+                "-p", str(self.seed)] + self.extra, None
+
+    def read_result(self, workdir):
+        tree = phylip.read_out_tree(
+            os.path.join(workdir, "RAxML_result.out"),
+            self.read_labels(workdir))
+
+        # the last reported likelihood is that of the final tree
+        logl = None
+        pattern = re.compile(r"(likelihood|Score of best tree)\D*(-[\d.]+)")
+        infofile = os.path.join(workdir, "RAxML_info.out")
+        if os.path.exists(infofile):
+            for line in open(infofile):
+                match = pattern.search(line)
+                if match:
+                    logl = float(match.group(2))
+        return tree, logl
+
+
+class MrbayesProgram (PhyloProgram):
+    """
+    MrBayes consensus trees (see mrbayes.mrbayes())
+
+    'extra' are words of MrBayes commands run after the MCMC.
+    """
+
+    def __init__(self, seqtype="pep", options=None, exe="mb", extra=()):
+        PhyloProgram.__init__(self, exe, extra)
+        self.seqtype = seqtype
+        self.options = mrbayes.setDefaultOptions(dict(options or {}))
+        self.options["extra"] += " ".join(
+            self.extra + ["sumt contype=allcompat;"])
+
+    def setup(self, workdir, aln):
+        labels = aln.keys()
+        util.write_list(os.path.join(workdir, "labels"), labels)
+        names = [phylip.phylip_padding(str(i)) for i in xrange(len(labels))]
+
+        out = open(os.path.join(workdir, "infile.nex"), "w")
+        mrbayes.write_nexus(out, names, aln.values(), self.seqtype,
+                            self.options)
+        mrbayes.writeMrbayesOptions(out, self.options, seqtype=self.seqtype)
+        out.close()
+        return [self.exe], "exe infile.nex\n"
+
+    def read_result(self, workdir):
+        tree = mrbayes.readNexusConTree(
+            open(os.path.join(workdir, "infile.nex.con")))
+        phylip.rename_tree_with_names(tree, self.read_labels(workdir))
+        return tree, None
+
+
+def get_program(name, seqtype="dna", exe=None, extra=()):
+    """Returns a program by name with default options"""
+
+    if name in ("dnaml", "proml", "dnapars", "protpars"):
+        return PhylipProgram(name, "\n".join(list(extra) + ["y"]), exe=exe)
+    elif name == "phyml":
+        return PhymlProgram(seqtype, exe=exe or "phyml", extra=extra)
+    elif name == "raxml":
+        return RaxmlProgram(seqtype, exe=exe or "raxmlHPC", extra=extra)
+    elif name == "mrbayes":
+        return MrbayesProgram(seqtype, exe=exe or "mb", extra=extra)
+    else:
+        raise Exception("unknown program '%s'" % name)
+
+
+#=============================================================================
+# jobs
+
+
+def get_job_dir(workdir, index, name):
+    """Returns the working directory of a job"""
+    return os.path.join(workdir,
+                        "%d.%s" % (index, re.sub(r"[^\w.-]", "_", name)))
+
+
+def run_job(program, name, aln, jobdir, keep=False):
+    """
+    Run one job within its own working directory 'jobdir'
+
+    'aln' is an alignment, a list of (name, seq) pairs or the filename of
+    a FASTA alignment.  Returns a result dict with the fields of
+    RESULT_HEADERS ('tree' is a Tree or None on error).
+    """
+
+    start = time.time()
+    if os.path.exists(jobdir):
+        shutil.rmtree(jobdir)
+    os.makedirs(jobdir)
+
+    result = {"name": name, "status": "error", "logl": None, "tree": None}
+    try:
+        if isinstance(aln, basestring):
+            aln = fasta.read_fasta(aln)
+        elif isinstance(aln, list):
+            seqs = aln
+            aln = fasta.FastaDict()
+            for key, seq in seqs:
+                aln[key] = seq
+        phylip.validate_seqs(aln)
+        args, stdin = program.setup(jobdir, aln)
+        util.write_list(os.path.join(jobdir, "cmd"), [" ".join(args)])
+
+        log = open(os.path.join(jobdir, "log"), "w")
+        proc = subprocess.Popen(
+            args, cwd=jobdir, stdout=log, stderr=subprocess.STDOUT,
+            stdin=subprocess.PIPE if stdin is not None else None)
+        proc.communicate(stdin)
+        log.close()
+
+        if proc.returncode == 0:
+            result["tree"], result["logl"] = program.read_result(jobdir)
+            result["status"] = "done"
+    except Exception, e:
+        util.logger("job '%s' failed: %s" % (name, e))
+    result["runtime"] = time.time() - start
+
+    if result["status"] == "done" and not keep:
+        shutil.rmtree(jobdir)
+    return result
+
+
+def _run_job(job):
+    return run_job(*job)
+
+
+def iter_batch(program, jobs, workdir, nproc=1, keep=False, skip=()):
+    """
+    Run a program on many alignments and yield results as they finish
+
+    jobs    -- list of (name, aln) where 'aln' is an alignment or the
+               filename of a FASTA alignment
+    workdir -- directory holding the working directory of every job
+    nproc   -- number of jobs to run concurrently
+    keep    -- keep working directories of successful jobs (directories of
+               failed jobs are always kept)
+    skip    -- names of jobs not to run (e.g. already done)
+    """
+
+    # alignments are passed to workers as lists of (name, seq) pairs
+    skip = set(skip)
+    jobs = [(program, name,
+             aln if isinstance(aln, basestring)
+             else [(key, aln[key]) for key in aln.keys()],
+             get_job_dir(workdir, i, name), keep)
+            for i, (name, aln) in enumerate(jobs)
+            if name not in skip]
+
+    if nproc > 1 and len(jobs) > 1:
+        pool = Pool(nproc)
+        try:
+            for result in pool.imap_unordered(_run_job, jobs):
+                yield result
+        finally:
+            pool.terminate()
+    else:
+        for job in jobs:
+            yield _run_job(job)
+
+
+#=============================================================================
+# results
+
+
+def write_result(out, result):
+    """Write a result as a row of a result table"""
+    logl = result["logl"]
+    tree = result["tree"]
+    out.write("\t".join([
+        result["name"], result["status"],
+        "nan" if logl is None else repr(logl),
+        "%.3f" % result["runtime"],
+        tree.get_one_line_newick() if tree else "-"]) + "\n")
+    out.flush()
+
+
+def read_results(filename):
+    """
+    Read a result table
+
+    Returns a dict from job name to its last result.  Trees are parsed
+    into Tree objects.
+    """
+
+    results = {}
+    for row in tablelib.iter_table(filename, types={
+            "name": str, "status": str, "logl": float, "runtime": float,
+            "tree": str}):
+        if row["logl"] != row["logl"]:
+            row["logl"] = None
+        if row["tree"] == "-":
+            row["tree"] = None
+        else:
+            row["tree"] = treelib.parse_newick(row["tree"])
+        results[row["name"]] = row
+    return results
+
+
+def run_batch(program, jobs, output, workdir=None, nproc=1, keep=False,
+              resume=True, verbose=False):
+    """
+    Run a program on many alignments and collect results in 'output'
+
+    Jobs already done in an existing 'output' are skipped when 'resume' is
+    True.  Returns a dict from job name to result for all jobs in 'output'.
+    See iter_batch() for 'jobs', 'nproc' and 'keep'.
+    """
+
+    if workdir is None:
+        workdir = output + ".jobs"
+
+    done = set()
+    if resume and os.path.exists(output):
+        done = set(name for name, result in read_results(output).iteritems()
+                   if result["status"] == "done")
+        out = open(output, "a")
+    else:
+        out = open(output, "w")
+        out.write("\t".join(RESULT_HEADERS) + "\n")
+
+    jobs = list(jobs)
+    if verbose and done:
+        util.logger("skipping %d jobs already done" % len(done))
+
+    try:
+        for result in iter_batch(program, jobs, workdir, nproc=nproc,
+                                 keep=keep, skip=done):
+            if verbose:
+                util.logger("%s: %s (%.1fs)" % (
+                    result["name"], result["status"], result["runtime"]))
+            write_result(out, result)
+    finally:
+        out.close()
+
+    if os.path.isdir(workdir) and not os.listdir(workdir):
+        os.rmdir(workdir)
+
+    return read_results(output)
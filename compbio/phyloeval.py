@@ -0,0 +1,286 @@
+"""
+
+    Evaluation of gene tree reconstructions
+
+Compares inferred gene trees to true (e.g. simulated) gene trees for many
+gene families.  Families are laid out as in bin/phylotest
+
+  <datadir>/<fam>/<fam><dataext>  -- true tree
+  <evaldir>/<fam>/<fam><evalext>  -- inferred tree
+
+Families are evaluated in worker processes, which read the trees and
+compute the statistics of EVAL_HEADERS for each family.  Results of
+several methods are collected into one tablelib table and summarized per
+method with summarize_evals().
+
+"""
+
+# python imports
+import os
+from multiprocessing import Pool
+
+# rasmus imports
+from rasmus import tablelib
+from rasmus import treelib
+from rasmus import util
+
+# compbio imports
+from . import phylo
+
+
+EVAL_HEADERS = ["method", "tree", "ngenes", "nbranches", "top_correct",
+                "branch_correct", "branch_percent", "rf", "rooted_rf",
+                "dup_actual", "dup_pred", "dup_sn", "dup_ppv", "dup_error",
+                "loss_actual", "loss_pred", "loss_sn", "loss_ppv",
+                "loss_error",
+                "orth_actual", "orth_pred", "orth_sn", "orth_ppv"]
+
+EVAL_TYPES = {"method": str, "tree": str, "ngenes": int, "nbranches": int,
+              "top_correct": int, "branch_correct": int,
+              "branch_percent": float, "rf": float, "rooted_rf": float,
+              "dup_actual": int, "dup_pred": int, "dup_sn": float,
+              "dup_ppv": float, "dup_error": int,
+              "loss_actual": int, "loss_pred": int, "loss_sn": float,
+              "loss_ppv": float, "loss_error": int,
+              "orth_actual": int, "orth_pred": int, "orth_sn": float,
+              "orth_ppv": float}
+
+# statistics averaged over families by summarize_evals()
+SUMMARY_HEADERS = ["method", "nfams", "top_correct", "branch_percent",
+                   "rf", "rooted_rf", "dup_error", "loss_error",
+                   "dup_sn", "dup_ppv", "loss_sn", "loss_ppv",
+                   "orth_sn", "orth_ppv"]
+
+
+#=============================================================================
+# comparing trees
+
+
+def topology_equal(tree1, tree2, unroot=True):
+    """
+    Returns True if two trees have the same topology
+
+    If 'unroot' is True, both trees are rerooted in place first.
+    """
+    if unroot:
+        treelib.reroot(tree1, sorted(tree1.leaf_names())[0], newCopy=False)
+        treelib.reroot(tree2, sorted(tree2.leaf_names())[0], newCopy=False)
+
+    hash1 = phylo.hash_tree(tree1)
+    hash2 = phylo.hash_tree(tree2)
+    return hash1 == hash2
+
+
+def get_dups(tree, events):
+    return set(tuple(sorted([tuple(sorted(child.leaf_names()))
+                             for child in node.children]))
+               for node, kind in events.iteritems()
+               if kind == "dup")
+
+
+def get_speciations(tree, events):
+    return set(tuple(sorted([tuple(sorted(child.leaf_names()))
+                             for child in node.children]))
+               for node, kind in events.iteritems()
+               if kind == "spec")
+
+
+def get_losses(tree, stree, recon):
+    return set((tuple(sorted(loss[0].leaf_names())),
+                loss[1].name)
+               for loss in phylo.find_loss(tree, stree, recon))
+
+
+def get_orths(tree, events):
+    specs = [sorted([sorted(child.leaf_names())
+                     for child in node.children])
+             for node in events
+             if events[node] == "spec"]
+
+    return set(tuple(sorted((a, b)))
+               for s in specs
+               for a in s[0]
+               for b in s[1])
+
+
+def evaluate_trees(datatree, evaltree, stree=None, gene2species=None,
+                   rooted=False):
+    """
+    Compare an inferred tree 'evaltree' to a true tree 'datatree'
+
+    Returns a dict with the statistics of EVAL_HEADERS (except 'method' and
+    'tree').  Duplications, losses and orthologs are only counted when
+    'stree' and 'gene2species' are given.  'datatree' and 'evaltree' may be
+    rerooted in place.
+    """
+
+    # get recon stats
+    if stree and gene2species:
+        data_recon = phylo.reconcile(datatree, stree, gene2species)
+        eval_recon = phylo.reconcile(evaltree, stree, gene2species)
+        data_events = phylo.label_events(datatree, data_recon)
+        eval_events = phylo.label_events(evaltree, eval_recon)
+
+        data_dups = get_dups(datatree, data_events)
+        eval_dups = get_dups(evaltree, eval_events)
+
+        data_losses = get_losses(datatree, stree, data_recon)
+        eval_losses = get_losses(evaltree, stree, eval_recon)
+
+        data_orths = get_orths(datatree, data_events)
+        eval_orths = get_orths(evaltree, eval_events)
+    else:
+        data_dups = eval_dups = set()
+        data_losses = eval_losses = set()
+        data_orths = eval_orths = set()
+
+    # compute true positives
+    dups_tp = len(data_dups & eval_dups)
+    losses_tp = len(data_losses & eval_losses)
+    orths_tp = len(data_orths & eval_orths)
+
+    # get general stats (rooted splits before any rerooting)
+    ngenes = len(evaltree.leaves())
+    nbranches = len(evaltree.nodes) - ngenes - 1
+    rooted_rf = phylo.robinson_foulds_error(datatree, evaltree, rooted=True)
+    correct = int(topology_equal(datatree, evaltree, unroot=not rooted))
+
+    if len(datatree.leaves()) <= 3:
+        rf = 0.0
+        branches_correct = 0
+    else:
+        rf = phylo.robinson_foulds_error(datatree, evaltree)
+        branches_correct = int((1.0 - rf) * nbranches)
+
+    return {
+        "ngenes": ngenes,
+        "nbranches": nbranches,
+        "top_correct": correct,
+        "branch_correct": branches_correct,
+        "branch_percent": util.safediv(branches_correct, nbranches, 1.0),
+        "rf": rf,
+        "rooted_rf": rooted_rf,
+
+        "dup_actual": len(data_dups),
+        "dup_pred": len(eval_dups),
+        "dup_sn": util.safediv(dups_tp, len(data_dups), 1.0),
+        "dup_ppv": util.safediv(dups_tp, len(eval_dups), 1.0),
+        "dup_error": abs(len(eval_dups) - len(data_dups)),
+
+        "loss_actual": len(data_losses),
+        "loss_pred": len(eval_losses),
+        "loss_sn": util.safediv(losses_tp, len(data_losses), 1.0),
+        "loss_ppv": util.safediv(losses_tp, len(eval_losses), 1.0),
+        "loss_error": abs(len(eval_losses) - len(data_losses)),
+
+        "orth_actual": len(data_orths),
+        "orth_pred": len(eval_orths),
+        "orth_sn": util.safediv(orths_tp, len(data_orths), 1.0),
+        "orth_ppv": util.safediv(orths_tp, len(eval_orths), 1.0)}
+
+
+#=============================================================================
+# evaluating many families
+
+# species tree and gene2species mapping of a worker process
+_worker_stree = None
+_worker_gene2species = None
+
+
+def _init_worker(stree, gene2species):
+    global _worker_stree, _worker_gene2species
+    if isinstance(stree, basestring):
+        stree = treelib.read_tree(stree)
+    if isinstance(gene2species, basestring):
+        gene2species = phylo.read_gene2species(gene2species)
+    _worker_stree = stree
+    _worker_gene2species = gene2species
+
+
+def _evaluate_family(job):
+    method, name, datafile, evalfile, rooted = job
+    if not os.path.exists(evalfile):
+        return None
+    row = evaluate_trees(treelib.read_tree(datafile),
+                         treelib.read_tree(evalfile),
+                         _worker_stree, _worker_gene2species, rooted)
+    row["method"] = method
+    row["tree"] = name
+    return row
+
+
+def iter_family_evals(methods, names, datadir, dataext, stree=None,
+                      gene2species=None, rooted=False, nproc=1):
+    """
+    Evaluate the inferred trees of several methods for many families
+
+    methods      -- list of (method, evaldir, evalext)
+    names        -- family names
+    stree        -- species tree or its filename
+    gene2species -- gene2species function or the filename of a mapping
+
+    Yields a row for each method and family in order.  Families without
+    an inferred tree are skipped.  Trees are read and compared in 'nproc'
+    worker processes.
+    """
+
+    jobs = [(method, name,
+             os.path.join(datadir, name, name + dataext),
+             os.path.join(evaldir, name, name + evalext), rooted)
+            for method, evaldir, evalext in methods
+            for name in names]
+
+    if nproc > 1 and len(jobs) > 1:
+        # workers inherit the species tree and mapping when started
+        pool = Pool(nproc, _init_worker, (stree, gene2species))
+        chunksize = max(1, min(100, len(jobs) // (4 * nproc)))
+        try:
+            for row in pool.imap(_evaluate_family, jobs, chunksize):
+                if row is not None:
+                    yield row
+        finally:
+            pool.terminate()
+    else:
+        _init_worker(stree, gene2species)
+        for job in jobs:
+            row = _evaluate_family(job)
+            if row is not None:
+                yield row
+
+
+def evaluate_families(methods, names, datadir, dataext, stree=None,
+                      gene2species=None, rooted=False, nproc=1):
+    """
+    Returns a table of the evaluations of several methods for many families
+
+    See iter_family_evals() for arguments.
+    """
+    return tablelib.Table(
+        iter_family_evals(methods, names, datadir, dataext, stree=stree,
+                          gene2species=gene2species, rooted=rooted,
+                          nproc=nproc),
+        headers=EVAL_HEADERS, types=EVAL_TYPES)
+
+
+def summarize_evals(evals):
+    """
+    Returns a table of the mean of each statistic per method
+
+    'top_correct' becomes the fraction of families with a correct topology.
+    Methods are listed in order of first appearance.
+    """
+
+    groups = evals.groupby("method")
+    methods = util.unique([row["method"] for row in evals])
+
+    types = dict((header, float) for header in SUMMARY_HEADERS)
+    types.update({"method": str, "nfams": int})
+    summary = tablelib.Table(headers=SUMMARY_HEADERS, types=types)
+    for method in methods:
+        rows = groups[method]
+        nfams = len(rows)
+        row = {"method": method, "nfams": nfams}
+        for header in SUMMARY_HEADERS[2:]:
+            row[header] = sum(r[header] for r in rows) / float(nfams)
+        summary.append(row)
+    return summary
@@ -0,0 +1,193 @@
+"""
+
+    Likelihood of a tree given an alignment
+
+Computes the likelihood of a tree with Felsenstein's pruning algorithm for
+nucleotide substitution models given by a transition matrix function, such
+as phylo.make_jc_matrix() or phylo.make_hky_matrix().
+
+Identical alignment columns are scored once (as seqarray.SitePatterns),
+and the conditional likelihoods of every node are cached between calls.
+When a tree is changed in place (e.g. by phylo.perform_nni() or
+phylo.perform_spr()) only the nodes above a changed child or branch length
+are recomputed, so a TreeLikelihood can be used directly as the scoring
+function of phylo.TreeSearchPrescreen.
+
+Requires numpy.
+
+"""
+
+# python imports
+import math
+
+# numpy imports
+import numpy as np
+
+# compbio imports
+from . import phylo
+from .seqarray import AlignMatrix, SitePatterns, DNA
+
+
+#=============================================================================
+# likelihood
+
+
+class TreeLikelihood (object):
+    """
+    Likelihood of trees for one alignment
+
+    aln         -- AlignMatrix or SitePatterns with the DNA alphabet (or a
+                   dict of sequences)
+    matrix_func -- function returning the transition matrix of a branch
+                   length, e.g. lambda t: phylo.make_hky_matrix(t, bgfreq,
+                   kappa)
+    bgfreq      -- background (root) base frequencies of the model
+    weights     -- column weights (e.g. of a seqarray.BootstrapSampler)
+
+    Leaves of the trees are matched to sequences by name.  Calling the
+    object with a tree returns its log likelihood.  Columns added to a
+    SitePatterns 'aln' later are included in the next likelihood (unless
+    'weights' are given).
+    """
+
+    def __init__(self, aln, matrix_func=phylo.make_jc_matrix,
+                 bgfreq=(.25, .25, .25, .25), weights=None):
+        if isinstance(aln, SitePatterns):
+            sites = aln
+        else:
+            if not isinstance(aln, AlignMatrix):
+                aln = AlignMatrix.from_seqs(aln)
+            sites = SitePatterns(aln)
+        if sites.alphabet.upper() != DNA:
+            raise Exception("likelihood requires the alphabet '%s'" % DNA)
+
+        self.sites = sites
+        self.matrix_func = matrix_func
+        self.bgfreq = np.array(bgfreq, dtype=float)
+        if weights is None:
+            self.counts = None
+        else:
+            self.counts = sites.get_counts(weights)
+
+        # cache of node -> (key, partial, logscale)
+        self.cache = {}
+        self.matrices = {}
+        self.nupdates = 0
+        self.init_leaves()
+
+    def init_leaves(self):
+        """Make the conditional likelihoods of the leaves"""
+        # missing data is any base
+        states = np.vstack([np.eye(4), np.ones(4)])
+        codes = np.minimum(self.sites.patterns, 4)
+        self.leaves = dict((name, states[codes[i]])
+                           for i, name in enumerate(self.sites.names))
+        self.npatterns = len(self.sites)
+        self.cache = {}
+
+        # columns added after the weights were given are not counted
+        if self.counts is not None and len(self.counts) < self.npatterns:
+            self.counts = np.concatenate(
+                [self.counts, np.zeros(self.npatterns - len(self.counts))])
+
+    def __call__(self, tree):
+        return self.get_logl(tree)
+
+    def get_matrix(self, dist):
+        """Returns the transposed transition matrix of a branch length"""
+        mat = self.matrices.get(dist)
+        if mat is None:
+            if len(self.matrices) > 10000:
+                self.matrices.clear()
+            mat = np.array(self.matrix_func(max(dist, 0.0))).T
+            self.matrices[dist] = mat
+        return mat
+
+    def update(self, tree):
+        """
+        Update the conditional likelihoods of the nodes of 'tree'
+
+        A node is recomputed only if its children, their branch lengths or
+        their conditional likelihoods have changed since the last update.
+        Returns the root's (partial, logscale).
+        """
+        if len(self.sites) != self.npatterns:
+            # new patterns were added
+            self.init_leaves()
+
+        cache = {}
+        changed = set()
+
+        # visit children before their parents
+        order = []
+        stack = [tree.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.children)
+
+        for node in reversed(order):
+            children = node.children
+            key = tuple((child, child.dist) for child in children)
+            entry = self.cache.get(node)
+
+            if entry is not None and entry[0] == key:
+                for child in children:
+                    if child in changed:
+                        break
+                else:
+                    cache[node] = entry
+                    continue
+
+            if not children:
+                try:
+                    partial = self.leaves[node.name]
+                except KeyError:
+                    raise Exception("no sequence for leaf '%s'" % node.name)
+                logscale = 0.0
+            else:
+                partial = None
+                logscale = 0.0
+                for child in children:
+                    entry2 = cache[child]
+                    part = np.dot(entry2[1], self.get_matrix(child.dist))
+                    if partial is None:
+                        partial = part
+                    else:
+                        partial *= part
+                    logscale = logscale + entry2[2]
+
+                # rescale to avoid underflow
+                scale = partial.max(1)
+                scale[scale == 0] = 1.0
+                partial /= scale[:, np.newaxis]
+                logscale = logscale + np.log(scale)
+                self.nupdates += 1
+
+            cache[node] = (key, partial, logscale)
+            changed.add(node)
+
+        self.cache = cache
+        entry = cache[tree.root]
+        return entry[1], entry[2]
+
+    def get_site_logls(self, tree):
+        """Returns the log likelihood of each site pattern"""
+        partial, logscale = self.update(tree)
+        with np.errstate(divide="ignore"):
+            return np.log(np.dot(partial, self.bgfreq)) + logscale
+
+    def get_logl(self, tree):
+        """Returns the log likelihood of a tree"""
+        site_logls = self.get_site_logls(tree)
+        counts = self.sites.counts if self.counts is None else self.counts
+        logl = np.dot(counts, site_logls)
+        if math.isnan(logl):
+            return -float("inf")
+        return float(logl)
+
+
+def calc_tree_logl(tree, seqs, matrix_func=phylo.make_jc_matrix,
+                   bgfreq=(.25, .25, .25, .25)):
+    """Returns the log likelihood of a tree given an alignment"""
+    return TreeLikelihood(seqs, matrix_func, bgfreq).get_logl(tree)
@@ -0,0 +1,655 @@
+"""
+
+   Integer-encoded sequence alignments
+
+Alignments are stored as a (nseqs, ncols) matrix of small integers, one
+code per character of an alphabet.  Characters outside the alphabet (gaps,
+N's, etc) are stored with the code len(alphabet).  This representation is
+shared by the array-based simulators and alignment methods and can be
+written directly as FASTA or PHYLIP without building python strings per
+character, resampled for the bootstrap, and compared pairwise to compute
+distance matrices.  Alignments with many identical columns can be
+compressed into weighted site patterns (SitePatterns), which the distance
+and likelihood code accepts in place of an AlignMatrix.
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+# python imports
+import random
+import sys
+from multiprocessing import Pool
+
+# numpy imports
+import numpy as np
+
+# rasmus imports
+from rasmus import util
+
+# compbio imports
+from . import fasta
+from . import seqlib
+from .phylip import phylip_padding, correct_dist_matrix
+
+
+#=============================================================================
+# alphabets
+
+DNA = "ACGT"
+PROTEIN = "ARNDCQEGHILKMFPSTWYV"
+
+# character used when decoding codes outside of the alphabet
+MISSING_CHAR = "-"
+
+
+def make_encoder(alphabet=DNA):
+    """Returns a lookup table from character byte to integer code"""
+    lut = np.empty(256, dtype=np.uint8)
+    lut.fill(len(alphabet))
+    for i, char in enumerate(alphabet):
+        lut[ord(char.upper())] = i
+        lut[ord(char.lower())] = i
+    return lut
+
+
+def make_decoder(alphabet=DNA):
+    """Returns a lookup table from integer code to character byte"""
+    return np.frombuffer(alphabet + MISSING_CHAR, dtype=np.uint8)
+
+
+def encode_seq(seq, alphabet=DNA, encoder=None):
+    """Encode a sequence string as an array of integer codes"""
+    if encoder is None:
+        encoder = make_encoder(alphabet)
+    return encoder[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def decode_seq(codes, alphabet=DNA, decoder=None):
+    """Decode an array of integer codes into a sequence string"""
+    if decoder is None:
+        decoder = make_decoder(alphabet)
+    return decoder[codes].tostring()
+
+
+#=============================================================================
+# alignment matrix
+
+
+class AlignMatrix (object):
+    """
+    An alignment stored as a matrix of integer codes
+
+    names    -- sequence names
+    matrix   -- (nseqs, ncols) array of codes
+    alphabet -- alphabet of the codes (code len(alphabet) is missing data)
+    """
+
+    def __init__(self, names, matrix, alphabet=DNA):
+        self.names = list(names)
+        self.matrix = matrix
+        self.alphabet = alphabet
+
+    def __len__(self):
+        return self.matrix.shape[1]
+
+    @classmethod
+    def from_seqs(cls, seqs, alphabet=DNA, names=None):
+        """
+        Create an AlignMatrix from a FastaDict (or any dict of sequences)
+        """
+        if names is None:
+            names = seqs.keys()
+        encoder = make_encoder(alphabet)
+        if len(names) == 0:
+            return cls(names, np.zeros((0, 0), dtype=np.uint8), alphabet)
+        matrix = np.array([encode_seq(seqs[name], encoder=encoder)
+                           for name in names], dtype=np.uint8)
+        return cls(names, matrix, alphabet)
+
+    def get_nstates(self):
+        """Returns the number of states (size of the alphabet)"""
+        return len(self.alphabet)
+
+    def get_seq(self, i, decoder=None):
+        """Returns the i'th sequence as a string"""
+        return decode_seq(self.matrix[i], self.alphabet, decoder)
+
+    def iter_seqs(self):
+        """Iterate over (name, seq) pairs"""
+        decoder = make_decoder(self.alphabet)
+        for i, name in enumerate(self.names):
+            yield name, self.get_seq(i, decoder)
+
+    def to_fasta_dict(self):
+        """Returns the alignment as a FastaDict"""
+        seqs = fasta.FastaDict()
+        for name, seq in self.iter_seqs():
+            seqs[name] = seq
+        return seqs
+
+    def select_columns(self, cols):
+        """Returns a new alignment with columns 'cols'"""
+        return AlignMatrix(self.names, self.matrix[:, cols], self.alphabet)
+
+    def select_rows(self, names):
+        """Returns a new alignment with only the sequences 'names'"""
+        lookup = dict((name, i) for i, name in enumerate(self.names))
+        rows = [lookup[name] for name in names]
+        return AlignMatrix(names, self.matrix[rows], self.alphabet)
+
+    def write_fasta(self, out=sys.stdout, width=80):
+        """Write the alignment in FASTA format"""
+        out = util.open_stream(out, "w")
+        for name, seq in self.iter_seqs():
+            print >>out, ">" + name
+            util.printwrap(seq, width, out=out)
+        out.close()
+
+    def write_phylip(self, out=sys.stdout, strip_names=True):
+        """
+        Write the alignment in PHYLIP format
+
+        Uses the same layout as phylip.write_phylip_align() and returns the
+        names in the order they were written.
+        """
+        out = util.open_stream(out, "w")
+        print >>out, len(self.names), self.matrix.shape[1]
+        for i, (name, seq) in enumerate(self.iter_seqs()):
+            if strip_names:
+                print >>out, "%8s  %s" % (phylip_padding(str(i), 8), seq)
+            else:
+                print >>out, "%8s  %s" % (name, seq)
+        out.close()
+        return list(self.names)
+
+
+#=============================================================================
+# site patterns
+
+
+class SitePatterns (object):
+    """
+    The unique columns (site patterns) of an alignment
+
+    names    -- sequence names
+    alphabet -- alphabet of the codes
+    patterns -- (nseqs, npatterns) array of unique columns
+    counts   -- (weighted) number of columns with each pattern
+    index    -- pattern of each column of the alignment
+
+    Columns can be added after the patterns are made with add_columns(),
+    e.g. as sites are simulated or read.  len() is the number of patterns.
+    """
+
+    def __init__(self, aln, weights=None):
+        self.names = list(aln.names)
+        self.alphabet = aln.alphabet
+        self.patterns = np.zeros((len(self.names), 0), dtype=np.uint8)
+        self.counts = np.zeros(0)
+        self.index = np.zeros(0, dtype=int)
+        self.lookup = {}
+        self.add_columns(aln.matrix, weights)
+
+    def __len__(self):
+        return self.patterns.shape[1]
+
+    def get_ncols(self):
+        """Returns the number of columns of the alignment"""
+        return len(self.index)
+
+    def get_nstates(self):
+        """Returns the number of states (size of the alphabet)"""
+        return len(self.alphabet)
+
+    def add_columns(self, matrix, weights=None):
+        """
+        Add columns (a (nseqs, ncols) array of codes) to the alignment
+
+        Columns with a known pattern only increase its count, so existing
+        patterns keep their index.
+        """
+        matrix = np.asarray(matrix, dtype=np.uint8)
+        if matrix.shape[1] == 0:
+            return
+        if len(self.names) == 0:
+            # every column of an empty alignment is the same
+            new = matrix[:, :1]
+            inverse = np.zeros(matrix.shape[1], dtype=int)
+        else:
+            new, inverse = np.unique(matrix, axis=1, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights,
+                             minlength=new.shape[1])
+
+        # match the batch's patterns to the known ones
+        ids = np.empty(new.shape[1], dtype=int)
+        added = []
+        for i, col in enumerate(np.ascontiguousarray(new.T)):
+            key = col.tostring()
+            j = self.lookup.get(key)
+            if j is None:
+                j = self.lookup[key] = len(self.lookup)
+                added.append(i)
+            ids[i] = j
+
+        if added:
+            self.patterns = np.hstack([self.patterns, new[:, added]])
+            self.counts = np.concatenate([self.counts, np.zeros(len(added))])
+        self.counts[ids] += counts
+        self.index = np.concatenate([self.index, ids[inverse]])
+
+    def get_counts(self, weights=None):
+        """
+        Returns the pattern counts for column weights
+
+        For example, the weights of a BootstrapSampler replicate give the
+        pattern counts of the replicate.
+        """
+        if weights is None:
+            return self.counts
+        return np.bincount(self.index, weights=weights,
+                           minlength=len(self)).astype(float)
+
+    def get_align(self):
+        """Returns the patterns as an AlignMatrix (one column each)"""
+        return AlignMatrix(self.names, self.patterns, self.alphabet)
+
+    def expand(self):
+        """Returns the alignment as an AlignMatrix"""
+        return AlignMatrix(self.names, self.patterns[:, self.index],
+                           self.alphabet)
+
+
+def _get_pattern_align(aln, weights):
+    # columns and column weights of an AlignMatrix or SitePatterns
+    if isinstance(aln, SitePatterns):
+        return aln.get_align(), aln.get_counts(weights)
+    return aln, weights
+
+
+#=============================================================================
+# bootstrap resampling
+
+
+def find_alphabet(seqs):
+    """
+    Returns an alphabet of every character in a dict of sequences
+
+    Encoding with this alphabet keeps every character (ignoring case), e.g.
+    when resampled alignments are written back out for other programs.
+    """
+    chars = set()
+    for name in seqs.keys():
+        chars.update(seqs[name].upper())
+    return "".join(sorted(chars))
+
+
+class BootstrapSampler (object):
+    """
+    Bootstrap replicates of an alignment
+
+    A replicate is a vector of column weights (the number of times each
+    column is drawn), so replicates are not copied out of the alignment
+    unless they are written for an external program.  Replicate i is drawn
+    from its own random stream seeded by (seed, i), so it does not depend
+    on the order or the process in which replicates are made.
+
+    aln   -- an AlignMatrix
+    nreps -- number of replicates
+    seed  -- random seed (chosen randomly if None)
+    ncols -- number of columns drawn for each replicate (default: all)
+    """
+
+    def __init__(self, aln, nreps=100, seed=None, ncols=None):
+        self.aln = aln
+        self.nreps = nreps
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        self.seed = seed
+        self.ncols = len(aln) if ncols is None else ncols
+
+    def __len__(self):
+        return self.nreps
+
+    def get_weights(self, i):
+        """Returns the column weights of replicate i"""
+        rand = np.random.RandomState([self.seed, i])
+        cols = rand.randint(0, len(self.aln), self.ncols)
+        return np.bincount(cols, minlength=len(self.aln))
+
+    def get_all_weights(self):
+        """Returns the column weights of every replicate as a matrix"""
+        weights = np.empty((self.nreps, len(self.aln)), dtype=np.int32)
+        for i in xrange(self.nreps):
+            weights[i] = self.get_weights(i)
+        return weights
+
+    def get_columns(self, i):
+        """Returns the columns of replicate i in alignment order"""
+        return np.repeat(np.arange(len(self.aln)), self.get_weights(i))
+
+    def get_replicate(self, i):
+        """Returns replicate i as an AlignMatrix"""
+        return self.aln.select_columns(self.get_columns(i))
+
+    def iter_replicates(self):
+        """Iterate over the replicates as AlignMatrix's"""
+        for i in xrange(self.nreps):
+            yield self.get_replicate(i)
+
+    def write_replicate(self, i, out=sys.stdout, format="fasta"):
+        """Write replicate i in 'fasta' or 'phylip' format"""
+        aln = self.get_replicate(i)
+        if format == "fasta":
+            aln.write_fasta(out)
+        elif format == "phylip":
+            return aln.write_phylip(out)
+        else:
+            raise Exception("unknown format '%s'" % format)
+
+    def write_phylip(self, out=sys.stdout, strip_names=True):
+        """
+        Write every replicate as one PHYLIP file of multiple data sets
+
+        This is the format written by PHYLIP's seqboot.  Replicates are
+        made one at a time as they are written.  Returns the names in the
+        order they were written.
+        """
+        out = util.open_stream(out, "w")
+        for aln in self.iter_replicates():
+            aln.write_phylip(out, strip_names=strip_names)
+        out.close()
+        return list(self.aln.names)
+
+    def map(self, func, nproc=1):
+        """
+        Returns [func(aln, weights) for each replicate]
+
+        Replicates are processed by 'nproc' worker processes, which make
+        their own weights from the seed.  'aln' is the original alignment.
+        """
+        if nproc > 1 and self.nreps > 1:
+            pool = Pool(nproc, _init_boot_worker, (self, func))
+            try:
+                return pool.map(_map_boot_replicate, xrange(self.nreps))
+            finally:
+                pool.terminate()
+        else:
+            return [func(self.aln, self.get_weights(i))
+                    for i in xrange(self.nreps)]
+
+
+# sampler and function of a worker process (inherited when forked)
+_boot_sampler = None
+_boot_func = None
+
+
+def _init_boot_worker(sampler, func):
+    global _boot_sampler, _boot_func
+    _boot_sampler = sampler
+    _boot_func = func
+
+
+def _map_boot_replicate(i):
+    return _boot_func(_boot_sampler.aln, _boot_sampler.get_weights(i))
+
+
+#=============================================================================
+# distances
+
+DIST_METHODS = ["p", "jc", "k2p", "poisson"]
+
+
+def count_diffs(aln, weights=None, rows=None, transitions=False):
+    """
+    Count the differences between sequences 'rows' and every sequence
+
+    Returns (sites, diffs, tsits), each a (len(rows), nseqs) array.  'sites'
+    is the number of columns where neither sequence has missing data
+    (pairwise deletion), 'diffs' the number of those columns that differ
+    and 'tsits' the number of differences that are transitions (None unless
+    'transitions' is True).  Columns are counted 'weights' times, e.g. with
+    the weights of a bootstrap replicate.  'aln' may be a SitePatterns, in
+    which case each pattern is compared once.
+
+    All pairs are counted at once as products of per-state indicator
+    matrices.
+    """
+    aln, weights = _get_pattern_align(aln, weights)
+    nstates = aln.get_nstates()
+    matrix = aln.matrix
+    if rows is None:
+        rows = slice(None)
+    if weights is None:
+        weights = np.ones(matrix.shape[1])
+    weights = np.asarray(weights, dtype=float)
+
+    def product(a, b):
+        # weighted counts of columns where a (rows) and b (all) are true
+        return np.dot(a[rows] * weights, b.T)
+
+    valid = (matrix < nstates).astype(float)
+    sites = product(valid, valid)
+    matches = np.zeros_like(sites)
+    states = []
+    for i in xrange(nstates):
+        state = (matrix == i).astype(float)
+        matches += product(state, state)
+        states.append(state)
+    diffs = sites - matches
+
+    if transitions:
+        if aln.alphabet.upper() != DNA:
+            raise Exception("transitions require the alphabet '%s'" % DNA)
+        # transitions are differences within purines (AG) or pyrimidines (CT)
+        a, c, g, t = states
+        purines = a + g
+        pyrimidines = c + t
+        tsits = (product(purines, purines) - product(a, a) - product(g, g) +
+                 product(pyrimidines, pyrimidines) - product(c, c) -
+                 product(t, t))
+    else:
+        tsits = None
+
+    return sites, diffs, tsits
+
+
+def correct_dists(sites, diffs, tsits=None, method="p", nstates=4):
+    """
+    Returns distances corrected for multiple substitutions
+
+    method -- 'p' (proportion of differences), 'jc' (Jukes-Cantor with
+              'nstates' states), 'k2p' (Kimura 2-parameter, requires
+              'tsits') or 'poisson' (for proteins)
+
+    Distances that are undefined (no sites or saturated) are -1, as written
+    by PHYLIP's distance programs.
+    """
+    sites = np.asarray(sites, dtype=float)
+    undefined = sites == 0
+    sites = np.where(undefined, 1.0, sites)
+    p = diffs / sites
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "p":
+            dists = p
+        elif method == "jc":
+            b = 1.0 - 1.0 / nstates
+            arg = 1.0 - p / b
+            undefined |= arg <= 0
+            dists = -b * np.log(arg)
+        elif method == "k2p":
+            if tsits is None:
+                raise Exception("K2P distances require transition counts")
+            tsit = tsits / sites
+            tver = p - tsit
+            arg1 = 1.0 - 2.0 * tsit - tver
+            arg2 = 1.0 - 2.0 * tver
+            undefined |= (arg1 <= 0) | (arg2 <= 0)
+            dists = -.5 * np.log(arg1) - .25 * np.log(arg2)
+        elif method == "poisson":
+            arg = 1.0 - p
+            undefined |= arg <= 0
+            dists = -np.log(arg)
+        else:
+            raise Exception("unknown distance method '%s'" % method)
+
+    dists = np.where(undefined, -1.0, dists)
+    dists[dists == 0] = 0.0  # no negative zeros
+    return dists
+
+
+def _calc_dist_rows(aln, start, end, method, weights):
+    sites, diffs, tsits = count_diffs(aln, weights, slice(start, end),
+                                      transitions=(method == "k2p"))
+    dists = correct_dists(sites, diffs, tsits, method, aln.get_nstates())
+    dists[np.arange(end - start), np.arange(start, end)] = 0.0
+    return dists
+
+
+def calc_dist_matrix(aln, method="p", weights=None, pairwise=True,
+                     maxdist=None, nproc=1, blocksize=None):
+    """
+    Returns a matrix of pairwise distances between the sequences of 'aln'
+
+    method   -- distance correction (see correct_dists())
+    weights  -- column weights (e.g. of a BootstrapSampler replicate)
+    pairwise -- if True, columns with missing data are ignored only for the
+                pairs of sequences that lack them (pairwise deletion),
+                otherwise they are ignored for every pair
+    maxdist  -- if given, undefined distances and distances above 'maxdist'
+                are replaced as by phylip.correct_dist_matrix()
+
+    'aln' may be an AlignMatrix or a SitePatterns ('weights' are still per
+    column).  Rows of the matrix are computed in blocks by 'nproc' worker
+    processes.  The matrix is returned as a list of lists, in the order of
+    aln.names, for phylip.write_dist_matrix().
+    """
+    if method not in DIST_METHODS:
+        raise Exception("unknown distance method '%s'" % method)
+    aln, weights = _get_pattern_align(aln, weights)
+
+    nseqs = len(aln.names)
+    if not pairwise:
+        complete = (aln.matrix < aln.get_nstates()).all(0)
+        if weights is None:
+            weights = complete
+        weights = complete * np.asarray(weights)
+
+    if nproc > 1 and nseqs > 1:
+        if blocksize is None:
+            blocksize = max(1, -(-nseqs // (4 * nproc)))
+        blocks = [(start, min(start + blocksize, nseqs))
+                  for start in xrange(0, nseqs, blocksize)]
+        pool = Pool(nproc, _init_dist_worker,
+                    (aln, method, weights))
+        try:
+            dists = np.concatenate(pool.map(_dist_block, blocks))
+        finally:
+            pool.terminate()
+    else:
+        dists = _calc_dist_rows(aln, 0, nseqs, method, weights)
+
+    mat = dists.tolist()
+    if maxdist is not None:
+        mat = correct_dist_matrix(mat, maxdist)
+    return mat
+
+
+# alignment and distance options of a worker process (inherited when forked)
+_dist_args = None
+
+
+def _init_dist_worker(aln, method, weights):
+    global _dist_args
+    _dist_args = (aln, method, weights)
+
+
+def _dist_block(block):
+    aln, method, weights = _dist_args
+    return _calc_dist_rows(aln, block[0], block[1], method, weights)
+
+
+def _four_fold_table(alphabet):
+    # fourfold[code, k] is True if codon position k is four-fold degenerate
+    fourfold = np.zeros((len(alphabet) + 1, 3), dtype=bool)
+    for i, aa in enumerate(alphabet):
+        fourfold[i] = [fold == 4 for fold in seqlib.AA_DEGEN[aa]]
+    return fourfold
+
+
+def count_four_fold_diffs(seqs, names=None, rows=None):
+    """
+    Count the differences at four-fold degenerate sites between coding
+    sequences 'rows' (indices into 'names') and every sequence
+
+    As in alignlib.find_four_fold(), a codon column is used for a pair of
+    sequences if the codons of the pair code for one amino acid (ignoring
+    gaps and untranslated codons).  Returns (sites, diffs, tsits) as
+    count_diffs(), with the characters at the sites compared as is.
+    """
+    if names is None:
+        names = seqs.keys()
+    if rows is None:
+        rows = range(len(names))
+    aa_alphabet = "".join(sorted(aa for aa in seqlib.AA_DEGEN if aa != "-"))
+    fourfold = _four_fold_table(aa_alphabet)
+    aa_encoder = make_encoder(aa_alphabet)
+    aa_encoder[ord("X")] = aa_encoder[ord("x")] = len(aa_alphabet)
+
+    peps = np.array([encode_seq(seqlib.translate(seqs[name]),
+                                encoder=aa_encoder)
+                     for name in names])
+    valid = peps < len(aa_alphabet)
+    ncodons = peps.shape[1]
+    chars = np.array([np.frombuffer(seqs[name], dtype=np.uint8)
+                      for name in names]).reshape(len(names), ncodons, 3)
+    purine = np.zeros(256, dtype=np.int8)
+    for char in "AGag":
+        purine[ord(char)] = 1
+    for char in "CTct":
+        purine[ord(char)] = 2
+    purines = purine[chars]
+
+    shape = (len(rows), len(names))
+    sites = np.zeros(shape, dtype=int)
+    diffs = np.zeros(shape, dtype=int)
+    tsits = np.zeros(shape, dtype=int)
+    for k, i in enumerate(rows):
+        # codons that code for one amino acid in the pair
+        conserved = ((valid[i] | valid) &
+                     ((peps[i] == peps) | ~valid[i] | ~valid))
+        # four-fold positions of that amino acid
+        pep = np.where(valid[i], peps[i], peps)
+        mask = conserved[:, :, np.newaxis] & fourfold[pep]
+        diff = mask & (chars[i] != chars)
+        tsit = diff & (purines[i] != 0) & (purines[i] == purines)
+        sites[k] = mask.sum(2).sum(1)
+        diffs[k] = diff.sum(2).sum(1)
+        tsits[k] = tsit.sum(2).sum(1)
+
+    return sites, diffs, tsits
+
+
+def calc_four_fold_dist_matrix(seqs, names=None, method="p", maxdist=None):
+    """
+    Returns a matrix of distances at four-fold degenerate sites
+
+    'seqs' is a dict of aligned coding sequences.  Pairs without four-fold
+    sites have distance 1.0.  See calc_dist_matrix() for 'method' and
+    'maxdist'.
+    """
+    if names is None:
+        names = seqs.keys()
+    sites, diffs, tsits = count_four_fold_diffs(seqs, names)
+    dists = correct_dists(sites, diffs, tsits, method)
+    dists[sites == 0] = 1.0
+    np.fill_diagonal(dists, 0.0)
+
+    mat = dists.tolist()
+    if maxdist is not None:
+        mat = correct_dist_matrix(mat, maxdist)
+    return mat
@@ -0,0 +1,185 @@
+"""
+
+   Array-based simulation of sequence evolution down trees
+
+phylo.sim_seq_tree() evolves sequences one character at a time with
+stats.sample().  Here sequences are integer arrays (see seqarray) and all
+sites of a branch are drawn at once from the cumulative transition matrix
+of the branch.  Site-rate heterogeneity is supported through discrete rate
+categories, so each branch needs one transition matrix per category.
+
+Requires numpy.
+
+"""
+
+#=============================================================================
+# imports
+
+from __future__ import division
+
+# numpy imports
+import numpy as np
+
+# compbio imports
+from . import phylo
+from .seqarray import AlignMatrix, DNA
+
+
+#=============================================================================
+# site rates
+
+
+def discrete_gamma_rates(alpha, ncats=4):
+    """
+    Returns the mean rates of 'ncats' equally probable categories of a
+    gamma distribution with shape 'alpha' and mean 1 (Yang 1994).
+
+    Requires scipy.
+    """
+    import scipy.special
+    import scipy.stats
+
+    if ncats == 1:
+        return np.ones(1)
+
+    # category boundaries and the mean rate within each category
+    bounds = scipy.stats.gamma.ppf(np.arange(1, ncats) / ncats,
+                                   alpha, scale=1.0 / alpha)
+    cdf = scipy.special.gammainc(alpha + 1, bounds * alpha)
+    cdf = np.concatenate([[0.0], cdf, [1.0]])
+    rates = (cdf[1:] - cdf[:-1]) * ncats
+    return rates / rates.mean()
+
+
+def sample_site_rates(seqlen, alpha=None, ncats=4, rates=None,
+                      rng=np.random):
+    """
+    Sample a rate category for each site
+
+    Returns the tuple (cats, rates), where cats is an array of category
+    indices per site and rates is the array of category rates.  Rates are
+    either given or computed from a discrete gamma with shape 'alpha'.
+    """
+    if rates is None:
+        rates = discrete_gamma_rates(alpha, ncats)
+    rates = np.asarray(rates, dtype=float)
+    cats = rng.randint(0, len(rates), seqlen)
+    return cats, rates
+
+
+#=============================================================================
+# simulation
+
+
+def make_cum_matrix(matrix):
+    """
+    Returns the cumulative rows of a transition matrix, with the last
+    column fixed to 1.0 to guard against rounding
+    """
+    cum = np.cumsum(np.asarray(matrix, dtype=float), axis=1)
+    cum[:, -1] = 1.0
+    return cum
+
+
+def sample_states(seq, cum, rng=np.random):
+    """
+    Sample the next state of every site in 'seq' given the cumulative
+    transition matrix 'cum'
+    """
+    nstates = cum.shape[1]
+    u = rng.random_sample(len(seq))
+    seq2 = np.zeros(len(seq), dtype=np.uint8)
+    for j in xrange(nstates - 1):
+        seq2 += (u > cum[seq, j])
+    return seq2
+
+
+def sim_seq_branch(seq, time, matrix_func=phylo.make_jc_matrix,
+                   site_rates=None, rng=np.random):
+    """
+    Simulate an integer sequence evolving down one branch
+
+    seq         -- array of state codes
+    time        -- branch length
+    matrix_func -- function returning a transition matrix for a time span
+    site_rates  -- optional tuple (cats, rates) from sample_site_rates()
+    """
+    seq = np.asarray(seq)
+    if site_rates is None:
+        return sample_states(seq, make_cum_matrix(matrix_func(time)), rng)
+
+    cats, rates = site_rates
+    seq2 = np.empty(len(seq), dtype=np.uint8)
+    for cat, rate in enumerate(rates):
+        sites = np.nonzero(cats == cat)[0]
+        cum = make_cum_matrix(matrix_func(time * rate))
+        seq2[sites] = sample_states(seq[sites], cum, rng)
+    return seq2
+
+
+def sim_seq_tree(tree, seqlen, matrix_func=phylo.make_jc_matrix,
+                 bgfreq=(.25, .25, .25, .25), rootseq=None,
+                 keep_internal=False, site_rates=None, alphabet=DNA,
+                 rng=np.random):
+    """
+    Simulate the evolution of a sequence down a tree
+
+    tree          -- tree with branch lengths
+    seqlen        -- number of sites
+    matrix_func   -- function returning a transition matrix for a time
+                     span, e.g. phylo.make_jc_matrix or
+                     lambda t: phylo.make_hky_matrix(t, bgfreq, kappa)
+    bgfreq        -- root state frequencies
+    rootseq       -- optional root sequence (string or array of codes)
+    keep_internal -- if True, sequences of internal nodes are also returned
+    site_rates    -- optional tuple (cats, rates) from sample_site_rates()
+
+    Returns an AlignMatrix with rows in preorder.
+    """
+
+    # make root sequence
+    if rootseq is None:
+        rootseq = sample_states(np.zeros(seqlen, dtype=np.uint8),
+                                make_cum_matrix([bgfreq]), rng)
+    elif isinstance(rootseq, str):
+        rootseq = AlignMatrix.from_seqs({"root": rootseq}, alphabet).matrix[0]
+
+    names = []
+    rows = []
+    seqs = {tree.root: rootseq}
+
+    # evolve sequences down tree, keeping only the sequences of nodes
+    # whose children are not yet simulated
+    for node in tree.preorder():
+        seq = seqs.pop(node)
+        if node.is_leaf() or keep_internal:
+            names.append(node.name)
+            rows.append(seq)
+        for child in node.children:
+            seqs[child] = sim_seq_branch(seq, child.dist, matrix_func,
+                                         site_rates, rng)
+
+    return AlignMatrix(names, np.array(rows, dtype=np.uint8), alphabet)
+
+
+#=============================================================================
+
+if __name__ == "__main__":
+    from rasmus import treelib
+    from rasmus import util
+
+    #========================
+    # benchmark against phylo.sim_seq_tree
+
+    tree = treelib.parse_newick(
+        "(((a:.1,b:.2):.05,c:.3):.1,(d:.2,(e:.1,f:.1):.1):.1);")
+
+    seqlen = 10000
+    util.tic("phylo.sim_seq_tree (%d sites)" % seqlen)
+    phylo.sim_seq_tree(tree, seqlen)
+    util.toc()
+
+    seqlen = 1000000
+    util.tic("seqsim.sim_seq_tree (%d sites)" % seqlen)
+    sim_seq_tree(tree, seqlen)
+    util.toc()
@@ -10,6 +10,7 @@ import rasmus
 from rasmus import util
 from rasmus.linked_list import LinkedList
 from rasmus.sets import UnionFind
+from rasmus.sets import UnionFindArray
 
 from compbio.regionlib import Region
 
@@ -206,6 +207,125 @@ def cluster_hits(hits, radius1, radius2=None, samedir=False):
     return comps
 
 
+#=============================================================================
+# grid index of hits
+
+
+class HitGrid (object):
+    """
+    Spatial index of hits as points (query start, subject start)
+
+    Hits are bucketed by chromosome pair (query species and chrom, subject
+    species and chrom) and then by grid cell.  Cells are 2*radius plus the
+    longest hit of the bucket wide, so a window query visits at most 3x3
+    cells.  Hits need not be sorted.
+    """
+
+    def __init__(self, hits, radius1, radius2=None):
+        if radius2 is None:
+            radius2 = radius1
+
+        self.hits = list(hits)
+        self.radius1 = radius1
+        self.radius2 = radius2
+        self.buckets = {}
+
+        # group hits by chromosome pair
+        groups = {}
+        for i, hit in enumerate(self.hits):
+            groups.setdefault(self.get_key(hit), []).append(i)
+
+        # place hits into grid cells
+        for key, ids in groups.iteritems():
+            maxlen1 = max(self.hits[i][0].end - self.hits[i][0].start
+                          for i in ids)
+            maxlen2 = max(self.hits[i][1].end - self.hits[i][1].start
+                          for i in ids)
+            size1 = max(2 * radius1 + maxlen1, 1)
+            size2 = max(2 * radius2 + maxlen2, 1)
+            cells = {}
+            for i in ids:
+                a, b = self.hits[i][:2]
+                cells.setdefault((a.start // size1, b.start // size2),
+                                 []).append(i)
+            self.buckets[key] = (cells, size1, size2, maxlen1, maxlen2)
+
+    def get_key(self, hit):
+        return (hit[0].species, hit[0].seqname,
+                hit[1].species, hit[1].seqname)
+
+    def neighbors(self, i):
+        """
+        Returns the indices of the hits syntenic with hit i
+
+        A hit is syntenic if its query region overlaps the query region
+        of hit i extended by radius1 and its subject region overlaps the
+        subject region of hit i extended by radius2.
+        """
+        hits = self.hits
+        a, b = hits[i][:2]
+        cells, size1, size2, maxlen1, maxlen2 = \
+            self.buckets[self.get_key(hits[i])]
+
+        start1 = a.start - self.radius1
+        end1 = a.end + self.radius1
+        start2 = b.start - self.radius2
+        end2 = b.end + self.radius2
+
+        found = []
+        for x in xrange((start1 - maxlen1) // size1, end1 // size1 + 1):
+            for y in xrange((start2 - maxlen2) // size2, end2 // size2 + 1):
+                for j in cells.get((x, y), ()):
+                    a2, b2 = hits[j][:2]
+                    if (j != i and
+                            a2.end >= start1 and a2.start <= end1 and
+                            b2.end >= start2 and b2.start <= end2):
+                        found.append(j)
+        found.sort()
+        return found
+
+
+def find_syntenic_neighbors_grid(hits, radius, radius2=None):
+    """
+    For each hit find the neighboring hits that are syntenic.
+
+    Same as find_syntenic_neighbors(), but uses a HitGrid range query for
+    each hit instead of scanning sliding windows.  Hits need not be
+    sorted.
+    """
+
+    grid = HitGrid(hits, radius, radius2)
+    for i, hit in enumerate(grid.hits):
+        yield (hit, [grid.hits[j] for j in grid.neighbors(i)])
+
+
+def cluster_hits_grid(hits, radius1, radius2=None, samedir=False):
+    """
+    Cluster hits using a grid index
+
+    hits -- iterable of tuples (region1, region2, extra)
+    radius -- radius of window in query genome
+    radius2 -- radius of window in subject genome (default=radius)
+    samdir -- whether or not to require genes in same direction
+
+    Returns a list of clusters, each a list of hits.
+    """
+
+    grid = HitGrid(hits, radius1, radius2)
+    comps = UnionFindArray(len(grid.hits))
+
+    for i, hit in enumerate(grid.hits):
+        for j in grid.neighbors(i):
+            # neighbors are symmetric, only look at each pair once
+            if j < i:
+                continue
+            if samedir and not samedir_hits(hit, grid.hits[j]):
+                continue
+            comps.union(i, j)
+
+    return [[grid.hits[i] for i in comp] for comp in comps.components()]
+
+
 def hits2synteny_block(hits):
     """
     Create a Synteny block from a cluster of hits
@@ -3,11 +3,14 @@
 
 
 
+from multiprocessing import Pool
+
 from rasmus import util
+from rasmus.progress import iter_progress
 
 from compbio import regionlib
 
-from . import SyntenyBlock, make_orth
+from . import SyntenyBlock, make_orth, write_synteny_blocks
 
 
 
@@ -167,7 +170,11 @@ def can_append_orth(db, block_orth, block_dir, orth, orthdb={}):
 
 
 
-def find_synteny(species1, species2, regions1, regions2, orths):
+def make_orth_lookups(orths):
+    """
+    Returns the ortholog and inparalog lookups (orthdb, inpardb) of a list
+    of ortholog pairs
+    """
 
     # ortholog db {gene1 -> orthologs of gene1}
     orthdb = util.Dict(default=set())
@@ -182,13 +189,30 @@ def find_synteny(species1, species2, regions1, regions2, orths):
     for gene, others in orthdb.iteritems():
         inpardb[gene] = orthdb[iter(others).next()]
 
+    return orthdb, inpardb
+
+
+def find_synteny(species1, species2, regions1, regions2, orths):
+
+    orthdb, inpardb = make_orth_lookups(orths)
 
     # make region db
     regiondb = regionlib.RegionDb(regions1 + regions2)
 
+    return find_synteny_blocks(species1, regiondb, orthdb, inpardb)
+
+
+def find_synteny_blocks(species1, regiondb, orthdb, inpardb):
+    """
+    Find synteny blocks along the chromosomes of species1
+
+    regiondb -- RegionDb containing the genes of both species
+    orthdb   -- ortholog lookup from make_orth_lookups()
+    inpardb  -- inparalog lookup from make_orth_lookups()
+    """
+
     # get chromosome sets
     chroms1 = regiondb.get_chroms(species1)
-    chroms2 = regiondb.get_chroms(species2)
 
 
     blocks = []
@@ -253,3 +277,111 @@ def find_synteny(species1, species2, regions1, regions2, orths):
             blocks[-1].recalc_regions(regiondb)
 
     return blocks
+
+
+
+#=============================================================================
+# multiple genomes
+
+
+class SyntenyIndex (object):
+    """
+    Genes and orthologs of many genomes indexed once for all species pairs
+
+    regions -- gene regions of all genomes (with 'ID' in data)
+    orths   -- ortholog pairs (gene1, gene2) between any genomes
+    """
+
+    def __init__(self, regions, orths):
+        self.regiondb = regionlib.RegionDb(regions)
+
+        # group ortholog pairs by species pair
+        self.pair_orths = {}
+        for gene1, gene2 in orths:
+            if not (self.regiondb.has_region(gene1) and
+                    self.regiondb.has_region(gene2)):
+                continue
+            species1 = self.regiondb.get_region(gene1).species
+            species2 = self.regiondb.get_region(gene2).species
+            if species1 == species2:
+                continue
+            key = tuple(sorted((species1, species2)))
+            self.pair_orths.setdefault(key, []).append((gene1, gene2))
+
+    def get_species(self):
+        return sorted(self.regiondb.get_species())
+
+    def get_species_pairs(self):
+        """Returns the species pairs with orthologs"""
+        return sorted(self.pair_orths)
+
+    def find_synteny(self, species1, species2):
+        """Returns the synteny blocks between species1 and species2"""
+        orths = self.pair_orths.get(tuple(sorted((species1, species2))), [])
+        orthdb, inpardb = make_orth_lookups(orths)
+        if not self.regiondb.has_species(species1):
+            return []
+        return find_synteny_blocks(species1, self.regiondb, orthdb, inpardb)
+
+
+# per-process index of the worker pool
+_index = None
+
+
+def _init_worker(index):
+    global _index
+    _index = index
+
+
+def _find_synteny_job(pair):
+    return pair, _index.find_synteny(*pair)
+
+
+def iter_synteny(index, pairs=None, nproc=1):
+    """
+    Find synteny blocks for many species pairs
+
+    index -- SyntenyIndex of all genomes
+    pairs -- species pairs (species1, species2), default all pairs with
+             orthologs
+    nproc -- number of worker processes
+
+    Iterates over ((species1, species2), blocks) in the order of pairs.
+    """
+
+    if pairs is None:
+        pairs = index.get_species_pairs()
+
+    if nproc > 1:
+        pool = Pool(nproc, _init_worker, (index,))
+        try:
+            for result in pool.imap(_find_synteny_job, pairs):
+                yield result
+        finally:
+            pool.terminate()
+    else:
+        for pair in pairs:
+            yield pair, index.find_synteny(*pair)
+
+
+def write_synteny(out, index, pairs=None, nproc=1, verbose=False):
+    """
+    Find synteny blocks for many species pairs and write them with
+    write_synteny_blocks() as each pair finishes
+
+    If 'verbose' is True, the throughput over pairs is reported.
+    Returns the number of blocks written.
+    """
+
+    if pairs is None:
+        pairs = index.get_species_pairs()
+
+    nblocks = 0
+    for pair, blocks in iter_progress(
+            iter_synteny(index, pairs, nproc), total=len(pairs),
+            name="synteny", enabled=verbose, unit="pairs",
+            status=lambda: "blocks=%d" % nblocks):
+        write_synteny_blocks(out, blocks)
+        out.flush()
+        nblocks += len(blocks)
+    return nblocks
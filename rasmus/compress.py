@@ -0,0 +1,601 @@
+"""
+
+   Compressed file streams
+
+Detects gzip, BGZF, bzip2 and xz files by their magic numbers and opens
+them as ordinary line streams.  Decompression runs outside of the reading
+thread: either in a multithreaded external program (pigz, lbzip2/pbzip2,
+xz -T0) connected by a pipe, or, if no such program is installed, in a
+background thread that decompresses ahead of the reader.
+
+BGZF files (as written by bgzip or BgzfWriter) support random access by
+uncompressed offset through a block index (see BgzfReader).
+
+"""
+
+#=============================================================================
+# imports
+
+import bz2
+import gzip
+import os
+import struct
+import subprocess
+import threading
+import zlib
+from bisect import bisect_right
+from distutils.spawn import find_executable
+from Queue import Queue
+
+
+#=============================================================================
+# format detection
+
+GZIP = "gzip"
+BGZF = "bgzf"
+BZIP2 = "bzip2"
+XZ = "xz"
+
+# file extensions used to choose a format when writing
+EXTENSIONS = {
+    ".gz": GZIP,
+    ".bgz": BGZF,
+    ".bz2": BZIP2,
+    ".xz": XZ
+}
+
+# multithreaded external programs for each format, in order of preference
+DECOMPRESSORS = {
+    GZIP: [["pigz", "-dc"], ["unpigz", "-c"]],
+    BGZF: [["bgzip", "-dc", "-@", "%(threads)d"], ["pigz", "-dc"]],
+    BZIP2: [["lbzip2", "-dc", "-n", "%(threads)d"], ["pbzip2", "-dc"]],
+    XZ: [["xz", "-dc", "-T", "%(threads)d"]]
+}
+COMPRESSORS = {
+    GZIP: [["pigz", "-c", "-%(level)d", "-p", "%(threads)d"]],
+    BGZF: [["bgzip", "-c", "-l", "%(level)d", "-@", "%(threads)d"]],
+    BZIP2: [["lbzip2", "-c", "-%(level)d", "-n", "%(threads)d"],
+            ["pbzip2", "-c", "-%(level)d", "-p%(threads)d"]],
+    XZ: [["xz", "-c", "-%(level)d", "-T", "%(threads)d"]]
+}
+
+
+def detect_compression(filename):
+    """
+    Returns the compression format of a file (GZIP, BGZF, BZIP2, XZ) from
+    its magic number, or None for an uncompressed file
+    """
+    infile = open(filename, "rb")
+    header = infile.read(18)
+    infile.close()
+    return detect_compression_header(header)
+
+
+def detect_compression_header(header):
+    """Returns the compression format of a file header (see above)"""
+
+    if header.startswith("\x1f\x8b"):
+        # BGZF is gzip with an extra field containing subfield 'BC'
+        if (len(header) >= 16 and ord(header[3]) & 4 and
+                header[12:14] == "BC"):
+            return BGZF
+        return GZIP
+    elif header.startswith("BZh"):
+        return BZIP2
+    elif header.startswith("\xfd7zXZ\x00"):
+        return XZ
+    return None
+
+
+def get_extension_compression(filename):
+    """Returns the compression format implied by a file extension"""
+    return EXTENSIONS.get(os.path.splitext(filename)[1])
+
+
+def find_program(programs, **args):
+    """Returns the first command line whose program is installed"""
+    for cmd in programs:
+        if find_executable(cmd[0]):
+            return [x % args for x in cmd]
+    return None
+
+
+def default_threads():
+    from multiprocessing import cpu_count
+    return cpu_count()
+
+
+#=============================================================================
+# streams
+
+
+class PipeReader (object):
+    """
+    Line stream reading the output of a decompression program
+
+    The program's exit status is checked at the end of the stream (and on
+    close), so corrupt or truncated input raises IOError.
+    """
+
+    def __init__(self, cmd, filename):
+        self.infile = open(filename, "rb")
+        self.proc = subprocess.Popen(cmd, stdin=self.infile,
+                                     stdout=subprocess.PIPE, bufsize=-1)
+        self.stream = self.proc.stdout
+        self.checked = False
+
+    def _check(self):
+        """Wait for the program and raise IOError if it failed"""
+        if self.checked:
+            return
+        self.checked = True
+        retcode = self.proc.wait()
+        if retcode != 0:
+            raise IOError("decompression failed with code %d" % retcode)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.stream.readline()
+        if not line:
+            self._check()
+            raise StopIteration
+        return line
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if size < 0 or len(data) < size:
+            self._check()
+        return data
+
+    def readline(self, size=-1):
+        line = self.stream.readline(size)
+        if not line:
+            self._check()
+        return line
+
+    def readlines(self):
+        return list(self)
+
+    def close(self):
+        # a program that has already exited must have succeeded, otherwise
+        # the reader stopped early and the program may fail on the closed
+        # pipe
+        finished = self.proc.poll() is not None
+        self.stream.close()
+        self.infile.close()
+        if finished:
+            self._check()
+        else:
+            self.proc.wait()
+            self.checked = True
+
+
+class PipeWriter (object):
+    """Stream writing through a compression program"""
+
+    def __init__(self, cmd, filename, mode="w"):
+        self.outfile = open(filename, mode.replace("b", "") + "b")
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                     stdout=self.outfile, bufsize=-1)
+        self.stream = self.proc.stdin
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        self.stream.writelines(lines)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+        retcode = self.proc.wait()
+        self.outfile.close()
+        if retcode != 0:
+            raise IOError("compression failed with code %d" % retcode)
+
+
+class ThreadedReader (object):
+    """
+    Line stream that reads ahead from another stream in a background thread
+
+    Chunks of 'chunksize' bytes are read by the thread into a queue of at
+    most 'maxchunks' chunks, so decompression in the thread overlaps with
+    parsing by the reader.
+    """
+
+    def __init__(self, stream, chunksize=1 << 20, maxchunks=8):
+        self.stream = stream
+        self.chunksize = chunksize
+        self.queue = Queue(maxchunks)
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.error = None
+        self.closed = False
+
+        self.thread = threading.Thread(target=self._read_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read_chunks(self):
+        try:
+            while not self.closed:
+                chunk = self.stream.read(self.chunksize)
+                self.queue.put(chunk)
+                if not chunk:
+                    break
+        except Exception, e:
+            self.error = e
+            self.queue.put("")
+
+    def _fill(self):
+        """Read the next chunk into the buffer, returns False at EOF"""
+        if self.eof:
+            return False
+        chunk = self.queue.get()
+        if self.error is not None:
+            raise self.error
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def readline(self, size=-1):
+        while True:
+            i = self.buf.find("\n", self.pos)
+            if i != -1:
+                end = i + 1
+                break
+            if not self._fill():
+                end = len(self.buf)
+                break
+        if size >= 0:
+            end = min(end, self.pos + size)
+        line = self.buf[self.pos:end]
+        self.pos = end
+        return line
+
+    def readlines(self):
+        return list(self)
+
+    def read(self, size=-1):
+        if size < 0:
+            while self._fill():
+                pass
+            size = len(self.buf) - self.pos
+        else:
+            while len(self.buf) - self.pos < size and self._fill():
+                pass
+        data = self.buf[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+        # unblock the reading thread
+        while self.thread.is_alive():
+            while not self.queue.empty():
+                self.queue.get()
+            self.thread.join(.01)
+        self.stream.close()
+
+
+def _open_lzma(filename, mode, level=6):
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise Exception("xz files need the xz program or the lzma module")
+    if "r" in mode:
+        return lzma.LZMAFile(filename, "rb")
+    else:
+        return lzma.LZMAFile(filename, mode, preset=level)
+
+
+def open_compressed(filename, mode="r", compress=None, level=6,
+                    threads=None):
+    """
+    Open a compressed file as a stream
+
+    filename -- name of file
+    mode     -- 'r' for reading, 'w' or 'a' for writing
+    compress -- format (GZIP, BGZF, BZIP2, XZ), by default detected from
+                the magic number when reading and the file extension
+                when writing
+    level    -- compression level when writing
+    threads  -- number of threads for external programs (default: cores)
+    """
+
+    if threads is None:
+        threads = default_threads()
+
+    if "r" in mode:
+        if compress is None:
+            compress = detect_compression(filename)
+        if compress is None:
+            return open(filename, mode)
+
+        cmd = find_program(DECOMPRESSORS[compress], threads=threads)
+        if cmd is not None:
+            return PipeReader(cmd, filename)
+
+        # decompress in a background thread
+        if compress in (GZIP, BGZF):
+            stream = gzip.open(filename, "rb")
+        elif compress == BZIP2:
+            stream = bz2.BZ2File(filename, "rb")
+        else:
+            stream = _open_lzma(filename, "rb")
+        return ThreadedReader(stream)
+
+    else:
+        if compress is None:
+            compress = get_extension_compression(filename)
+        if compress is None:
+            return open(filename, mode)
+
+        cmd = find_program(COMPRESSORS[compress], threads=threads,
+                           level=level)
+        if cmd is not None:
+            return PipeWriter(cmd, filename, mode)
+
+        if compress == GZIP:
+            return gzip.open(filename, mode.replace("b", "") + "b",
+                             compresslevel=level)
+        elif compress == BGZF:
+            return BgzfWriter(filename, mode, level=level)
+        elif compress == BZIP2:
+            if "a" in mode:
+                raise Exception("cannot append to bzip2 files")
+            return bz2.BZ2File(filename, "wb", compresslevel=level)
+        else:
+            return _open_lzma(filename, mode.replace("b", "") + "b",
+                              level=level)
+
+
+#=============================================================================
+# BGZF
+
+
+# maximum uncompressed bytes per BGZF block (as in bgzip)
+BGZF_BLOCK_SIZE = 0xff00
+
+BGZF_EOF = ("\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+            "\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+
+class BgzfWriter (object):
+    """Writes a BGZF file: gzip members of at most 64Kb each"""
+
+    def __init__(self, filename, mode="w", level=6):
+        self.out = open(filename, mode.replace("b", "") + "b")
+        self.level = level
+        self.buf = []
+        self.size = 0
+
+    def write(self, text):
+        self.buf.append(text)
+        self.size += len(text)
+        if self.size >= BGZF_BLOCK_SIZE:
+            data = "".join(self.buf)
+            end = len(data) - len(data) % BGZF_BLOCK_SIZE
+            for i in xrange(0, end, BGZF_BLOCK_SIZE):
+                self._write_block(data[i:i + BGZF_BLOCK_SIZE])
+            self.buf = [data[end:]]
+            self.size = len(data) - end
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.size > 0:
+            self._write_block("".join(self.buf))
+            self.buf = []
+            self.size = 0
+        self.out.flush()
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        bsize = len(cdata) + 25
+        self.out.write("\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC"
+                       "\x02\x00" + struct.pack("<H", bsize) + cdata +
+                       struct.pack("<II", zlib.crc32(data) & 0xffffffff,
+                                   len(data)))
+
+    def close(self):
+        self.flush()
+        self.out.write(BGZF_EOF)
+        self.out.close()
+
+
+def iter_bgzf_blocks(filename):
+    """
+    Iterate over the blocks of a BGZF file as tuples
+    (compressed offset, uncompressed offset, compressed size, data size)
+    """
+    infile = open(filename, "rb")
+    coffset = 0
+    uoffset = 0
+    try:
+        while True:
+            header = infile.read(12)
+            if len(header) == 0:
+                break
+            if len(header) < 12 or not header.startswith("\x1f\x8b"):
+                raise Exception("not a BGZF file '%s'" % filename)
+            xlen = struct.unpack("<H", header[10:12])[0]
+            extra = infile.read(xlen)
+
+            # find BC subfield with the block size
+            bsize = None
+            i = 0
+            while i + 4 <= len(extra):
+                slen = struct.unpack("<H", extra[i + 2:i + 4])[0]
+                if extra[i:i + 2] == "BC":
+                    bsize = struct.unpack("<H", extra[i + 4:i + 6])[0] + 1
+                i += 4 + slen
+            if bsize is None:
+                raise Exception("not a BGZF file '%s'" % filename)
+
+            infile.seek(coffset + bsize - 4)
+            isize = struct.unpack("<I", infile.read(4))[0]
+            yield coffset, uoffset, bsize, isize
+            coffset += bsize
+            uoffset += isize
+    finally:
+        infile.close()
+
+
+def make_bgzf_index(filename):
+    """
+    Returns the block index of a BGZF file as a list of
+    (compressed offset, uncompressed offset) pairs
+    """
+    return [(coffset, uoffset)
+            for coffset, uoffset, bsize, isize in iter_bgzf_blocks(filename)
+            if isize > 0]
+
+
+def write_bgzf_index(filename, index):
+    """Write a BGZF index in the format of bgzip's .gzi files"""
+    out = open(filename, "wb")
+    # .gzi files omit the first block at (0, 0)
+    entries = [entry for entry in index if entry != (0, 0)]
+    out.write(struct.pack("<Q", len(entries)))
+    for coffset, uoffset in entries:
+        out.write(struct.pack("<QQ", coffset, uoffset))
+    out.close()
+
+
+def read_bgzf_index(filename):
+    """Read a BGZF index written by bgzip -i or write_bgzf_index()"""
+    infile = open(filename, "rb")
+    count = struct.unpack("<Q", infile.read(8))[0]
+    index = [(0, 0)]
+    for i in xrange(count):
+        index.append(struct.unpack("<QQ", infile.read(16)))
+    infile.close()
+    return index
+
+
+class BgzfReader (object):
+    """
+    Random access into a BGZF file by uncompressed offset
+
+    The block index is read from 'filename.gzi' if it exists, otherwise
+    it is built by scanning the block headers (and saved if 'save_index'
+    is True).
+    """
+
+    def __init__(self, filename, index=None, save_index=False):
+        self.infile = open(filename, "rb")
+        if index is None:
+            indexfile = filename + ".gzi"
+            if os.path.exists(indexfile):
+                index = read_bgzf_index(indexfile)
+            else:
+                index = make_bgzf_index(filename)
+                if save_index:
+                    write_bgzf_index(indexfile, index)
+        self.index = index
+        self.uoffsets = [uoffset for coffset, uoffset in index]
+
+        self.block = -1
+        self.data = ""
+        self.blockpos = 0
+
+    def _load_block(self, block):
+        coffset = self.index[block][0]
+        self.infile.seek(coffset)
+        header = self.infile.read(18)
+        xlen = struct.unpack("<H", header[10:12])[0]
+        bsize = struct.unpack("<H", header[16:18])[0] + 1
+        self.infile.seek(coffset + 12 + xlen)
+        cdata = self.infile.read(bsize - 12 - xlen - 8)
+        self.data = zlib.decompress(cdata, -15)
+        self.block = block
+
+    def seek(self, offset):
+        """Move to an uncompressed offset"""
+        block = max(bisect_right(self.uoffsets, offset) - 1, 0)
+        if block != self.block:
+            self._load_block(block)
+        self.blockpos = offset - self.uoffsets[block]
+
+    def tell(self):
+        if self.block < 0:
+            return 0
+        return self.uoffsets[self.block] + self.blockpos
+
+    def _next_block(self):
+        """Move to the next block, returns False at the end of the file"""
+        if self.block + 1 >= len(self.index):
+            return False
+        self._load_block(self.block + 1)
+        self.blockpos = 0
+        return True
+
+    def read(self, size=-1):
+        if self.block < 0:
+            self.seek(0)
+        chunks = []
+        while size != 0:
+            if self.blockpos >= len(self.data):
+                if not self._next_block():
+                    break
+                continue
+            end = (len(self.data) if size < 0
+                   else min(len(self.data), self.blockpos + size))
+            chunks.append(self.data[self.blockpos:end])
+            if size > 0:
+                size -= end - self.blockpos
+            self.blockpos = end
+        return "".join(chunks)
+
+    def readline(self):
+        if self.block < 0:
+            self.seek(0)
+        chunks = []
+        while True:
+            if self.blockpos >= len(self.data):
+                if not self._next_block():
+                    break
+                continue
+            i = self.data.find("\n", self.blockpos)
+            end = len(self.data) if i == -1 else i + 1
+            chunks.append(self.data[self.blockpos:end])
+            self.blockpos = end
+            if i != -1:
+                break
+        return "".join(chunks)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        self.infile.close()
@@ -27,6 +27,11 @@ def func_timer(func):
     return wrapper
 
 
+def func_profiler(func):
+    """Records calls of 'func' in the global profiler (see rasmus.timer)"""
+    return util.profile_section(func.__name__)(func)
+
+
 
 def func_defaults(** defaults):
 
@@ -3,6 +3,12 @@ import os
 import sys
 import time
 import threading
+import traceback
+from collections import deque
+from cPickle import dumps as pickle_dumps
+from multiprocessing import Pool
+from Queue import Queue, Empty
+from subprocess import Popen
 
 
 
@@ -548,6 +554,367 @@ class Pipeline:
                     return
 
 
+#=============================================================================
+# event-driven scheduling
+
+
+class StatusJournal (object):
+    """
+    Status of all jobs stored as records in a single journal file
+
+    Each record is a line 'jobname<tab>status'.  Records are buffered and
+    appended in batches, and the last record of a job determines its
+    status.  Partially written records are ignored when reading.
+    """
+
+    def __init__(self, filename, flushSize=1000):
+        self.filename = filename
+        self.flushSize = flushSize
+        self.buffer = []
+
+    def read(self):
+        """Returns a dict from job name to its last recorded status"""
+        status = {}
+        if os.path.exists(self.filename):
+            for line in open(self.filename):
+                if not line.endswith("\n"):
+                    continue
+                tokens = line[:-1].split("\t")
+                if len(tokens) == 2 and tokens[1] in VALID_STATUS:
+                    status[tokens[0]] = tokens[1]
+        return status
+
+    def write(self, name, status):
+        self.buffer.append("%s\t%s\n" % (name, status))
+        if len(self.buffer) >= self.flushSize:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        self.ensureDir()
+        out = open(self.filename, "a")
+        out.write("".join(self.buffer))
+        out.close()
+        self.buffer = []
+
+    def compact(self, status):
+        """Rewrite the journal with one record per job"""
+        self.ensureDir()
+        self.buffer = []
+        tmpfile = self.filename + ".tmp"
+        out = open(tmpfile, "w")
+        for name, stat in status.iteritems():
+            out.write("%s\t%s\n" % (name, stat))
+        out.close()
+        os.rename(tmpfile, self.filename)
+
+    def clear(self):
+        self.buffer = []
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def ensureDir(self):
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+
+def _runFunctionTask(task):
+    """Run a function task in a worker and return whether it succeeded"""
+    try:
+        return bool(task())
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+def _isPicklable(task):
+    try:
+        pickle_dumps(task, 2)
+        return True
+    except Exception:
+        return False
+
+
+class EventPipeline (Pipeline):
+    """
+    Pipeline with an event-driven scheduler
+
+    Jobs are released into a ready queue when their count of unfinished
+    dependencies reaches zero, so each completion only touches the
+    children of the finished job.  Shell jobs run as separate processes
+    (at most maxNumProc at a time), picklable function jobs run in a
+    process pool of 'nproc' workers and other function jobs run in
+    threads.  Completions are reported through one event queue and job
+    status is kept in a single journal file that is written in batches.
+
+    The interface is the same as Pipeline's.
+    """
+
+    def __init__(self,
+                 statusDir="pipeline",
+                 background=None,
+                 dispatch=None,
+                 nproc=None,
+                 journalFlush=1000):
+        Pipeline.__init__(self, statusDir, background, dispatch)
+
+        self.nproc = nproc        # size of function pool (None: all cpus)
+        self.journalFlush = journalFlush
+        self.journal = None
+        self.pool = None
+        self.events = Queue()     # (job, succeeded) completion events
+        self.running = {}         # jobs currently running
+        self.waits = {}           # number of unfinished parents of jobs
+        self.readyShell = deque()
+        self.readyFunc = deque()
+        self.nfunc = 0            # number of function jobs running
+
+    def getJournalFile(self):
+        return os.path.join(self.statusDir, "journal")
+
+    def init(self):
+        if self.journal is None:
+            self.journal = StatusJournal(self.getJournalFile(),
+                                         self.journalFlush)
+
+        # set all job states to UNDONE
+        if self.needReset:
+            self.journal.clear()
+            self.needReset = False
+
+        if not self.isInit:
+            self.readStatus(False)
+            self.pending = {}
+
+            for job in self.jobs.itervalues():
+                # job that were running are now back to undone
+                if job.status in (STATUS_RUNNING, STATUS_PENDING,
+                                  STATUS_ERROR):
+                    job.status = STATUS_UNDONE
+            self.journal.compact(dict((job.name, job.status)
+                                      for job in self.jobs.itervalues()))
+            self.isInit = True
+
+    def readStatus(self, retry=True):
+        """Read in status information for all jobs"""
+        status = self.journal.read()
+        for job in self.jobs.itervalues():
+            job.status = status.get(job.name, STATUS_UNDONE)
+
+    def readJobStatus(self, job, retry=True):
+        # job status is kept in memory and only written to the journal
+        pass
+
+    def writeJobStatus(self, job, status=None):
+        if status is not None:
+            job.status = status
+        self.journal.write(job.name, job.status)
+
+    def flushStatus(self):
+        self.journal.flush()
+
+    def runJob(self, job):
+        """Mark job and all of its unfinished ancestors as pending"""
+
+        stack = [job]
+        while stack:
+            job2 = stack.pop()
+            if job2.status == STATUS_ERROR:
+                job2.raiseError()
+            if job2.status != STATUS_UNDONE or job2 in self.pending:
+                continue
+            self.addPending(job2)
+            stack.extend(job2.parents)
+        return job.status
+
+    def undoJob(self, job):
+        """Make job and all depending jobs as 'incomplete'"""
+        self.init()
+        Pipeline.undoJob(self, job)
+
+    #=========================================
+    # scheduling
+
+    def schedule(self):
+        """Count the dependencies of newly pending jobs"""
+
+        for job in self.pending:
+            if job in self.waits or job in self.running:
+                continue
+            self.waits[job] = 0
+            for parent in job.parents:
+                if parent.status != STATUS_DONE:
+                    self.waits[job] += 1
+            if self.waits[job] == 0:
+                self.pushReady(job)
+
+        # start the worker pool before any job threads are started
+        if not self.testing and any(job.tasktype == "function"
+                                    for job in self.pending):
+            self.startPool()
+
+    def pushReady(self, job):
+        del self.waits[job]
+        if job.tasktype == "function":
+            self.readyFunc.append(job)
+        else:
+            self.readyShell.append(job)
+
+    def launchReady(self):
+        while self.readyFunc and (self.nproc is None or
+                                  self.nfunc < max(self.nproc, 1)):
+            self.execJob(self.readyFunc.popleft())
+        nshell = len(self.running) - self.nfunc
+        while self.readyShell and nshell < self.maxNumProc:
+            self.execJob(self.readyShell.popleft())
+            nshell += 1
+
+    def startPool(self):
+        if self.pool is None and self.nproc != 0:
+            self.pool = Pool(self.nproc)
+        return self.pool
+
+    def close(self):
+        """Shut down the function worker pool"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def execJob(self, job):
+        self.log("%s: BEGIN" % job.name)
+        self.writeJobStatus(job, STATUS_RUNNING)
+        self.running[job] = 1
+
+        if job.tasktype == "function":
+            self.nfunc += 1
+
+            if self.testing:
+                print "* running job '%s' (python function)\n" % job.name
+                self.events.put((job, True))
+
+            elif _isPicklable(job.task) and self.startPool():
+                def callback(ret, job=job):
+                    self.events.put((job, ret))
+                self.pool.apply_async(_runFunctionTask, (job.task,),
+                                      callback=callback)
+
+            else:
+                self.startThread(job, lambda: _runFunctionTask(job.task))
+
+        elif job.tasktype == "shell":
+            if self.testing:
+                print "* running job '%s':\n%s\n" % (job.name, job.task)
+                self.events.put((job, True))
+                return
+
+            if job.background:
+                # save task into script file
+                self.ensureStatusDir()
+                script = self.getJobScriptFile(job)
+                out = file(script, "w")
+                out.write(job.task)
+                out.close()
+
+                # expand dispatch
+                cmd = job.dispatch
+                cmd = cmd.replace("$JOBNAME", job.name)
+                cmd = cmd.replace("$SCRIPT", script)
+                cmd = cmd.replace("$STATUSDIR", self.statusDir)
+            else:
+                cmd = job.task
+
+            self.startThread(
+                job, lambda: Popen(["bash", "-c", cmd]).wait() == 0)
+
+        else:
+            raise PipelineException("unknown tasktype '%s'" % job.tasktype)
+
+    def startThread(self, job, func):
+        """Run func() in a thread and report its result as an event"""
+        def run():
+            self.events.put((job, func()))
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def finishJob(self, job, succeeded):
+        del self.running[job]
+        if job.tasktype == "function":
+            self.nfunc -= 1
+        self.removePending(job)
+
+        if not succeeded:
+            self.log("%s: ERROR" % job.name)
+            self.writeJobStatus(job, STATUS_ERROR)
+            return
+
+        self.log("%s: END" % job.name)
+        self.writeJobStatus(job, STATUS_DONE)
+        job.notifyChildren()
+
+        # release children whose dependencies are all done
+        for child in job.children:
+            if child in self.waits:
+                self.waits[child] -= 1
+                if self.waits[child] == 0:
+                    self.pushReady(child)
+
+    def process(self, poll=False):
+        """
+        Run all pending jobs
+
+        If poll is True, start ready jobs, handle the jobs that have
+        finished and return without waiting.
+        """
+        self.init()
+        self.schedule()
+        error = None
+
+        try:
+            while True:
+                if error is None:
+                    self.launchReady()
+                self.flushStatus()
+                if len(self.running) == 0:
+                    break
+
+                # wait for the next event, then handle all queued events
+                events = []
+                try:
+                    if poll:
+                        events.append(self.events.get_nowait())
+                    else:
+                        events.append(self.events.get(True, 1.0))
+                    while True:
+                        events.append(self.events.get_nowait())
+                except Empty:
+                    pass
+                if poll and not events:
+                    break
+
+                for job, succeeded in events:
+                    self.finishJob(job, succeeded)
+                    if not succeeded and error is None:
+                        error = job
+
+                if poll:
+                    if error is None:
+                        self.launchReady()
+                    break
+        finally:
+            self.flushStatus()
+            if not poll and len(self.running) == 0:
+                self.close()
+
+        if error is not None:
+            error.raiseError()
+
+
+#=============================================================================
+
 def hasLsf():
     """Returns True only if LSF is available"""
 
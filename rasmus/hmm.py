@@ -21,6 +21,7 @@ import random
 from math import log, exp
 
 from rasmus import util, stats
+from rasmus.progress import iter_progress
 from stats import logadd
 
 
@@ -139,16 +140,11 @@ def viterbi(model, n, verbose=False):
     probs.append([model.prob_prior(0, j) + model.prob_emission(0, j)
                   for j in xrange(nstates)])
     ptrs.append([-1] * nstates)
-    
-    if n > 20:
-        step = (n // 20)
-    else:
-        step = 1
-    
+
     # loop through positions
-    for i in xrange(1, n):
-        if verbose and i % step == 0:
-            print " viterbi iter=%d/%d, lnl=%f" % (i+1, n, max(probs[-1]))
+    for i in iter_progress(xrange(1, n), name="viterbi", enabled=verbose,
+                           unit="positions",
+                           status=lambda: "lnl=%f" % max(probs[-1])):
 
         nstates1 = model.get_num_states(i-1)
         nstates2 = model.get_num_states(i)
@@ -192,17 +188,12 @@ def forward_algorithm(model, n, verbose=False):
     nstates = model.get_num_states(0)
     probs.append([model.prob_prior(0, j) + model.prob_emission(0, j)
                   for j in xrange(nstates)])
-    
-    if n > 20:
-        step = (n // 20)
-    else:
-        step = 1
-    
+
     # loop through positions
     nstates1 = nstates
-    for i in xrange(1, n):
-        if verbose and i % step == 0:
-            print " forward iter=%d/%d, lnl=%f" % (i+1, n, max(probs[i-1]))
+    for i in iter_progress(xrange(1, n), name="forward", enabled=verbose,
+                           unit="positions",
+                           status=lambda: "lnl=%f" % max(probs[-1])):
 
         nstates2 = model.get_num_states(i)
         col1 = probs[i-1]
@@ -230,17 +221,12 @@ def iter_forward_algorithm(model, n, verbose=False):
     nstates = model.get_num_states(0)
     col1 = [model.prob_prior(0, j) + model.prob_emission(0, j)
             for j in xrange(nstates)]
-    
-    if n > 20:
-        step = (n // 20)
-    else:
-        step = 1
-    
+
     # loop through positions
     nstates1 = nstates
-    for i in xrange(1, n):
-        if verbose and i % step == 0:
-            print " forward iter=%d/%d, lnl=%f" % (i+1, n, max(col1))
+    for i in iter_progress(xrange(1, n), name="forward", enabled=verbose,
+                           unit="positions",
+                           status=lambda: "lnl=%f" % max(col1)):
 
         nstates2 = model.get_num_states(i)
 
@@ -270,16 +256,12 @@ def backward_algorithm(model, n, verbose=False):
         probs.append(None)
     probs[n-1] = [model.prob_prior(n-1, j) + model.prob_emission(n-1, j)
                   for j in xrange(nstates)]
-    
-    if n > 20:
-        step = (n // 20)
-    else:
-        step = 1
-    
+
     # loop through positions
-    for i in xrange(n-2, -1, -1):
-        if verbose and i % step == 0:
-            print " backward iter=%d/%d, lnl=%f" % (i+1, n, max(probs[i+1]))
+    col2 = probs[n-1]
+    for i in iter_progress(xrange(n-2, -1, -1), name="backward",
+                           enabled=verbose, unit="positions",
+                           status=lambda: "lnl=%f" % max(col2)):
 
         nstates1 = model.get_num_states(i)
         nstates2 = model.get_num_states(i+1)
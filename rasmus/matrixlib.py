@@ -22,12 +22,29 @@
     ilmat -- iterate sparse label matrix
              [(labeli, labelj, v), ...]
 
+  Binary formats (require numpy, both can be memory mapped):
+
+    bdmat -- binary dense matrix, a numpy .npy file
+
+    csr   -- binary compressed sparse row matrix
+
+  Row and column labels of binary matrices are stored in the sidecar files
+  FILENAME.rowlabels and FILENAME.collabels (see write_labels).
+
 
 """
 
 # python libs
 from collections import defaultdict
 import copy
+from itertools import chain, islice
+import os
+import shutil
+import struct
+
+# rasmus libs
+from rasmus import delimlib
+from rasmus import util
 
 
 
@@ -163,7 +180,7 @@ def ilmat2imat(ilmat, rowlabels, collabels):
     """
 
     rowlookup = dict((l, i) for i, l in enumerate(rowlabels))
-    collookup = dict((l, i) for i, l in enumerate(rowlabels))
+    collookup = dict((l, i) for i, l in enumerate(collabels))
 
     for r, c, v in ilmat:
         yield rowlookup[r], collookup[c], v
@@ -286,6 +303,37 @@ def parse_dmat_header(first_row, header, rows):
     return nrows, ncols
 
 
+def _read_dmat_header(infile, header):
+    """
+    Reads the optional header of a dense matrix.
+
+    Returns nrows, ncols, the column delimiter if the data is tab
+    delimited (None otherwise), and an iterator of the data lines.
+    """
+    lines = iter(infile)
+    head = list(islice(lines, 2))
+    nrows, ncols = parse_dmat_header(head[0].split(), header,
+                                     [line.split() for line in head])
+    if nrows is not None:
+        # skip header
+        head = head[1:]
+    delim = "\t" if head and "\t" in head[0].strip() else None
+    return nrows, ncols, delim, chain(head, lines)
+
+
+def _iter_dmat_rows(lines, delim):
+    """Iterates over the data lines of a dense matrix as lists of floats"""
+    try:
+        for block in delimlib.iter_arrays(lines, delim=delim):
+            for row in block.tolist():
+                yield row
+    except ImportError:
+        # numpy is not available
+        for row in delimlib.iter_rows(lines, None, float):
+            if row:
+                yield row
+
+
 def read_dmat(infile, header=False):
     """
     Reads dense matrix
@@ -294,15 +342,9 @@ def read_dmat(infile, header=False):
     """
 
     # read file
-    rows = [line.rstrip().split() for line in infile]    
-    nrows, ncols = parse_dmat_header(rows[0], header, rows)
-    if nrows is not None:
-        # skip header
-        rows = rows[1:]
-    
-    # convert data
-    data = [[float(v) for v in row] for row in rows]
-    
+    nrows, ncols, delim, lines = _read_dmat_header(infile, header)
+    data = list(_iter_dmat_rows(lines, delim))
+
     # assert that all rows have the same number of values
     assert len(set(map(len, data))) == 1
 
@@ -316,7 +358,7 @@ def read_dmat(infile, header=False):
         ncols = len(data[0])
     else:
         assert ncols == len(data[0]), "wrong number of columns"
-    
+
     # return data
     nnz = nrows * ncols
     return nrows, ncols, nnz, data
@@ -330,21 +372,18 @@ def iter_dmat(infile, header=False):
 
     Returns nrows, ncols, nnz, imat (index matrix interator)
     """
-    
-    # read file
-    rows = [line.rstrip().split() for line in infile]    
-    nrows, ncols = parse_dmat_header(rows[0], header, rows)
+
+    # read header, the data rows are read as they are iterated
+    nrows, ncols, delim, lines = _read_dmat_header(infile, header)
     if nrows is not None:
-        # skip header
         nnz = nrows * ncols
-        rows = rows[1:]
     else:
         nnz = None
-    
+
     def data():
-        for i, row in enumerate(rows):
+        for i, row in enumerate(_iter_dmat_rows(lines, delim)):
             for j, v in enumerate(row):
-                yield i, j, float(v)
+                yield i, j, v
 
     return nrows, ncols, nnz, data()
 
@@ -535,3 +574,615 @@ def write_dlmat(out, dlmat):
             out.write(str(row[i]) + "\t")
         out.write(str(row[-1]) + "\n")
 
+
+
+#=============================================================================
+# streaming text output
+
+def iter_imat_rows(nrows, imat):
+    """
+    Groups a row-ordered index matrix iterator by row.
+
+    Yields (i, cols, vals) for every row i in range(nrows), including empty
+    rows.  Raises ValueError if 'imat' is not ordered by row.
+    """
+
+    i = 0
+    cols = []
+    vals = []
+    for i2, j, v in imat:
+        if i2 != i:
+            if i2 < i:
+                raise ValueError("index matrix is not ordered by row "
+                                 "(row %d after row %d)" % (i2, i))
+            yield i, cols, vals
+            for k in xrange(i + 1, i2):
+                yield k, [], []
+            i = i2
+            cols = []
+            vals = []
+        cols.append(j)
+        vals.append(v)
+
+    if nrows > 0:
+        yield i, cols, vals
+    for k in xrange(i + 1, nrows):
+        yield k, [], []
+
+
+def write_dmat_iter(out, nrows, ncols, nnz, imat, square=False, default=0):
+    """Write a dense matrix file from a row-ordered imat iterator"""
+
+    # write header
+    if square:
+        assert nrows == ncols
+        out.write("%d\n" % nrows)
+    else:
+        out.write("%d\t%d\n" % (nrows, ncols))
+
+    # write data one row at a time
+    for i, cols, vals in iter_imat_rows(nrows, imat):
+        row = [default] * ncols
+        for j, v in zip(cols, vals):
+            row[j] = v
+        out.write("\t".join("%f" % v for v in row))
+        out.write("\n")
+
+
+def write_rmat_iter(out, nrows, ncols, nnz, imat, square=False):
+    """
+    Write a compressed-row matrix from a row-ordered imat iterator
+    Columns are 1 indexed in file, but 0 index in memory
+    """
+
+    if square:
+        assert nrows == ncols
+        out.write("%d\t%d\n" % (nrows, nnz))
+    else:
+        out.write("%d\t%d\t%d\n" % (nrows, ncols, nnz))
+
+    for i, cols, vals in iter_imat_rows(nrows, imat):
+        out.write("\t".join("%d\t%f" % (j + 1, v)
+                            for j, v in sorted(zip(cols, vals))))
+        out.write("\n")
+
+
+def write_ilmat(out, ilmat):
+    """Writes a labeled sparse matrix from a labeled matrix iterator"""
+    for row, col, val in ilmat:
+        out.write("%s\t%s\t%f\n" % (row, col, val))
+
+
+def sort_imat(nrows, ncols, nnz, imat, chunksize=1 << 16):
+    """
+    Sorts an index matrix iterator by row and column.
+
+    Entries are held in compact numpy arrays rather than python tuples.
+    Repeated entries (same row, column and value) are kept once.
+    Returns nrows, ncols, nnz, imat (index matrix iterator)
+    Requires numpy.
+    """
+    import numpy as np
+
+    rows = []
+    cols = []
+    vals = []
+    for chunk in delimlib.iter_line_chunks(imat, chunksize):
+        i, j, v = zip(*chunk)
+        rows.append(np.array(i, dtype=np.int64))
+        cols.append(np.array(j, dtype=np.int64))
+        vals.append(np.array(v))
+    if not rows:
+        return nrows, ncols, 0, iter([])
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    vals = np.concatenate(vals)
+    order = np.lexsort((vals, cols, rows))
+    rows = rows[order]
+    cols = cols[order]
+    vals = vals[order]
+    del order
+
+    # drop repeated entries
+    keep = np.empty(len(rows), dtype=bool)
+    keep[0] = True
+    keep[1:] = ((rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1]) |
+                (vals[1:] != vals[:-1]))
+    if not keep.all():
+        rows = rows[keep]
+        cols = cols[keep]
+        vals = vals[keep]
+
+    def data():
+        for start in xrange(0, len(rows), chunksize):
+            end = start + chunksize
+            for entry in zip(rows[start:end].tolist(),
+                             cols[start:end].tolist(),
+                             vals[start:end].tolist()):
+                yield entry
+
+    return nrows, ncols, len(rows), data()
+
+
+#=============================================================================
+# matrix labels
+
+def write_labels(filename, rowlabels=None, collabels=None):
+    """Writes the row and column label sidecar files of a matrix file"""
+
+    if rowlabels is not None:
+        util.write_list(filename + ".rowlabels", rowlabels)
+    if collabels is not None:
+        util.write_list(filename + ".collabels", collabels)
+
+
+def read_labels(filename):
+    """
+    Reads the row and column label sidecar files of a matrix file.
+    Returns rowlabels, collabels (None for missing files)
+    """
+
+    labels = []
+    for ext in (".rowlabels", ".collabels"):
+        if os.path.exists(filename + ext):
+            labels.append(util.read_strings(filename + ext))
+        else:
+            labels.append(None)
+    return tuple(labels)
+
+
+#=============================================================================
+# binary dense matrix I/O
+#
+# A binary dense matrix (bdmat) is a numpy .npy file of a 2D array, so it
+# can also be opened with numpy.load().
+
+def open_bdmat(filename, mode="r"):
+    """
+    Memory maps a binary dense matrix as a numpy array.
+    mode -- 'r' for read-only, 'r+' for read-write, 'c' for copy-on-write
+    """
+    import numpy as np
+    return np.load(filename, mmap_mode=mode)
+
+
+def read_bdmat(filename, mmap=True):
+    """
+    Reads a binary dense matrix
+    Returns nrows, ncols, nnz, mat (numpy array)
+    """
+    import numpy as np
+
+    mat = np.load(filename, mmap_mode="r" if mmap else None)
+    nrows, ncols = mat.shape
+    return nrows, ncols, nrows * ncols, mat
+
+
+def iter_bdmat_blocks(filename, blocksize=1000):
+    """Iterates over blocks of rows of a binary dense matrix"""
+    mat = open_bdmat(filename)
+    for start in xrange(0, mat.shape[0], blocksize):
+        yield mat[start:start + blocksize]
+
+
+def iter_bdmat(filename):
+    """
+    Iterates a binary dense matrix
+    Returns nrows, ncols, nnz, imat (index matrix iterator)
+    """
+
+    nrows, ncols, nnz, mat = read_bdmat(filename)
+
+    def data():
+        i = 0
+        for block in iter_bdmat_blocks(filename):
+            for row in block.tolist():
+                for j, v in enumerate(row):
+                    yield i, j, v
+                i += 1
+
+    return nrows, ncols, nnz, data()
+
+
+def write_bdmat(filename, nrows, ncols, nnz, imat, dtype=float,
+                chunksize=1 << 16):
+    """
+    Write a binary dense matrix from an index matrix iterator.
+
+    Entries may come in any order.  Missing entries are zero.  Values are
+    written through a memory map, so the matrix is never held in memory.
+    """
+    import numpy as np
+
+    mat = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                    shape=(nrows, ncols))
+    for chunk in delimlib.iter_line_chunks(imat, chunksize):
+        i, j, v = zip(*chunk)
+        mat[i, j] = v
+    mat.flush()
+    del mat
+
+
+def write_bdmat_blocks(filename, blocks, nrows=None, ncols=None,
+                       dtype=float):
+    """
+    Write a binary dense matrix from an iterator of blocks of rows.
+
+    If nrows is not known, the rows are first written to a temporary file.
+    """
+    import numpy as np
+
+    dtype = np.dtype(dtype)
+    if nrows is not None:
+        mat = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                        shape=(nrows, ncols))
+        i = 0
+        for block in blocks:
+            mat[i:i + len(block)] = block
+            i += len(block)
+        assert i == nrows, "wrong number of rows"
+        mat.flush()
+        del mat
+        return
+
+    # count rows while writing raw values
+    tmpfile = filename + ".tmp"
+    out = open(tmpfile, "wb")
+    nrows = 0
+    for block in blocks:
+        block = np.asarray(block, dtype=dtype)
+        if ncols is None:
+            ncols = block.shape[1]
+        assert block.shape[1] == ncols, "wrong number of columns"
+        block.tofile(out)
+        nrows += len(block)
+    out.close()
+
+    # prepend .npy header
+    out = open(filename, "wb")
+    np.lib.format.write_array_header_1_0(out, {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": False,
+        "shape": (nrows, ncols or 0)})
+    shutil.copyfileobj(open(tmpfile, "rb"), out)
+    out.close()
+    os.remove(tmpfile)
+
+
+#=============================================================================
+# binary compressed sparse row matrix I/O
+#
+# File layout (little endian):
+#
+#   header   64 bytes: magic, nrows, ncols, nnz, index dtype, value dtype
+#   indptr   int64[nrows + 1]  row i has entries indptr[i]:indptr[i+1]
+#   indices  index dtype[nnz]  column of each entry
+#   data     value dtype[nnz]  value of each entry
+#
+# This is the same layout as scipy.sparse.csr_matrix.
+
+CSR_MAGIC = "CSRMAT01"
+_CSR_HEADER = struct.Struct("<8sqqq8s8s")
+CSR_HEADER_SIZE = 64
+
+
+def _csr_offsets(nrows, nnz, index_dtype):
+    indptr = CSR_HEADER_SIZE
+    indices = indptr + 8 * (nrows + 1)
+    data = indices + index_dtype.itemsize * nnz
+    return indptr, indices, data
+
+
+def read_csr_header(filename):
+    """
+    Reads the header of a binary CSR matrix
+    Returns nrows, ncols, nnz, index_dtype, value_dtype
+    """
+    import numpy as np
+
+    infile = open(filename, "rb")
+    header = infile.read(_CSR_HEADER.size)
+    infile.close()
+
+    if len(header) < _CSR_HEADER.size or not header.startswith(CSR_MAGIC):
+        raise ValueError("'%s' is not a CSR matrix file" % filename)
+    magic, nrows, ncols, nnz, index_dtype, value_dtype = \
+        _CSR_HEADER.unpack(header)
+    return (nrows, ncols, nnz, np.dtype(index_dtype.rstrip("\0")),
+            np.dtype(value_dtype.rstrip("\0")))
+
+
+def read_csr(filename, mmap=True):
+    """
+    Reads a binary CSR matrix
+    Returns nrows, ncols, nnz, (indptr, indices, data)
+
+    The three arrays are memory mapped unless mmap is False.  They can be
+    given directly to scipy.sparse.csr_matrix((data, indices, indptr)).
+    """
+    import numpy as np
+
+    nrows, ncols, nnz, index_dtype, value_dtype = read_csr_header(filename)
+    offsets = _csr_offsets(nrows, nnz, index_dtype)
+    arrays = []
+    for dtype, offset, size in zip(
+            (np.dtype("<i8"), index_dtype, value_dtype), offsets,
+            (nrows + 1, nnz, nnz)):
+        if size == 0:
+            arrays.append(np.zeros(0, dtype=dtype))
+        elif mmap:
+            arrays.append(np.memmap(filename, dtype=dtype, mode="r",
+                                    offset=offset, shape=(size,)))
+        else:
+            infile = open(filename, "rb")
+            infile.seek(offset)
+            arrays.append(np.fromfile(infile, dtype=dtype, count=size))
+            infile.close()
+
+    return nrows, ncols, nnz, tuple(arrays)
+
+
+def get_csr_row(csr, i):
+    """
+    Returns the columns and values of row i of a CSR matrix
+    csr -- (indptr, indices, data) as returned by read_csr
+    """
+    indptr, indices, data = csr
+    start, end = indptr[i], indptr[i + 1]
+    return indices[start:end], data[start:end]
+
+
+def iter_csr(filename):
+    """
+    Iterates a binary CSR matrix
+    Returns nrows, ncols, nnz, imat (index matrix iterator)
+    """
+
+    nrows, ncols, nnz, csr = read_csr(filename)
+    indptr, indices, values = csr
+
+    def data():
+        for i in xrange(nrows):
+            cols, vals = get_csr_row(csr, i)
+            for j, v in zip(cols.tolist(), vals.tolist()):
+                yield i, j, v
+
+    return nrows, ncols, nnz, data()
+
+
+def write_csr(filename, nrows, ncols, nnz, imat, dtype=float, sort=False,
+              chunksize=1 << 16):
+    """
+    Write a binary CSR matrix from an index matrix iterator.
+
+    Entries must be ordered by row unless sort is True, in which case they
+    are sorted first (see sort_imat).  The nnz argument is not needed;
+    entries are counted while they are written.  Column indices are
+    written as soon as they are read and values are spooled to a temporary
+    file, so the matrix is never held in memory.
+    """
+    import numpy as np
+
+    if sort:
+        nrows, ncols, nnz, imat = sort_imat(nrows, ncols, nnz, imat,
+                                            chunksize)
+
+    index_dtype = np.dtype("<i4" if ncols < 2**31 else "<i8")
+    value_dtype = np.dtype(dtype).newbyteorder("<")
+    counts = np.zeros(nrows + 1, dtype=np.int64)
+
+    out = open(filename, "wb")
+    out.seek(_csr_offsets(nrows, 0, index_dtype)[1])
+    tmpfile = filename + ".tmp"
+    valuesfile = open(tmpfile, "wb")
+
+    nnz = 0
+    last = 0
+    for chunk in delimlib.iter_line_chunks(imat, chunksize):
+        rows, cols, vals = zip(*chunk)
+        rows = np.array(rows, dtype=np.int64)
+        if rows[0] < last or (len(rows) > 1 and
+                              (np.diff(rows) < 0).any()):
+            out.close()
+            valuesfile.close()
+            os.remove(tmpfile)
+            os.remove(filename)
+            raise ValueError("index matrix is not ordered by row, "
+                             "use sort=True")
+        last = rows[-1]
+        counts[1:] += np.bincount(rows, minlength=nrows)[:nrows]
+        np.array(cols, dtype=index_dtype).tofile(out)
+        np.array(vals, dtype=value_dtype).tofile(valuesfile)
+        nnz += len(rows)
+    valuesfile.close()
+
+    # append values
+    shutil.copyfileobj(open(tmpfile, "rb"), out)
+    os.remove(tmpfile)
+
+    # write header and row pointers
+    out.seek(0)
+    out.write(_CSR_HEADER.pack(CSR_MAGIC, nrows, ncols, nnz,
+                               index_dtype.str, value_dtype.str).ljust(
+                                   CSR_HEADER_SIZE, "\0"))
+    np.cumsum(counts).astype("<i8").tofile(out)
+    out.close()
+
+
+#=============================================================================
+# streaming conversion between formats
+
+MATRIX_FORMATS = ["dmat", "imat", "rmat", "lmat", "bdmat", "csr"]
+
+# formats whose entries are read in row order
+ROW_ORDERED_FORMATS = set(["dmat", "rmat", "bdmat", "csr"])
+
+
+def iter_matrix(filename, fmt, rowlabels=None, collabels=None):
+    """
+    Iterates a matrix file in any format.
+
+    filename -- filename, or a stream for text formats
+    fmt -- one of MATRIX_FORMATS
+    rowlabels, collabels -- labels for an 'lmat'.  If not given, they are
+                            read from the label sidecar files or found by
+                            reading 'filename' once.
+
+    Returns nrows, ncols, nnz, imat, rowlabels, collabels
+    """
+
+    if fmt in ("dmat", "imat", "rmat"):
+        infile = util.open_stream(filename)
+        reader = {"dmat": iter_dmat,
+                  "imat": iter_imat,
+                  "rmat": iter_rmat}[fmt]
+        if fmt == "dmat":
+            nrows, ncols, nnz, imat = reader(infile, header=True)
+        else:
+            nrows, ncols, nnz, imat = reader(infile)
+
+    elif fmt == "lmat":
+        if rowlabels is None or collabels is None:
+            if isinstance(filename, basestring):
+                labels = read_labels(filename)
+            else:
+                labels = (None, None)
+            if None in labels:
+                # find labels in a first pass
+                if not isinstance(filename, basestring):
+                    raise ValueError("labels are needed to convert an lmat "
+                                     "stream")
+                labels = ([], [])
+                seen = (set(), set())
+                for row, col, val in iter_lmat(util.open_stream(filename)):
+                    for label, lst, found in zip(
+                            (row, col), labels, seen):
+                        if label not in found:
+                            found.add(label)
+                            lst.append(label)
+            if rowlabels is None:
+                rowlabels = labels[0]
+            if collabels is None:
+                collabels = labels[1]
+
+        nrows = len(rowlabels)
+        ncols = len(collabels)
+        nnz = None
+        imat = ilmat2imat(iter_lmat(util.open_stream(filename)),
+                          rowlabels, collabels)
+
+    elif fmt in ("bdmat", "csr"):
+        reader = {"bdmat": iter_bdmat,
+                  "csr": iter_csr}[fmt]
+        nrows, ncols, nnz, imat = reader(filename)
+        labels = read_labels(filename)
+        if rowlabels is None:
+            rowlabels = labels[0]
+        if collabels is None:
+            collabels = labels[1]
+
+    else:
+        raise ValueError("unknown matrix format '%s'" % fmt)
+
+    return nrows, ncols, nnz, imat, rowlabels, collabels
+
+
+def convert_matrix(infile, informat, outfile, outformat,
+                   rowlabels=None, collabels=None, square=False):
+    """
+    Converts a matrix file from one format to another.
+
+    infile, outfile -- filenames (streams are allowed for text formats)
+    informat, outformat -- one of MATRIX_FORMATS.  Text dense matrices
+                           need a header, as written by write_dmat.
+    rowlabels, collabels -- matrix labels (see iter_matrix)
+    square -- write square headers for 'dmat' and 'rmat'
+
+    Entries are streamed from reader to writer.  Inputs that are not in
+    row order are sorted in compact arrays when the output needs rows
+    ('dmat', 'rmat' and 'csr'), which also drops repeated entries of an
+    'lmat'.  Other outputs keep entries as they are read.
+    Labels of binary outputs are written to sidecar files.
+
+    Returns rowlabels, collabels (None if unknown)
+    """
+
+    for fmt in (informat, outformat):
+        if fmt not in MATRIX_FORMATS:
+            raise ValueError("unknown matrix format '%s'" % fmt)
+
+    # dense to dense conversions work on blocks of rows
+    if informat in ("dmat", "bdmat") and outformat in ("dmat", "bdmat"):
+        if informat == "dmat":
+            nrows, ncols, delim, lines = _read_dmat_header(
+                util.open_stream(infile), True)
+            blocks = delimlib.iter_arrays(lines, delim=delim)
+        else:
+            nrows, ncols, nnz, mat = read_bdmat(infile)
+            blocks = iter_bdmat_blocks(infile)
+            if rowlabels is None and collabels is None:
+                rowlabels, collabels = read_labels(infile)
+
+        if outformat == "bdmat":
+            write_bdmat_blocks(outfile, blocks, nrows, ncols)
+            write_labels(outfile, rowlabels, collabels)
+        else:
+            out = util.open_stream(outfile, "w")
+            _write_dmat_blocks(out, blocks, nrows, ncols, square)
+            out.close()
+        return rowlabels, collabels
+
+    nrows, ncols, nnz, imat, rowlabels, collabels = iter_matrix(
+        infile, informat, rowlabels, collabels)
+
+    # sort entries for outputs that are written by row
+    if informat not in ROW_ORDERED_FORMATS and \
+       outformat in ("dmat", "rmat", "csr"):
+        nrows, ncols, nnz, imat = sort_imat(nrows, ncols, nnz, imat)
+
+    if outformat == "bdmat":
+        write_bdmat(outfile, nrows, ncols, nnz, imat)
+        write_labels(outfile, rowlabels, collabels)
+        return rowlabels, collabels
+    elif outformat == "csr":
+        write_csr(outfile, nrows, ncols, nnz, imat)
+        write_labels(outfile, rowlabels, collabels)
+        return rowlabels, collabels
+
+    # headers of sparse text formats need the number of entries, which are
+    # counted in a first pass over an lmat file
+    if nnz is None and outformat in ("imat", "rmat"):
+        if informat == "lmat" and isinstance(infile, basestring):
+            nnz = sum(1 for entry in iter_lmat(util.open_stream(infile)))
+        else:
+            nrows, ncols, nnz, imat = sort_imat(nrows, ncols, nnz, imat)
+
+    out = util.open_stream(outfile, "w")
+    if outformat == "dmat":
+        write_dmat_iter(out, nrows, ncols, nnz, imat, square=square)
+    elif outformat == "imat":
+        write_imat(out, nrows, ncols, nnz, imat)
+    elif outformat == "rmat":
+        write_rmat_iter(out, nrows, ncols, nnz, imat, square=square)
+    elif outformat == "lmat":
+        if rowlabels is None or collabels is None:
+            raise ValueError("labels are needed to write an lmat")
+        write_ilmat(out, imat2ilmat(imat, rowlabels, collabels))
+    out.close()
+
+    return rowlabels, collabels
+
+
+def _write_dmat_blocks(out, blocks, nrows, ncols, square=False):
+    """Write a dense matrix file from blocks of rows"""
+    import numpy as np
+
+    if square:
+        assert nrows == ncols
+        out.write("%d\n" % nrows)
+    else:
+        out.write("%d\t%d\n" % (nrows, ncols))
+
+    for block in blocks:
+        np.savetxt(out, block, fmt="%f", delimiter="\t")
@@ -92,6 +92,21 @@ class ColorMap:
     def get_int(self, value):
         return [int(x*255) for x in self.get(value)]
     getInt = get_int
+
+
+    def get_array(self, values):
+        """
+        Returns the colors of an array of values as an array with an extra
+        last axis for the color channels.  Requires numpy.
+        """
+        import numpy as np
+        
+        keys = [row[0] for row in self.table]
+        colors = np.array([row[1] for row in self.table], dtype=float)
+        values = np.asarray(values, dtype=float)
+        return np.concatenate([
+            np.interp(values, keys, colors[:, k])[..., np.newaxis]
+            for k in xrange(colors.shape[1])], -1)
     
 
 def get_webcolor(color, maxval=1):
@@ -176,6 +191,43 @@ makeColorLegend = make_color_legend
 
 
 
+# heatmaps with more cells are drawn as a raster image by default
+HEATMAP_RASTER_CELLS = 10**6
+
+
+def _quantize_color(color):
+    """Round a color to the 8-bit channels written to svg"""
+    return tuple(int(255 * c) / 255. for c in color[:3]) + tuple(color[3:])
+
+
+def _iter_heatmap_rows(matrix, colormap, colors, mincutoff, maxcutoff):
+    """
+    Iterate over the colors of each heatmap row, with None for cells
+    outside of the cutoffs
+    """
+    use_array = colors is None and hasattr(colormap, "get_array")
+    
+    for i, row in enumerate(matrix):
+        if colors:
+            rowcolors = colors[i]
+        elif use_array:
+            try:
+                rowcolors = colormap.get_array(row).tolist()
+            except (ImportError, ValueError, TypeError):
+                use_array = False
+                rowcolors = map(colormap.get, row)
+        else:
+            rowcolors = map(colormap.get, row)
+        
+        rowcolors = map(_quantize_color, rowcolors)
+        if mincutoff or maxcutoff:
+            for j, val in enumerate(row):
+                if (mincutoff and val < mincutoff) or \
+                   (maxcutoff and val > maxcutoff):
+                    rowcolors[j] = None
+        yield rowcolors
+
+
 def heatmap(matrix, width=20, height=20, colormap=None, filename=None,
             rlabels=None, clabels=None, display=True, 
             xdir=1, ydir=1, 
@@ -194,7 +246,18 @@ def heatmap(matrix, width=20, height=20, colormap=None, filename=None,
             colors=None,
             strokeColors=None,
             valAnchor="start",
-            close=True):
+            close=True,
+            raster=None):
+    """
+    Draw a matrix as a heatmap in svg
+
+    Adjacent cells of the same color in a row are merged into one box and
+    boxes of the same color share a path.  Filenames ending with '.svgz'
+    are gzip compressed.  If 'raster' is True, or if it is None and the
+    matrix has more than HEATMAP_RASTER_CELLS cells, the cells are drawn
+    as an embedded PNG image with one pixel per cell (strokeColors are then
+    ignored).  Returns the svg.SvgWriter.
+    """
 
     from rasmus import util
     if display and (not close):
@@ -210,7 +273,8 @@ def heatmap(matrix, width=20, height=20, colormap=None, filename=None,
     # determine colormap
     if colors is None:
         if colormap is None:
-            colormap = rainbowColorMap(util.flatten(matrix))
+            colormap = rainbowColorMap(low=min(min(row) for row in matrix),
+                                       high=max(max(row) for row in matrix))
     
     # determine matrix size and orientation
     nrows = len(matrix)
@@ -240,30 +304,61 @@ def heatmap(matrix, width=20, height=20, colormap=None, filename=None,
     
     
     # begin svg
-    infile = util.open_stream(filename, "w")
-    s = svg.Svg(infile)
+    if isinstance(filename, basestring) and filename.endswith(".svgz"):
+        s = svg.SvgWriter(filename)
+    else:
+        s = svg.SvgWriter(util.open_stream(filename, "w"))
     s.beginSvg(ncols*width + 2*xmargin, nrows*height + 2*ymargin)
     
-    # draw matrix
-    for i in xrange(nrows):
-        for j in xrange(ncols):
-
-            if mincutoff and matrix[i][j] < mincutoff: continue
-            if maxcutoff and matrix[i][j] > maxcutoff: continue
-            
-            if colors:
-                color = colors[i][j]
-            else:
-                color = colormap.get(matrix[i][j])
-
-            if strokeColors:
-                strokeColor = strokeColors[i][j]
-            else:
-                strokeColor = color
+    rows = _iter_heatmap_rows(matrix, colormap, colors, mincutoff, maxcutoff)
+    if raster is None:
+        raster = nrows * ncols > HEATMAP_RASTER_CELLS
+    
+    if raster:
+        # draw matrix as an image with one pixel per cell
+        pixels = []
+        for rowcolors in rows:
+            pixel = bytearray(4 * ncols)
+            for j, color in enumerate(rowcolors):
+                if color is not None:
+                    alpha = color[3] if len(color) > 3 else 1.0
+                    k = 4 * (j if xdir == 1 else ncols - 1 - j)
+                    pixel[k:k+4] = [int(255 * color[0]), int(255 * color[1]),
+                                    int(255 * color[2]), int(255 * alpha)]
+            pixels.append(pixel)
+        if ydir == -1:
+            pixels.reverse()
+        
+        s.image(min(xstart, xstart + xdir*ncols*width),
+                min(ystart, ystart + ydir*nrows*height),
+                ncols*width, nrows*height, svg.encode_png(pixels))
+    
+    else:
+        # draw matrix, merging runs of cells of the same color
+        batch = svg.PathBatch(s)
+        for i, rowcolors in enumerate(rows):
+            y = ystart + ydir*i*height
+            j = 0
+            while j < ncols:
+                color = rowcolors[j]
+                if color is None:
+                    j += 1
+                    continue
+                
+                if strokeColors:
+                    strokeColor = strokeColors[i][j]
+                    k = j + 1
+                else:
+                    strokeColor = color
+                    k = j + 1
+                    while k < ncols and rowcolors[k] == color:
+                        k += 1
                 
-            s.rect(xstart + xdir*j*width, 
-                   ystart + ydir*i*height, 
-                   xdir*width, ydir*height, strokeColor, color)
+                batch.box(xstart + xdir*j*width, y,
+                          xdir*(k-j)*width, ydir*height,
+                          color, strokeColor)
+                j = k
+        batch.flush()
     
     # draw values
     if showVals:
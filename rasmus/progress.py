@@ -3,6 +3,9 @@
 
 # TODO: add curses support?
 
+from collections import deque
+import time
+
 from rasmus import util
 
 
@@ -135,9 +138,225 @@ class FancyProgressBar (Progress):
         self.pad.addstr(1, 1 + self.bar, "*" * amount)
         self.bar += amount
 
+###############################################################################
+# Throughput meters
+
+# stream for machine-readable progress records (see set_record_stream)
+_RECORD_STREAM = None
+
+RECORD_HEADERS = ["name", "count", "total", "elapsed", "rate", "recent_rate",
+                  "eta", "status"]
+
+
+def set_record_stream(out):
+    """
+    Set a stream that receives a machine-readable record for every progress
+    report of every ProgressMeter (None to disable).
+
+    Records are tab-delimited with a header line (see RECORD_HEADERS), so
+    the stream can be read with tablelib.read_table.  Times are in seconds
+    and rates in items per second.  Unknown values are written as 'nan'.
+    """
+    global _RECORD_STREAM
+    _RECORD_STREAM = out
+    if out is not None:
+        write_record_header(out)
+
+
+def write_record_header(out):
+    """Write the header line of a progress record stream"""
+    out.write("\t".join(RECORD_HEADERS) + "\n")
+    out.flush()
+
+
+def format_duration(secs):
+    """Format a duration in seconds for humans"""
+    if secs > 3600:
+        return "%.1fh" % (secs / 3600.)
+    elif secs > 60:
+        return "%.1fm" % (secs / 60.)
+    else:
+        return "%.1fs" % secs
+
+
+class ProgressMeter (object):
+    """
+    Reports the throughput of a long running loop.
+
+    Each report gives the number of items done, the overall rate in items
+    per second, the rate over the last 'window' seconds, and an ETA if the
+    total is known.  Reports are written at most every 'interval' seconds.
+    The clock is only read every few items, aiming at 10 reads per interval,
+    so update() is usually just an increment and a comparison.
+
+    total    -- total number of items (None if unknown)
+    name     -- name shown in reports
+    interval -- minimum number of seconds between reports
+    window   -- number of seconds used for the recent rate
+    out      -- stream for reports (default: util.log)
+    records  -- stream for machine-readable records
+                (default: see set_record_stream)
+    status   -- optional function returning a string to add to each report
+    unit     -- name of the items
+
+    Usage:
+
+        meter = ProgressMeter(len(genes), "genes")
+        for gene in genes:
+            ...
+            meter.update()
+        meter.finish()
+
+    or equivalently
+
+        for gene in iter_progress(genes, name="genes"):
+            ...
+    """
+
+    def __init__(self, total=None, name="progress", interval=5.0,
+                 window=30.0, out=None, records=None, status=None,
+                 unit="items"):
+        self.total = total
+        self.name = name
+        self.interval = interval
+        self.window = window
+        self.out = out
+        self.records = records if records is not None else _RECORD_STREAM
+        self.status = status
+        self.unit = unit
+
+        self.count = 0
+        self.start = time.time()
+        self._last_report = self.start
+        self._samples = deque([(self.start, 0)])
+        self._next_check = 1
+
+    def update(self, n=1):
+        """Record that 'n' more items are done"""
+        self.count += n
+        if self.count >= self._next_check:
+            self._poll()
+
+    def wrap(self, iterable):
+        """Iterate over 'iterable', recording each item as done"""
+        for item in iterable:
+            yield item
+            self.count += 1
+            if self.count >= self._next_check:
+                self._poll()
+        self.finish()
+
+    def _poll(self):
+        """Read the clock and report if the interval has passed"""
+        now = time.time()
+        samples = self._samples
+        samples.append((now, self.count))
+        while len(samples) > 2 and now - samples[1][0] > self.window:
+            samples.popleft()
+
+        if now - self._last_report >= self.interval:
+            self.report(now)
+
+        # schedule the next clock read
+        rate = self.get_rate(now)
+        self._next_check = self.count + max(
+            1, int(rate * self.interval / 10.0))
+
+    def get_elapsed(self, now=None):
+        """Returns seconds since the meter started"""
+        return (now or time.time()) - self.start
+
+    def get_rate(self, now=None):
+        """Returns the overall rate in items per second"""
+        elapsed = self.get_elapsed(now)
+        if elapsed <= 0:
+            return 0.0
+        return self.count / elapsed
+
+    def get_recent_rate(self, now=None):
+        """Returns the rate over the last 'window' seconds"""
+        if now is None:
+            now = time.time()
+        start, count = self._samples[0]
+        if now <= start:
+            return self.get_rate(now)
+        return (self.count - count) / (now - start)
+
+    def get_eta(self, now=None):
+        """Returns the estimated number of seconds left (None if unknown)"""
+        if self.total is None:
+            return None
+        rate = self.get_recent_rate(now) or self.get_rate(now)
+        if rate <= 0:
+            return None
+        return max(self.total - self.count, 0) / rate
+
+    def report(self, now=None, final=False):
+        """Write a progress report and record"""
+        if now is None:
+            now = time.time()
+        self._last_report = now
+        elapsed = self.get_elapsed(now)
+        rate = self.get_rate(now)
+        recent = self.get_recent_rate(now)
+        eta = None if final else self.get_eta(now)
+        status = self.status() if self.status else ""
+
+        # human readable report
+        if self.total:
+            text = "%s: %d/%d %s (%.1f%%)" % (
+                self.name, self.count, self.total, self.unit,
+                100.0 * self.count / self.total)
+        else:
+            text = "%s: %d %s" % (self.name, self.count, self.unit)
+        if final:
+            text += " in %s, %.1f/s" % (format_duration(elapsed), rate)
+        else:
+            text += ", %.1f/s, recent %.1f/s" % (rate, recent)
+            if eta is not None:
+                text += ", ETA %s" % format_duration(eta)
+        if status:
+            text += " " + status
+
+        if self.out is not None:
+            self.out.write(text + "\n")
+            self.out.flush()
+        else:
+            util.log(text)
+
+        # machine-readable record
+        if self.records is not None:
+            nan = float("nan")
+            self.records.write("\t".join(map(str, [
+                self.name, self.count,
+                self.total if self.total is not None else nan,
+                elapsed, rate, recent,
+                eta if eta is not None else nan,
+                status.replace("\t", " ")])) + "\n")
+            self.records.flush()
+
+    def finish(self):
+        """Write the final report"""
+        self.report(final=True)
+
+
+def iter_progress(iterable, total=None, name="progress", enabled=True,
+                  **options):
+    """
+    Iterate over 'iterable' with a ProgressMeter.
+
+    If 'enabled' is False, 'iterable' is returned unchanged, so a disabled
+    meter adds no cost to the loop.  'total' defaults to len(iterable) when
+    available.  Other options are passed to ProgressMeter.
+    """
+    if not enabled:
+        return iterable
+    if total is None and hasattr(iterable, "__len__"):
+        total = len(iterable)
+    return ProgressMeter(total, name, **options).wrap(iterable)
+
+
 if __name__ == "__main__":
-    import time
-    
     
     util.tic("hi")
     
@@ -68,6 +68,59 @@ class UnionFind:
 
 
 
+class UnionFindArray (object):
+    """
+    UNION/FIND over the items 0..n-1 using a parent array
+
+    Uses union by size and path compression.
+    """
+
+    def __init__(self, n):
+        self.parent = range(n)
+        self.sizes = [1] * n
+
+    def __len__(self):
+        return len(self.parent)
+
+    def find(self, i):
+        """Returns the root item of the set containing item i"""
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(self, i, j):
+        """Joins the sets of items i and j"""
+        i = self.find(i)
+        j = self.find(j)
+        if i == j:
+            return
+        if self.sizes[i] < self.sizes[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.sizes[i] += self.sizes[j]
+
+    def same(self, i, j):
+        """Returns True if items i and j are in the same set"""
+        return self.find(i) == self.find(j)
+
+    def components(self):
+        """Returns the sets as lists of items ordered by first item"""
+        comps = {}
+        order = []
+        for i in xrange(len(self.parent)):
+            root = self.find(i)
+            if root not in comps:
+                comps[root] = []
+                order.append(root)
+            comps[root].append(i)
+        return [comps[x] for x in order]
+
+
+
 def connected_components(components):
 
     sets = {}
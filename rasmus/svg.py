@@ -1,4 +1,8 @@
+import base64
+import gzip
 import os
+import struct
+import zlib
 
 
 def color2string(color):
@@ -241,6 +245,304 @@ class Svg:
 
 
 
+#=============================================================================
+# streaming writer
+
+# format for coordinates written by SvgWriter
+NUM_FORMAT = "%.7g"
+
+
+def color2hex(color):
+    """Returns the CSS hex string of a color"""
+    return "#%02x%02x%02x" % (int(255 * color[0]),
+                              int(255 * color[1]),
+                              int(255 * color[2]))
+
+
+def style_fields(strokeColor=None, fillColor=None, strokeWidth=None):
+    """Returns CSS declarations for a stroke, fill and stroke width"""
+    fields = []
+    for name, color in (("stroke", strokeColor), ("fill", fillColor)):
+        if not color:
+            continue
+        elif isinstance(color, str):
+            fields.append("%s:%s" % (name, color))
+        else:
+            fields.append("%s:%s" % (name, color2hex(color)))
+            if len(color) > 3 and color[3] != 1:
+                fields.append("%s-opacity:%g" % (name, color[3]))
+    if strokeWidth is not None:
+        fields.append("stroke-width:%g" % strokeWidth)
+    return ";".join(fields)
+
+
+class WriteBuffer (object):
+    """
+    Collects small writes and passes them to a stream in large blocks
+    """
+
+    def __init__(self, stream, size=1 << 16):
+        self.stream = stream
+        self.size = size
+        self._chunks = []
+        self._len = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._len += len(text)
+        if self._len >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self._chunks:
+            self.stream.write("".join(self._chunks))
+            self._chunks = []
+            self._len = 0
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not None:
+            self.flush()
+            self.stream.close()
+            self.stream = None
+
+
+def open_svg(filename, compress=None):
+    """
+    Opens an SVG file for writing
+
+    Files are gzip compressed if 'compress' is True, or if 'compress' is None
+    and 'filename' ends with '.svgz'.  Streams are returned as is.
+    """
+    if not isinstance(filename, basestring):
+        return filename
+    if compress or (compress is None and filename.endswith(".svgz")):
+        return gzip.open(filename, "wb")
+    return open(filename, "w")
+
+
+class SvgWriter (Svg):
+    """
+    Buffered SVG writer with shared style classes
+
+    Styles are written once as CSS classes and elements refer to them by
+    name, which keeps files of many similar elements small.  A class is
+    defined in a <style> element just before its first use, so output can
+    be streamed.  Shapes of the same style can be merged into one <path>
+    (see path() and PathBatch).
+
+    'stream' can be a filename ('.svgz' files are gzip compressed) or a
+    stream.  Like Svg, close() closes the stream.
+    """
+
+    def __init__(self, stream, compress=None, bufsize=1 << 16):
+        Svg.__init__(self, WriteBuffer(open_svg(stream, compress), bufsize))
+        self.styles = {}
+        self._style_keys = {}
+
+    def beginSvg(self, width, height):
+        self.out.write(
+            "<?xml version='1.0' encoding='UTF-8'?>\n"
+            "<svg width='%d' height='%d' version='1.1' "
+            "xmlns='http://www.w3.org/2000/svg' "
+            "xmlns:xlink='http://www.w3.org/1999/xlink'>\n<g>" %
+            (width, height))
+
+    def get_class(self, strokeColor=None, fillColor=None, strokeWidth=None,
+                  style=None):
+        """
+        Returns the name of the style class for a stroke and fill, defining
+        the class if needed.  'style' adds extra CSS declarations.
+        """
+        key = (strokeColor if isinstance(strokeColor, (str, type(None)))
+               else tuple(strokeColor),
+               fillColor if isinstance(fillColor, (str, type(None)))
+               else tuple(fillColor),
+               strokeWidth, style)
+        name = self._style_keys.get(key)
+        if name is None:
+            text = style_fields(strokeColor, fillColor, strokeWidth)
+            if style:
+                text += ";" + style
+            name = self.styles.get(text)
+            if name is None:
+                name = "s%d" % len(self.styles)
+                self.styles[text] = name
+                self.out.write("<style type='text/css'>.%s{%s}</style>\n" %
+                               (name, text))
+            self._style_keys[key] = name
+        return name
+
+    def line(self, x1, y1, x2, y2, color=None, **options):
+        if options or color is None:
+            return Svg.line(self, x1, y1, x2, y2, color=color, **options)
+        f = NUM_FORMAT
+        self.out.write(("<line class='%s' x1='" + f + "' y1='" + f +
+                        "' x2='" + f + "' y2='" + f + "'/>\n") %
+                       (self.get_class(color), x1, y1, x2, y2))
+
+    def rect(self, x, y, width, height, strokeColor=black, fillColor=black,
+             strokeWidth=1):
+        f = NUM_FORMAT
+        self.out.write(("<rect class='%s' x='" + f + "' y='" + f +
+                        "' width='" + f + "' height='" + f + "'/>\n") %
+                       (self.get_class(strokeColor, fillColor, strokeWidth),
+                        x, y, width, height))
+
+    def polygon(self, verts, strokeColor=black, fillColor=black,
+                strokeWidth=1):
+        f = NUM_FORMAT
+        points = " ".join((f + "," + f) % (verts[i], verts[i+1])
+                          for i in xrange(0, len(verts), 2))
+        self.out.write("<polygon class='%s' points='%s'/>\n" % (
+            self.get_class(strokeColor, fillColor, strokeWidth), points))
+
+    def circle(self, x, y, radius, strokeColor=black, fillColor=black,
+               strokeWidth=1):
+        f = NUM_FORMAT
+        self.out.write(("<circle class='%s' cx='" + f + "' cy='" + f +
+                        "' r='" + f + "'/>\n") %
+                       (self.get_class(strokeColor, fillColor, strokeWidth),
+                        x, y, radius))
+
+    def text(self, msg, x, y, size, strokeColor=null, fillColor=black,
+             anchor="start", baseline="auto", angle=0, strokeWidth=1):
+        cls = self.get_class(
+            strokeColor, fillColor, strokeWidth,
+            "font-size:%gpx;text-anchor:%s;dominant-baseline:%s" %
+            (size, anchor, baseline))
+        f = NUM_FORMAT
+        if angle:
+            self.out.write(("<text class='%s' transform='translate(" + f +
+                            "," + f + ") rotate(%g)'>%s</text>\n") %
+                           (cls, x, y, angle, msg))
+        else:
+            self.out.write(("<text class='%s' x='" + f + "' y='" + f +
+                            "'>%s</text>\n") % (cls, x, y, msg))
+
+    def path(self, data, strokeColor=black, fillColor=None, strokeWidth=1):
+        """Write a path with path data 'data'"""
+        self.out.write("<path class='%s' d='%s'/>\n" % (
+            self.get_class(strokeColor, fillColor, strokeWidth,
+                           None if fillColor else "fill:none"), data))
+
+    def image(self, x, y, width, height, data, mimetype="image/png",
+              smooth=False):
+        """
+        Embed an image given as encoded bytes (e.g. from encode_png()).
+        The image is stretched to the given size, without smoothing unless
+        'smooth' is True.
+        """
+        f = NUM_FORMAT
+        self.out.write(
+            ("<image x='" + f + "' y='" + f + "' width='" + f +
+             "' height='" + f + "' preserveAspectRatio='none'%s "
+             "xlink:href='data:%s;base64,") %
+            (x, y, width, height,
+             "" if smooth else
+             " style='image-rendering:optimizeSpeed;"
+             "image-rendering:pixelated'",
+             mimetype))
+        # encode in blocks of whole base64 quanta
+        step = 3 * (1 << 14)
+        for i in xrange(0, len(data), step):
+            self.out.write(base64.b64encode(data[i:i+step]))
+        self.out.write("'/>\n")
+
+
+class PathBatch (object):
+    """
+    Merges line segments and boxes of the same style into shared <path>
+    elements of an SvgWriter
+
+    Each style keeps at most 'maxlen' characters of path data before it is
+    written, so memory stays bounded.  Call flush() when done.
+    """
+
+    def __init__(self, writer, maxlen=1 << 16):
+        self.writer = writer
+        self.maxlen = maxlen
+        self._paths = {}
+
+    def _add(self, style, data):
+        path = self._paths.get(style)
+        if path is None:
+            path = self._paths[style] = [0]
+        path.append(data)
+        path[0] += len(data)
+        if path[0] >= self.maxlen:
+            self._write(style, path)
+
+    def _write(self, style, path):
+        strokeColor, fillColor, strokeWidth = style
+        self.writer.path("".join(path[1:]), strokeColor, fillColor,
+                         strokeWidth)
+        del path[1:]
+        path[0] = 0
+
+    def line(self, x1, y1, x2, y2, color=black, strokeWidth=1):
+        f = NUM_FORMAT
+        self._add((tuple(color), None, strokeWidth),
+                  ("M" + f + " " + f + "L" + f + " " + f) % (x1, y1, x2, y2))
+
+    def box(self, x, y, width, height, fillColor=black, strokeColor=None,
+            strokeWidth=1):
+        """Add a box (strokeColor defaults to fillColor)"""
+        if strokeColor is None:
+            strokeColor = fillColor
+        f = NUM_FORMAT
+        self._add((tuple(strokeColor), tuple(fillColor), strokeWidth),
+                  ("M" + f + " " + f + "h" + f + "v" + f + "h" + f + "z") %
+                  (x, y, width, height, -width))
+
+    def flush(self):
+        for style, path in self._paths.iteritems():
+            if path[0]:
+                self._write(style, path)
+
+
+#=============================================================================
+# raster images
+
+def _png_chunk(kind, data):
+    chunk = kind + data
+    return (struct.pack(">I", len(data)) + chunk +
+            struct.pack(">I", zlib.crc32(chunk) & 0xffffffff))
+
+
+def encode_png(pixels, width=None, height=None):
+    """
+    Encodes an RGBA image as PNG bytes
+
+    'pixels' is either a numpy uint8 array of shape (height, width, 4), or
+    a list of rows, each a byte string or bytearray of 4 * width values.
+    """
+    if hasattr(pixels, "shape"):
+        import numpy as np
+        height, width = pixels.shape[:2]
+        rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+        rows[:, 1:] = pixels.reshape(height, width * 4)
+        raw = rows.tostring()
+    else:
+        height = len(pixels)
+        width = len(pixels[0]) // 4 if height else 0
+        raw = "".join("\x00" + str(row) for row in pixels)
+
+    return "".join([
+        "\x89PNG\r\n\x1a\n",
+        _png_chunk("IHDR", struct.pack(">IIBBBBB", width, height,
+                                       8, 6, 0, 0, 0)),
+        _png_chunk("IDAT", zlib.compress(raw, 6)),
+        _png_chunk("IEND", "")])
+
+
+def write_png(filename, pixels):
+    """Writes an RGBA image to a PNG file (see encode_png())"""
+    out = open(filename, "wb")
+    out.write(encode_png(pixels))
+    out.close()
+
+
 def convert(filename, outfilename = None):
     if outfilename == None:
         outfilename = filename.replace(".svg", ".png")
@@ -47,6 +47,7 @@ from StringIO import StringIO
 import sys
 
 # rasmus libs
+from rasmus import delimlib
 from rasmus import util
 
 
@@ -339,16 +340,14 @@ class Table (list):
                             for header in self.headers:
                                 self.types.setdefault(header, str)
 
-                # parse data
-                row = {}
-                for header, token in izip(self.headers, tokens):
-                    type_object = self.types[header]
-                    if type_object is bool:
-                        type_object = str2bool
-                    row[header] = type_object(token)
+                    # compile converter once for the whole table
+                    headers = self.headers
+                    convert = delimlib.compile_converter([
+                        str2bool if self.types[key] is bool
+                        else self.types[key] for key in headers])
 
-                # yield completed row
-                yield row
+                # parse data and yield completed row
+                yield dict(izip(headers, convert(tokens)))
 
         except Exception, e:
             # report error in parsing input file
@@ -11,13 +11,20 @@
 # python libs
 import os
 import sys
+import threading
 import traceback
 import time
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
 
 
 # GLOBALS
 _RASMUS_TIMER = None
+_RASMUS_PROFILER = None
 _GLOBAL_NOTES = None
 
 
@@ -28,6 +35,7 @@ class Timer:
         self.showErrors = True
         self.showWarnings = True
         self.quiets = 0
+        self.profiler = None
     
 
     def start(self, msg = ""):
@@ -38,18 +46,22 @@ class Timer:
             self._write("BEGIN %s:\n" % msg)
         self.msg.append(msg)
         self.flush()
+        self.profiled.append(bool(self.profiler and
+                                  self.profiler.start(msg)))
         self.starts.append(time.time())
         
     
     def time(self):
         """Get the current duration of the timer"""
         
-        return self.starts[-1] - time.clock()
+        return time.time() - self.starts[-1]
     
     def stop(self):
         """Stop the last created timer and return duration in seconds"""
     
         duration = time.time() - self.starts.pop()
+        if self.profiled.pop():
+            self.profiler.stop()
         msg = self.msg.pop()
         if msg != "":
             self.indent()
@@ -119,6 +131,7 @@ class Timer:
         """Stop all timers"""
         self.msg = []
         self.starts = []
+        self.profiled = []
     
     def depth(self):
         """Get the current number of running timers"""
@@ -145,6 +158,11 @@ class Timer:
     def removeStream(self, stream):
         self.streams = filter(lambda x: x[0] != stream, self.streams)
 
+    def setProfiler(self, profiler):
+        """Also record every timed section in a Profiler (None to stop).
+           Change the profiler only when no timers are running."""
+        self.profiler = profiler
+
     def suppress(self):
         """Calling this function will suppress timer output messages until 
            unsuppress() is called.  
@@ -164,6 +182,218 @@ class Timer:
         self.quiets = max(self.quiets - 1, 0)
 
 
+#=============================================================================
+# aggregating profiler
+
+def _get_usage():
+    """Returns CPU time (user + system) in seconds and peak RSS in kilobytes"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+def _get_clock():
+    """Returns CPU time on systems without the resource module"""
+    return time.clock(), 0
+
+
+def _no_usage():
+    return 0.0, 0
+
+
+class Profiler (object):
+    """
+    Aggregates the time spent in nested sections of code.
+
+    Sections are keyed by their path of nested section names.  For each
+    path the profiler records the number of calls, total and self (total
+    minus nested sections) wall time, CPU time, and the peak RSS of the
+    process when the section ended.  Nothing is written while profiling;
+    call get_table() or write() to see the results.
+
+    Usage:
+
+        prof = Profiler()
+        with prof.section("recon"):
+            ...
+
+        @prof.section("hmm")
+        def forward(...):
+            ...
+
+        prof.write("profile.tab")
+
+    Each thread has its own stack of open sections.  CPU time and RSS are
+    measured for the whole process.  If 'usage' is False, only wall times
+    are recorded, which avoids a system call per section.
+    """
+
+    def __init__(self, enabled=True, usage=True):
+        self.enabled = enabled
+        if not usage:
+            self._usage = _no_usage
+        elif resource:
+            self._usage = _get_usage
+        else:
+            self._usage = _get_clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def start(self, name):
+        """
+        Open a new section nested in the current section
+
+        Returns True if the section was opened, False if the profiler is
+        disabled.  stop() must only be called for opened sections, so that
+        the profiler can be enabled or disabled while sections are open.
+        """
+        if not self.enabled:
+            return False
+        stack = self._stack()
+        if stack:
+            path = stack[-1][0] + (name,)
+        else:
+            path = (name,)
+        cpu, rss = self._usage()
+        stack.append([path, time.time(), cpu, 0.0])
+        return True
+
+    def stop(self):
+        """
+        Close the current section and return its duration in seconds
+
+        A section opened while the profiler was enabled is recorded even if
+        the profiler has been disabled since.
+        """
+        stack = self._stack()
+        path, start, cpu_start, children = stack.pop()
+        cpu, rss = self._usage()
+        duration = time.time() - start
+
+        if stack:
+            stack[-1][3] += duration
+
+        with self._lock:
+            # calls, total, self, cpu, peak_rss
+            stat = self.stats.get(path)
+            if stat is None:
+                stat = self.stats[path] = [0, 0.0, 0.0, 0.0, 0]
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] += duration - children
+            stat[3] += cpu - cpu_start
+            if rss > stat[4]:
+                stat[4] = rss
+
+        return duration
+
+    def section(self, name):
+        """
+        Returns a section that can be used as a context manager
+        ('with' statement) or as a function decorator.
+        """
+        return ProfilerSection(self, name)
+
+    def reset(self):
+        """Clear all recorded statistics"""
+        with self._lock:
+            self.stats = {}
+
+    def get_table(self):
+        """
+        Returns the statistics as a tablelib.Table, one row per path,
+        in depth-first order.  Times are in seconds, RSS in kilobytes.
+        """
+        from rasmus import tablelib
+
+        tab = tablelib.Table(headers=["path", "depth", "calls", "total",
+                                      "self", "cpu", "peak_rss"],
+                             types={"path": str, "depth": int, "calls": int,
+                                    "total": float, "self": float,
+                                    "cpu": float, "peak_rss": int})
+        with self._lock:
+            items = sorted(self.stats.items())
+        for path, stat in items:
+            tab.append({"path": "/".join(path),
+                        "depth": len(path),
+                        "calls": stat[0],
+                        "total": stat[1],
+                        "self": stat[2],
+                        "cpu": stat[3],
+                        "peak_rss": stat[4]})
+        return tab
+
+    def write(self, filename=sys.stdout):
+        """Write the statistics as a table (see get_table)"""
+        self.get_table().write(filename)
+
+    def write_pretty(self, out=sys.stderr):
+        """Write the statistics as an indented, aligned table"""
+        tab = self.get_table()
+        for row in tab:
+            row["path"] = "  " * (row["depth"] - 1) + row["path"].split(
+                "/")[-1]
+        tab.write_pretty(out)
+
+
+class ProfilerSection (object):
+    """A section of code timed by a Profiler"""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self._started = []
+
+    def __enter__(self):
+        self._started.append(self.profiler.start(self.name))
+        return self
+
+    def __exit__(self, type, value, tb):
+        if self._started.pop():
+            self.profiler.stop()
+
+    def __call__(self, func):
+        profiler = self.profiler
+        name = self.name
+
+        def wrapper(*args, **kwargs):
+            started = profiler.start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if started:
+                    profiler.stop()
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__dict__.update(func.__dict__)
+        return wrapper
+
+
+def globalProfiler():
+    """Returns the global Profiler (disabled until enabled is set)"""
+    global _RASMUS_PROFILER
+    if _RASMUS_PROFILER is None:
+        _RASMUS_PROFILER = Profiler(enabled=False)
+    return _RASMUS_PROFILER
+
+
+def profile_section(name):
+    """
+    Returns a section of the global profiler, for use in a 'with'
+    statement or as a decorator.
+    """
+    return globalProfiler().section(name)
+
+
+#=============================================================================
+
 def globalTimer():
     global _RASMUS_TIMER
     if _RASMUS_TIMER == None:
@@ -202,7 +432,7 @@ def note(*text):
     print >>notefile(), " ".join(text)
 
 def noteflush():
-    return notfile().flush()
+    return notefile().flush()
 
 def notefile(out = None):
     global _GLOBAL_NOTES
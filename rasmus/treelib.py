@@ -9,6 +9,7 @@
 
 # python libs
 import copy
+import heapq
 import sys
 import StringIO
 
@@ -2095,69 +2096,138 @@ def make_ptree(tree):
 #=============================================================================
 # Tree visualization
 
-def layout_tree(tree, xscale, yscale, minlen=-util.INF, maxlen=util.INF,
-                rootx=0, rooty=0):
-    """\
-    Determines the x and y coordinates for every branch in the tree.
-
-    Branch lengths are determined by node.dist
+class TreeLayout (object):
     """
-
-    """
-       /-----   ]
-       |        ] nodept[node]
-    ---+ node   ]
-       |
-       |
-       \---------
+    Coordinates of a tree layout stored in flat arrays
+
+    nodes     -- nodes in preorder (a collapsed clade appears as its root)
+    parents   -- index of the parent of each node (-1 for the root)
+    children  -- indices of the children of each node
+    x, y      -- coordinates of each node
+    sizes     -- number of leaf rows below each node
+    collapsed -- dict from the index of each collapsed clade to its number
+                 of leaves
+
+    A layout can also be used like the dict of coordinates returned by
+    layout_tree(), e.g. layout[node] == [x, y].
     """
 
-    # first determine sizes and nodepts
-    coords = {}
-    sizes = {}          # number of descendants (leaves have size 1)
-    nodept = {}         # distance between node y-coord and top bracket y-coord
+    def __init__(self, nodes, parents):
+        n = len(nodes)
+        self.nodes = nodes
+        self.parents = parents
+        self.index = dict((node, i) for i, node in enumerate(nodes))
+        self.children = [[] for i in xrange(n)]
+        for i in xrange(1, n):
+            self.children[parents[i]].append(i)
+        self.x = [0.0] * n
+        self.y = [0.0] * n
+        self.sizes = [1] * n
+        self.collapsed = {}
+
+    @classmethod
+    def from_coords(cls, tree, coords):
+        """Make a layout from a dict of coordinates (see layout_tree())"""
+        nodes = []
+        parents = []
+        stack = [(tree.root, -1)]
+        while stack:
+            node, parent = stack.pop()
+            if node not in coords:
+                continue
+            nodes.append(node)
+            parents.append(parent)
+            i = len(nodes) - 1
+            for child in reversed(node.children):
+                stack.append((child, i))
+
+        layout = cls(nodes, parents)
+        for i, node in enumerate(nodes):
+            layout.x[i], layout.y[i] = coords[node]
+            if node.children and not layout.children[i]:
+                layout.collapsed[i] = count_clade_leaves(tree, node)[node]
+        return layout
 
-    def walk(node):
-        # calculate new y-coordinate for node
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def __getitem__(self, node):
+        i = self.index[node]
+        return [self.x[i], self.y[i]]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def keys(self):
+        return list(self.nodes)
+
+    def values(self):
+        return [list(pt) for pt in zip(self.x, self.y)]
+
+    def items(self):
+        return zip(self.nodes, self.values())
+
+    def get_coords(self):
+        """Returns a dict from nodes to coordinates [x, y]"""
+        return dict(self.items())
 
-        # compute node sizes
-        sizes[node] = 0
-        for child in node.children:
-            sizes[node] += walk(child)
 
+def count_clade_leaves(tree, node=None):
+    """
+    Returns a dict of the number of leaves below each node of the subtree
+    rooted at 'node' (default: root).  Does not recurse, so it works for
+    deep trees.
+    """
+    sizes = {}
+    for node in tree.postorder(node):
         if node.is_leaf():
             sizes[node] = 1
-            nodept[node] = yscale - 1
         else:
-            top = nodept[node.children[0]]
-            bot = ((sizes[node] - sizes[node.children[-1]]) * yscale +
-                   nodept[node.children[-1]])
-            nodept[node] = (top + bot) / 2.0
-
-        return sizes[node]
-    walk(tree.root)
+            sizes[node] = sum(sizes[child] for child in node.children)
+    return sizes
 
-    # determine x, y coordinates
-    def walk2(node, x, y):
-        xchildren = x+min(max(node.dist*xscale, minlen), maxlen)
-        coords[node] = [xchildren, y + nodept[node]]
 
-        if not node.is_leaf():
-            ychild = y
-            for child in node.children:
-                walk2(child, xchildren, ychild)
-                ychild += sizes[child] * yscale
-    walk2(tree.root, rootx, rooty)
-
-    return coords
+def find_collapsed_clades(tree, maxleaves):
+    """
+    Returns the set of clades to collapse so that a layout has at most
+    'maxleaves' leaf rows.  Larger clades are expanded first.
+    """
+    sizes = count_clade_leaves(tree)
+
+    collapsed = set()
+    rows = 1
+    heap = [(-sizes[tree.root], 0, tree.root)]
+    count = 1
+    while heap:
+        size, tmp, node = heapq.heappop(heap)
+        if node.is_leaf():
+            continue
+        if rows + len(node.children) - 1 > maxleaves:
+            collapsed.add(node)
+            continue
+        rows += len(node.children) - 1
+        for child in node.children:
+            heapq.heappush(heap, (-sizes[child], count, child))
+            count += 1
+    return collapsed
 
 
-def layout_tree_hierarchical(tree, xscale, yscale,
-                             rootx=0, rooty=0):
+def layout_tree_flat(tree, xscale=1.0, yscale=1.0,
+                     minlen=-util.INF, maxlen=util.INF,
+                     rootx=0, rooty=0, hierarchical=False, collapse=()):
     """\
     Determines the x and y coordinates for every branch in the tree.
 
-    Leaves are drawn to line up.  Best used for hierarchical clustering.
+    Returns a TreeLayout.  Branch lengths are determined by node.dist and
+    clamped to [minlen, maxlen] after scaling, unless 'hierarchical' is
+    True, in which case leaves are drawn to line up.  Nodes in 'collapse'
+    are laid out as leaves (see find_collapsed_clades()).
+
+    The layout is computed without recursion in time linear in the number
+    of nodes.
     """
 
     """
@@ -2169,49 +2239,84 @@ def layout_tree_hierarchical(tree, xscale, yscale,
        \---------
     """
 
-    # first determine sizes and nodepts
-    coords = {}
-    sizes = {}          # number of descendants (leaves have size 1)
-    depth = {}          # how deep in tree is node
-    nodept = {}         # distance between node y-coord and top bracket y-coord
+    # nodes in preorder
+    nodes = []
+    parents = []
+    stack = [(tree.root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        nodes.append(node)
+        parents.append(parent)
+        if node.children and node not in collapse:
+            i = len(nodes) - 1
+            for child in reversed(node.children):
+                stack.append((child, i))
+
+    layout = TreeLayout(nodes, parents)
+    n = len(nodes)
+    children = layout.children
+    sizes = layout.sizes
+    x = layout.x
+    y = layout.y
+
+    # determine sizes and nodepts from the leaves up
+    nodept = [yscale - 1] * n   # distance between node y and top bracket y
+    depth = [0] * n             # how deep in tree is node
+    for i in xrange(n - 1, -1, -1):
+        kids = children[i]
+        if kids:
+            size = 0
+            for child in kids:
+                size += sizes[child]
+            sizes[i] = size
+            top = nodept[kids[0]]
+            bot = (size - sizes[kids[-1]]) * yscale + nodept[kids[-1]]
+            nodept[i] = (top + bot) / 2.0
+            depth[i] = max(depth[child] for child in kids) + 1
+        elif nodes[i].children:
+            layout.collapsed[i] = count_clade_leaves(tree, nodes[i])[nodes[i]]
+
+    # determine x, y coordinates from the root down
+    maxdepth = depth[0]
+    ytop = [0.0] * n
+    ytop[0] = rooty
+    for i in xrange(n):
+        if hierarchical:
+            x[i] = rootx + xscale * (maxdepth - depth[i])
+        else:
+            parentx = x[parents[i]] if i > 0 else rootx
+            x[i] = parentx + min(max(nodes[i].dist * xscale, minlen),
+                                 maxlen)
+        y[i] = ytop[i] + nodept[i]
 
-    def walk(node):
-        # calculate new y-coordinate for node
+        ychild = ytop[i]
+        for child in children[i]:
+            ytop[child] = ychild
+            ychild += sizes[child] * yscale
 
-        # recurse: compute node sizes
-        sizes[node] = 0
-        for child in node.children:
-            sizes[node] += walk(child)
+    return layout
 
-        if node.is_leaf():
-            sizes[node] = 1
-            nodept[node] = yscale - 1
-            depth[node] = 0
-        else:
-            top = nodept[node.children[0]]
-            bot = ((sizes[node] - sizes[node.children[-1]]) * yscale +
-                   nodept[node.children[-1]])
-            nodept[node] = (top + bot) / 2.0
-            depth[node] = max(depth[child] + 1 for child in node.children)
 
-        return sizes[node]
-    walk(tree.root)
+def layout_tree(tree, xscale, yscale, minlen=-util.INF, maxlen=util.INF,
+                rootx=0, rooty=0):
+    """\
+    Determines the x and y coordinates for every branch in the tree.
 
-    # determine x, y coordinates
-    maxdepth = depth[tree.root]
+    Branch lengths are determined by node.dist
+    """
+    return layout_tree_flat(tree, xscale, yscale, minlen, maxlen,
+                            rootx, rooty).get_coords()
 
-    def walk2(node, x, y):
-        xchildren = x + xscale * (maxdepth - depth[node])
-        coords[node] = [xchildren, y + nodept[node]]
 
-        if not node.is_leaf():
-            ychild = y
-            for child in node.children:
-                walk2(child, x, ychild)
-                ychild += sizes[child] * yscale
-    walk2(tree.root, rootx, rooty)
+def layout_tree_hierarchical(tree, xscale, yscale,
+                             rootx=0, rooty=0):
+    """\
+    Determines the x and y coordinates for every branch in the tree.
 
-    return coords
+    Leaves are drawn to line up.  Best used for hierarchical clustering.
+    """
+    return layout_tree_flat(tree, xscale, yscale, rootx=rootx, rooty=rooty,
+                            hierarchical=True).get_coords()
 
 
 def layout_tree_vertical(layout, offset=None, root=0, leaves=None,
@@ -1122,7 +1122,8 @@ class IgnoreCloseFile (object):
         pass
 
 
-def open_stream(filename, mode="r", ignore_close=True):
+def open_stream(filename, mode="r", ignore_close=True, compress="auto",
+                level=6):
     """Returns a file stream depending on the type of 'filename' and 'mode'
 
        filename: the following types for 'filename' are handled:
@@ -1134,6 +1135,12 @@ def open_stream(filename, mode="r", ignore_close=True):
        mode: standard mode for file(): r,w,a,b
        ignore_close: if True and filename is a stream, then close() calls on
            the returned stream will be ignored.
+       compress: if 'auto', files opened in text mode are decompressed when
+           they start with a gzip, bgzip, bzip2 or xz magic number and are
+           compressed when written with extension .gz, .bgz, .bz2 or .xz
+           (see rasmus.compress).  A format name forces that format and
+           None disables compression.
+       level: compression level for writing
     """
 
     is_stream = False
@@ -1166,6 +1173,14 @@ def open_stream(filename, mode="r", ignore_close=True):
             else:
                 raise Exception("stream '-' can only be opened with modes r/w")
 
+        # open compressed file
+        elif compress and "b" not in mode and _is_compressed(
+                filename, mode, compress):
+            from rasmus import compress as compresslib
+            stream = compresslib.open_compressed(
+                filename, mode, None if compress == "auto" else compress,
+                level=level)
+
         # open regular file
         else:
             stream = open(filename, mode)
@@ -1180,6 +1195,19 @@ def open_stream(filename, mode="r", ignore_close=True):
     return stream
 
 
+def _is_compressed(filename, mode, compress):
+    """Returns True if open_stream() should open a compressed stream"""
+    from rasmus import compress as compresslib
+
+    if compress != "auto":
+        return True
+    if "r" in mode:
+        return (os.path.isfile(filename) and
+                compresslib.detect_compression(filename) is not None)
+    else:
+        return compresslib.get_extension_compression(filename) is not None
+
+
 @contextlib.contextmanager
 def smart_open_stream(filename, mode="r", ignore_close=True):
     """Returns a filestream that is compatible with 'with' block.
@@ -1206,24 +1234,23 @@ class DelimReader:
         delim: delimiting character
         types: types of columns
         pars: if True, fields are automatically parsed
+
+        Lines are read in chunks and converted by rasmus.delimlib.
         """
+        from rasmus import delimlib
+
         self.infile = open_stream(filename)
         self.delim = delim
         self.types = types
         self.parse = parse
+        self._rows = delimlib.iter_rows(self.infile, delim, types or None,
+                                        parse)
 
     def __iter__(self):
-        return self
+        return self._rows
 
     def next(self):
-        line = self.infile.next()
-        row = line.rstrip("\n").split(self.delim)
-        if self.types:
-            return [func(x) for func, x in izip(self.types, row)]
-        elif self.parse:
-            return [autoparse(x) for x in row]
-        else:
-            return row
+        return self._rows.next()
 
 
 def read_delim(filename, delim="\t", types=None, parse=False):
@@ -1,6 +1,8 @@
 
 import math
 import copy
+from itertools import izip
+from bisect import bisect_left, bisect_right
 
 from summon.core import *
 import summon
@@ -11,6 +13,7 @@ from summon.multiscale import Multiscale
 from summon import VisObject
 
 from rasmus.vis import visual
+from rasmus.vis import tracksummary
 from rasmus import util, stats
 
 from compbio import regionlib
@@ -86,6 +89,7 @@ class Track:
         self.pos_offset = pos_offset[:]
         self.view = copy.copy(view)
         self.browser = None
+        self._lod_drawn = None
     
     
     def set_pos(self, x, y):
@@ -131,6 +135,32 @@ class Track:
     def getBrowser(self):
         return self.browser
 
+    def get_visible_range(self, origin=0):
+        """
+        Returns (start, end, bases_per_pixel) for the visible part of the
+        track, where 'origin' is the coordinate drawn at the track position
+        """
+        win = self.get_window()
+        x1, y1, x2, y2 = win.get_visible()
+        width = max(win.get_size()[0], 1)
+        offset = origin - self.pos[0]
+        return x1 + offset, x2 + offset, (x2 - x1) / float(width)
+
+    def get_lod_range(self, level, start, end):
+        """
+        Returns the range (start, end) to draw at summary level 'level'
+        (None for full detail) when [start, end) is visible, or None if
+        the last range drawn still covers it.  The range drawn includes a
+        margin of one visible width on each side.
+        """
+        drawn = self._lod_drawn
+        if drawn and drawn[0] == level and \
+           drawn[1] <= start and end <= drawn[2]:
+            return None
+        margin = end - start
+        self._lod_drawn = (level, start - margin, end + margin)
+        return self._lod_drawn[1:]
+
 
 
 
@@ -851,11 +881,13 @@ class SeqTrack (Track):
 class CurveTrack (Track):
     """Track for displaying a curve along the genome"""
 
-    def __init__(self, xdata, ydata, **options):
+    def __init__(self, xdata, ydata, lod=True, **options):
         Track.__init__(self, **options)
         
         self.xdata = xdata
         self.ydata = ydata
+        self.lod = lod
+        self.summary = None
         self.multiscale = Multiscale(marginx=.25, marginy=.25, 
                                             scalex=4.0, scaley=4.0)
         self.shown = False
@@ -864,6 +896,10 @@ class CurveTrack (Track):
     def draw(self):
         self.multiscale.init(self.get_window())
         self.shown = False
+
+        # precompute min/max summaries for zoomed out views
+        if self.lod and self.summary is None:
+            self.summary = tracksummary.CurveSummary(self.xdata, self.ydata)
         
         # return placeholder group
         self.gid = group()
@@ -886,18 +922,37 @@ class CurveTrack (Track):
             
             vis = []
             vis2 = []
-            for i in xrange(start, end, step):
-                dat = self.ydata[i:i+step]
-
-                assert len(dat) > 0, (start, end, step)
-
-                y1 = min(dat)
-                y2 = max(dat)
-                #y = self.ydata[i]
-                y1 = (util.clamp(y1, .33, .66) - .33) / .33
-                y2 = (util.clamp(y2, .33, .66) - .33) / .33                
-                vis.extend([self.xdata[i], y2 * self.size[1]])
-                vis2.extend([self.xdata[i], y1 * self.size[1]])
+            summary = None
+            if self.summary and end > start:
+                bases_per_pixel = self.get_visible_range(self.view.start)[2]
+                summary = self.summary.query(
+                    self.xdata[start], self.xdata[end - 1] + 1,
+                    bases_per_pixel)
+
+            if summary:
+                # draw the min/max summaries of the closest level
+                level, binstarts, data = summary
+                width = self.summary.get_binwidth(level)
+                for x1, y1, y2 in izip(binstarts, data["min"], data["max"]):
+                    if y1 != y1:
+                        # empty bin
+                        continue
+                    y1 = (util.clamp(y1, .33, .66) - .33) / .33
+                    y2 = (util.clamp(y2, .33, .66) - .33) / .33
+                    vis.extend([x1 + width / 2.0, y2 * self.size[1]])
+                    vis2.extend([x1 + width / 2.0, y1 * self.size[1]])
+            else:
+                for i in xrange(start, end, step):
+                    dat = self.ydata[i:i+step]
+
+                    assert len(dat) > 0, (start, end, step)
+
+                    y1 = min(dat)
+                    y2 = max(dat)
+                    y1 = (util.clamp(y1, .33, .66) - .33) / .33
+                    y2 = (util.clamp(y2, .33, .66) - .33) / .33
+                    vis.extend([self.xdata[i], y2 * self.size[1]])
+                    vis2.extend([self.xdata[i], y1 * self.size[1]])
 
             # draw curve on middle of base (.5)
             self.gid = win.replace_group(self.gid, 
@@ -914,13 +969,19 @@ class CurveTrack (Track):
 
 
 class RegionTrack (Track):
-    """Track for displaying genomic regions (genes, regulator elements, etc)"""
+    """Track for displaying genomic regions (genes, regulator elements, etc)
+
+    With lod=True, zoomed out views of the 'box' and 'line' styles show
+    region coverage from a tracksummary.RegionSummary instead of every
+    region.
+    """
 
     def __init__(self, regions, height=0.5, col=color(0,0,1,.5), 
-                       text_color=color(1, 1, 1),
-                       textSize=12,
-                       style="box", on_click=None,
-                       **options):
+                 text_color=color(1, 1, 1),
+                 textSize=12,
+                 style="box", on_click=None,
+                 lod=True,
+                 **options):
         Track.__init__(self, **options)
         
         self.regions = regions
@@ -930,6 +991,9 @@ class RegionTrack (Track):
         self.style = style
         self.height = height
         self.on_click = on_click
+        self.lod = lod
+        self.summaries = {}
+        self.gid = None
     
     
     def get_region_pos(self, reg):
@@ -938,6 +1002,16 @@ class RegionTrack (Track):
             return (self.pos[0] + reg.start - self.view.start, self.pos[1])
         else:
             return None
+
+    def get_summary(self):
+        """Returns the RegionSummary of the chromosome in view"""
+        key = (self.view.species, self.view.seqname)
+        if key not in self.summaries:
+            self.summaries[key] = tracksummary.RegionSummary(
+                [x for x in self.regions
+                 if x.seqname == key[1] and x.species == key[0]],
+                binsize=256)
+        return self.summaries[key]
     
     
     def draw(self):
@@ -948,10 +1022,34 @@ class RegionTrack (Track):
         start = self.view.start
         end = self.view.end
     
-        height = self.height
         regions = filter(lambda x: x.seqname == chrom and 
                                    x.species == species, self.regions)
-        
+
+        if self.lod and self.style in ('box', 'line'):
+            # regions are drawn by update() at the current level of detail
+            regions.sort(key=lambda x: x.start)
+            self._view_regions = regions
+            self._view_starts = [x.start for x in regions]
+            self._maxlen = max([x.end - x.start for x in regions] + [0])
+            self.get_summary()
+            self._lod_drawn = None
+            self.gid = group()
+            return group(translate(
+                self.pos[0], self.pos[1] + self.size[1] / 2.0,
+                color(0, 0, 0), lines(0, 0, end - start + 1, 0),
+                group(self.gid)))
+
+        self.gid = None
+        return group(translate(
+            self.pos[0], self.pos[1] + self.size[1] / 2.0,
+            self.draw_regions(
+                (reg for reg in regions
+                 if util.overlap(start, end, reg.start, reg.end)),
+                start, end)))
+
+    def draw_regions(self, regions, start, end):
+        """Returns graphics for 'regions' relative to 'start'"""
+        height = self.height
         
         def click_region(region):
             return lambda: self.on_click(region)
@@ -964,68 +1062,103 @@ class RegionTrack (Track):
             names = []
         
             for reg in regions:
-                if util.overlap(start, end, reg.start, reg.end):
-                    if reg.strand == 1:
-                        # positive strand
-                        bot = 0
-                        top = height
-                    elif reg.strand == -1:
-                        # negative strand
-                        bot = -height
-                        top = 0
-                    else:
-                        bot = -height
-                        top = height
-                        
-                    vis.extend([reg.start-start, bot,
-                                reg.end-start+1, bot,
-                                reg.end-start+1, top,
-                                reg.start-start, top])
-                    vis2.extend([reg.start-start, bot, 
-                                 reg.start-start, top])
-                    if 'ID' in reg.data:
-                        names.append(text_clip(reg.data['ID'], 
-                                               reg.start-start, bot,
-                                               reg.end-start+1, top,
-                                               4, 
-                                               self.textSize))
-                    if self.on_click:
-                        hotspots.append(hotspot("click",
-                                                reg.start-start, top,
-                                                reg.end-start+1, bot,
-                                                click_region(reg)))
+                if reg.strand == 1:
+                    # positive strand
+                    bot = 0
+                    top = height
+                elif reg.strand == -1:
+                    # negative strand
+                    bot = -height
+                    top = 0
+                else:
+                    bot = -height
+                    top = height
+
+                vis.extend([reg.start-start, bot,
+                            reg.end-start+1, bot,
+                            reg.end-start+1, top,
+                            reg.start-start, top])
+                vis2.extend([reg.start-start, bot,
+                             reg.start-start, top])
+                if 'ID' in reg.data:
+                    names.append(text_clip(reg.data['ID'],
+                                           reg.start-start, bot,
+                                           reg.end-start+1, top,
+                                           4,
+                                           self.textSize))
+                if self.on_click:
+                    hotspots.append(hotspot("click",
+                                            reg.start-start, top,
+                                            reg.end-start+1, bot,
+                                            click_region(reg)))
             
-            return group(translate(
-                self.pos[0], self.pos[1] + self.size[1] / 2.0,
+            return group(
                 color(0,0,0), lines(0, 0, end-start+1, 0),
                 self.color, quads(*vis), lines(*vis2),
                 group(*hotspots),
-                self.text_color, *names))
+                self.text_color, *names)
                 
         elif self.style == 'line':
             # line style
             vis = []
         
             for reg in regions:
-                if util.overlap(start, end, reg.start, reg.end):
-                   if reg.strand != 0:
-                       vis.extend([reg.start-start, 0, 
-                                   reg.start-start, reg.strand*height])
-                   else:
-                       vis.extent([reg.start-start, -.5 * height, 
-                                   reg.start-start, .5 * height])
+                if reg.strand != 0:
+                    vis.extend([reg.start-start, 0,
+                                reg.start-start, reg.strand*height])
+                else:
+                    vis.extend([reg.start-start, -.5 * height,
+                                reg.start-start, .5 * height])
             
-            return group(translate(self.pos[0], self.pos[1]  + self.size[1] / 2.0,
-                                   color(0,0,0), lines(0, 0, end-start+1, 0),
-                                   self.color, lines(* vis)))
+            return group(color(0, 0, 0), lines(0, 0, end - start + 1, 0),
+                         self.color, lines(* vis))
         
         else:
             # custom style
-            regions2 = (reg for reg in regions 
-                        if util.overlap(start, end, reg.start, reg.end))
-            
-            return group(translate(self.pos[0], self.pos[1] + self.size[1] / 2.0, 
-                         self.style(regions2, start)))
+            return self.style(regions, start)
+
+    def draw_summary(self, binstarts, width, data, start):
+        """Returns graphics for the binned coverage of regions"""
+        height = self.height
+        vis = []
+        for x, coverage in izip(binstarts, data["coverage"]):
+            if coverage > 0:
+                top = height * min(coverage, 1.0)
+                vis.extend([x-start, -top,
+                            x-start+width, -top,
+                            x-start+width, top,
+                            x-start, top])
+        return group(self.color, quads(*vis))
+
+    def update(self):
+        if self.gid is None:
+            return
+
+        start = self.view.start
+        vstart, vend, bases_per_pixel = self.get_visible_range(start)
+        vstart = max(vstart, start)
+        vend = min(vend, self.view.end + 1)
+        summary = self.get_summary()
+        level = summary.get_level(bases_per_pixel)
+        drawn = self.get_lod_range(level, vstart, vend)
+        if drawn is None:
+            return
+        dstart, dend = max(drawn[0], start), min(drawn[1], self.view.end + 1)
+
+        win = self.get_window()
+        if level is None:
+            # full detail for the regions near the visible range
+            i = bisect_left(self._view_starts, dstart - self._maxlen)
+            j = bisect_right(self._view_starts, dend)
+            regions = [reg for reg in self._view_regions[i:j]
+                       if util.overlap(dstart, dend, reg.start, reg.end)]
+            g = self.draw_regions(regions, start, self.view.end)
+        else:
+            level, binstarts, data = summary.query(
+                dstart, dend, bases_per_pixel)
+            g = self.draw_summary(binstarts, summary.get_binwidth(level),
+                                  data, start)
+        self.gid = win.replace_group(self.gid, g)
         
 
 
@@ -1109,10 +1242,23 @@ class GenomeAlignTrack (Track):
         
 
 class AlignTrack (Track):
+    """Track for displaying an alignment
+
+    With lod=True, zoomed out views show the consensus residue of each row
+    in bins of columns from a tracksummary.AlignSummary, and zoomed in
+    views only draw the columns near the visible range.
+    """
+
+    # classes of alignment characters
+    BASE = 0
+    GAP = 1
+    NOBASE = 2
+
     def __init__(self, aln, collapse=None, cols=None, color_bases=False, 
                  seqtype=None, show_color_bases=True, show_bases=True,
                  show_labels=True,
                  rowspacing=None,
+                 lod=True,
                  **options):
         Track.__init__(self, **options)
         self.size = [aln.alignlen(), len(aln)]
@@ -1125,6 +1271,8 @@ class AlignTrack (Track):
         self.rowspacing = rowspacing
         self.always_color = False
         self.color_bases_vis = None
+        self.lod = lod
+        self.summary = None
         
         if seqtype == None:
             self.seqtype = guessAlign(aln)
@@ -1147,16 +1295,10 @@ class AlignTrack (Track):
             self.aln = alignlib.subalign(aln, cols)
         else:
             self.aln = aln
-        
-    
-        
-    def draw(self):
-        self.text_shown = False
-        self.multiscale.init(self.get_window())
-    
-        BASE    = 0
-        GAP     = 1
-        NOBASE  = 2
+
+    def get_baseclasses(self):
+        """Returns a dict from alignment characters to their class"""
+        BASE, GAP, NOBASE = self.BASE, self.GAP, self.NOBASE
         
         if self.seqtype == "dna":
             baseclasses = {'A': BASE, 'C': BASE, 'T': BASE, 'G': BASE,
@@ -1170,49 +1312,77 @@ class AlignTrack (Track):
         
         else:
             raise Exception("unknown seqtype '%s'" % self.seqtype)
+
+        return baseclasses
+
+    def get_class_runs(self, selected_class, start, end):
+        """
+        Returns the boxes and dividers of the runs of characters of class
+        'selected_class' within columns [start, end)
+        """
+        baseclasses = self.baseclasses
+        boxpts = []
+        diagpts = []
+
+        for row, (key, val) in zip(self.rowspacing, self.aln.iteritems()):
+            lastbase = None
+            lastclass = None
+            lasti = start
+            stop = min(end, len(val))
+            for i in xrange(start, stop+1):
+                # this extra is being used to handle the case when
+                # a sequence is all bases
+                if i < stop:
+                    base = val[i]
+                else:
+                    base = '-'
+                if base not in baseclasses:
+                    baseclass = self.NOBASE
+                else:
+                    baseclass = baseclasses[base]
+
+                if baseclass == lastclass:
+                    continue
+
+                if lastbase is not None and lastclass == selected_class:
+                    boxpts.extend([lasti, -row, lasti, -row-1,
+                                   i, -row-1, i, -row])
+                    diagpts.extend([i, -row, i, -row-1])
+
+                lasti = i
+                lastbase = base
+                lastclass = baseclass
+        return boxpts, diagpts
+
+    def get_base_color(self, base):
+        """Returns the color of a block whose consensus is 'base'"""
+        if self.show_color_bases and self.color_bases and \
+           base in self.color_bases:
+            return self.color_bases[base]
+        elif self.baseclasses.get(base, self.NOBASE) == self.BASE:
+            return color(.5, .5, .5)
+        else:
+            return color(.7, .2, .2)
+
+    def draw(self):
+        self.text_shown = False
+        self.multiscale.init(self.get_window())
+        self.baseclasses = self.get_baseclasses()
         
         # init row spacing
         if self.rowspacing == None:
             self.rowspacing = range(len(self.aln))
-        
-        def getRegions(selectedClass):
-            boxpts = []
-            diagpts = []
-            diagpts2 = []
-            
-            for row, (key, val) in zip(self.rowspacing, self.aln.iteritems()):
-                lastbase = None
-                lastclass = None
-                lasti = 0
-                for i in xrange(len(val)+1):
-                    # this extra is being used to handle the case when
-                    # a sequence is all bases
-                    if i < len(val):
-                        base = val[i]
-                    else:
-                        base = '-'
-                    if base not in baseclasses:
-                        baseclass = NOBASE
-                    else:
-                        baseclass = baseclasses[base]
-
-                    if baseclass == lastclass:
-                        continue
-                    
-                    if lastbase != None and lastclass == selectedClass:
-                        boxpts.extend([lasti, -row, lasti, -row-1, i, -row-1, i, -row])
-                        diagpts.extend([i, -row, i, -row-1])
-                        #diagpts.extend([lasti, -row, i, -row-1])
-                        #diagpts2.extend([lasti, -row, lasti, -row-1])
 
-                    lasti = i
-                    lastbase = base
-                    lastclass = baseclass
-            return boxpts, diagpts, diagpts2
-        
-        base_boxpts, base_diagpts, base_diagpts2 = getRegions(BASE)
-        nobase_boxpts, nobase_diagpts, nobase_diagpts2 = getRegions(NOBASE)
-        
+        # residue blocks
+        self._lod_drawn = None
+        self.blocks_group = group()
+        if self.lod:
+            # blocks are drawn by update() at the current level of detail
+            if self.summary is None:
+                self.summary = tracksummary.AlignSummary(self.aln)
+            blocks = group(self.blocks_group)
+        else:
+            blocks = self.draw_blocks(0, self.aln.alignlen())
         
         # build labels
         if self.show_labels:
@@ -1236,17 +1406,64 @@ class AlignTrack (Track):
                      labelsgroup,
                      
                      click,
-                     
-                     color(.5, .5, .5), 
+                     blocks,
+                     group(self.text_group)))
+
+    def draw_blocks(self, start, end):
+        """Returns graphics for the residue runs within columns [start, end)"""
+        base_boxpts, base_diagpts = self.get_class_runs(self.BASE, start, end)
+        nobase_boxpts, nobase_diagpts = self.get_class_runs(
+            self.NOBASE, start, end)
+
+        return group(color(.5, .5, .5),
                      quads(* base_boxpts),
                      lines(* base_diagpts),
-                     #lines(* base_diagpts2),
                      
                      color(.7, .2, .2),
                      quads(* nobase_boxpts),
-                     lines(* nobase_diagpts),
-                     #lines(* nobase_diagpts2),
-                     group(self.text_group)))
+                     lines(* nobase_diagpts))
+
+    def draw_summary(self, level, binstarts, data):
+        """
+        Returns graphics for summary blocks colored by their consensus
+        residue, with heights given by their fraction of residues
+        """
+        width = self.summary.get_binwidth(level)
+        pts = {}
+        for k, row in enumerate(self.rowspacing[:len(self.summary.keys)]):
+            for x, base, fill in izip(binstarts, data["consensus"][:, k],
+                                      data["fill"][:, k]):
+                if fill > 0:
+                    top = -row - .5 + fill / 2.0
+                    bot = -row - .5 - fill / 2.0
+                    pts.setdefault(base, []).extend([
+                        x, top, x, bot, x+width, bot, x+width, top])
+
+        vis = []
+        for base, basepts in pts.iteritems():
+            vis.extend([self.get_base_color(base), quads(* basepts)])
+        return group(*vis)
+
+    def update_blocks(self):
+        """Redraw residue blocks for the current level of detail"""
+        alignlen = self.aln.alignlen()
+        start, end, bases_per_pixel = self.get_visible_range()
+        start = max(int(start), 0)
+        end = min(int(math.ceil(end)), alignlen)
+        level = self.summary.get_level(bases_per_pixel)
+        drawn = self.get_lod_range(level, start, end)
+        if drawn is None:
+            return
+        start, end = max(drawn[0], 0), min(drawn[1], alignlen)
+
+        if level is None:
+            g = self.draw_blocks(start, end)
+        else:
+            level, binstarts, data = self.summary.query(
+                start, end, bases_per_pixel)
+            g = self.draw_summary(level, binstarts, data)
+        self.blocks_group = self.get_window().replace_group(
+            self.blocks_group, g)
     
     def draw_left(self):
         labels = []
@@ -1269,6 +1486,9 @@ class AlignTrack (Track):
         view = win.get_visible()
         size = win.get_size()
         x, y = self.pos
+
+        if self.lod:
+            self.update_blocks()
         
         mintextSize = 4
         minblockSize = 1
@@ -8,6 +8,7 @@
 
 from rasmus import util
 from rasmus.vis import distmatrixvis, alignvis, treevis
+from compbio import phylo
 
 import summon
 from summon import matrix, hud, multiwindow
@@ -26,6 +27,7 @@ class PhyloViewer (object):
     def __init__(self, trees=[], distmats=[], aligns=[],
                        stree=None,
                        gene2species=None,
+                       recons=None,
                        tree_colormap=lambda x: (0, 0, 0),
                        
                        dist_labels=None, 
@@ -50,6 +52,9 @@ class PhyloViewer (object):
             will be plotted.
         stree        -- species tree
         gene2species -- gene name to species name mapping function
+        recons       -- optional list of precomputed reconciliations (one for
+                        each tree).  Reconciliations that are not given are
+                        computed once when their tree is first shown.
                        
         * Distance matrix configuration
         dist_labels      -- a list of row/col labels (one for each matrix)
@@ -83,6 +88,10 @@ class PhyloViewer (object):
         # optional data
         self.stree = stree
         self.gene2species = gene2species
+        if recons is None:
+            recons = [None] * len(trees)
+        self.recons = list(recons)
+        self.tree_events = [None] * len(trees)
         self.tree_colormap = tree_colormap
         self.distlabels = dist_labels
         self.dist_labels_from_align = dist_labels_from_align
@@ -139,20 +148,57 @@ class PhyloViewer (object):
         self.init_distmats()        
     
     
+    def get_recon(self, treeindex):
+        """
+        Returns the reconciliation, events and losses of a tree
+
+        These are computed once per tree and reused when switching trees.
+        """
+        if self.stree is None:
+            return None, None, None
+
+        if self.tree_events[treeindex] is None:
+            tree = self.trees[treeindex]
+            recon = self.recons[treeindex]
+            if recon is None:
+                if self.gene2species is None:
+                    return None, None, None
+                recon = phylo.reconcile(tree, self.stree, self.gene2species)
+                self.recons[treeindex] = recon
+            self.tree_events[treeindex] = (
+                phylo.label_events(tree, recon),
+                phylo.find_loss(tree, self.stree, recon))
+
+        events, losses = self.tree_events[treeindex]
+        return self.recons[treeindex], events, losses
+
+
+    def set_tree(self, treeindex):
+        """Display a tree by its index"""
+        self.current_tree = self.trees[treeindex]
+        recon, events, losses = self.get_recon(treeindex)
+        self.vistree.set_tree(self.current_tree, recon=recon,
+                              events=events, losses=losses)
+    
+    
     def init_trees(self):
         """Initialize trees"""
         
         if len(self.trees) > 0:
             self.current_tree = self.trees[0]
+            recon, events, losses = self.get_recon(0)
             self.vistree = PhyloTreeViewer(self.current_tree,
                                            name=self.tree_names[0],
                                            phylo_viewer=self,
                                            xscale=100.0,
                                            stree=self.stree,
                                            gene2species=self.gene2species,
+                                           recon=recon,
+                                           events=events,
+                                           losses=losses,
                                            winsize=self.tree_win_size,
                                            colormap=self.tree_colormap)
-            self.vistree.set_tree(self.current_tree)
+            self.set_tree(0)
             self.order = self.current_tree.leaf_names()
         else:
             self.vistree = None
@@ -321,8 +367,7 @@ class PhyloViewer (object):
     def next_tree(self):
         treeindex = self.trees.index(self.current_tree)
         treeindex = (treeindex + 1) % len(self.trees)
-        self.current_tree = self.trees[treeindex]        
-        self.vistree.set_tree(self.current_tree)
+        self.set_tree(treeindex)
         self.vistree.win.set_name(self.tree_names[treeindex])
         self.vistree.show()
         self.on_reorder_leaves()
@@ -330,8 +375,7 @@ class PhyloViewer (object):
     def prev_tree(self):
         treeindex = self.trees.index(self.current_tree)
         treeindex = (treeindex - 1) % len(self.trees)
-        self.current_tree = self.trees[treeindex]
-        self.vistree.set_tree(self.current_tree)
+        self.set_tree(treeindex)
         self.vistree.win.set_name(self.tree_names[treeindex])
         self.vistree.show()
         self.on_reorder_leaves()
@@ -389,11 +433,11 @@ class PhyloTreeViewer (treevis.TreeViewer):
         self.phylo_viewer.on_reorder_leaves()
 
 
-    def set_tree(self, tree):
+    def set_tree(self, tree, recon=None, events=None, losses=None):
 
         if max(node.dist for node in tree) == 0.0:
             self.xscale = 0.0
         else:
             self.xscale = 100.0
             
-        treevis.TreeViewer.set_tree(self, tree)
+        treevis.TreeViewer.set_tree(self, tree, recon, events, losses)
@@ -0,0 +1,302 @@
+"""
+
+    Level-of-detail summaries for genome browser tracks
+
+A summary pyramid stores a track at several resolutions.  Level 0 has bins
+of 'binsize' bases and each further level merges 'factor' bins of the level
+below, until a single bin covers the whole track.  A pyramid is built once
+per track and a track picks a level from the number of bases per pixel it
+is drawn at (see SummaryPyramid.get_level() and SummaryPyramid.query()).
+
+  RegionSummary -- region counts and coverage (genes, elements, etc)
+  CurveSummary  -- min, max and mean of a curve
+  AlignSummary  -- consensus residue and fill of every alignment row
+
+Bins are half-open intervals [start + i*width, start + (i+1)*width).
+This module does not depend on summon.  Requires numpy.
+
+"""
+
+import numpy as np
+
+
+#=============================================================================
+# helpers
+
+def _pad_bins(array, factor, fill):
+    """
+    Reshape the bins along axis 0 of 'array' into groups of 'factor' bins,
+    padding the last group with 'fill'
+    """
+    nbins = array.shape[0]
+    extra = -nbins % factor
+    if extra:
+        pad = np.empty((extra,) + array.shape[1:], dtype=array.dtype)
+        pad.fill(fill)
+        array = np.concatenate([array, pad])
+    return array.reshape((array.shape[0] // factor, factor) +
+                         array.shape[1:])
+
+
+def _nan_divide(num, denom):
+    """Divide arrays with nan where 'denom' is zero"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = num / denom.astype(float)
+    result[denom == 0] = np.nan
+    return result
+
+
+#=============================================================================
+# summary pyramids
+
+class SummaryPyramid (object):
+    """
+    Base class for multi-resolution track summaries
+
+    Subclasses fill 'levels' with one dict per level mapping a summary name
+    to an array whose first axis is the bin.
+    """
+
+    def __init__(self, start, end, binsize=16, factor=4):
+        assert binsize > 0 and factor > 1
+        self.start = start
+        self.end = max(end, start + 1)
+        self.binsize = binsize
+        self.factor = factor
+        self.levels = []
+
+    def get_nlevels(self):
+        """Returns the number of levels needed to reach a single bin"""
+        nlevels = 1
+        while self.get_nbins(nlevels - 1) > 1:
+            nlevels += 1
+        return nlevels
+
+    def get_binwidth(self, level):
+        """Returns the number of bases in a bin of 'level'"""
+        return self.binsize * self.factor ** level
+
+    def get_nbins(self, level):
+        """Returns the number of bins in 'level'"""
+        width = self.get_binwidth(level)
+        return (self.end - self.start + width - 1) // width
+
+    def get_bin_starts(self, level, i=0, j=None):
+        """Returns the start coordinates of bins i to j of 'level'"""
+        if j is None:
+            j = self.get_nbins(level)
+        return self.start + np.arange(i, j) * self.get_binwidth(level)
+
+    def get_level(self, bases_per_pixel):
+        """
+        Returns the coarsest level whose bins are no wider than
+        'bases_per_pixel', or None if the track should be drawn in full
+        detail
+        """
+        if bases_per_pixel < self.binsize:
+            return None
+        level = 0
+        while (level + 1 < len(self.levels) and
+               self.get_binwidth(level + 1) <= bases_per_pixel):
+            level += 1
+        return level
+
+    def get_bin_range(self, level, start, end):
+        """
+        Returns the range (i, j) of bins in 'level' that overlap the
+        half-open interval [start, end)
+        """
+        width = self.get_binwidth(level)
+        i = max((start - self.start) // width, 0)
+        j = min((end - self.start + width - 1) // width,
+                self.get_nbins(level))
+        return int(i), int(max(i, j))
+
+    def query(self, start, end, bases_per_pixel):
+        """
+        Returns the summary of [start, end) for drawing at 'bases_per_pixel'
+
+        Returns (level, binstarts, data), where 'data' maps each summary
+        name to its bins overlapping [start, end), or None if the track
+        should be drawn in full detail.
+        """
+        level = self.get_level(bases_per_pixel)
+        if level is None:
+            return None
+        i, j = self.get_bin_range(level, start, end)
+        data = dict((name, array[i:j])
+                    for name, array in self.levels[level].iteritems())
+        return level, self.get_bin_starts(level, i, j), data
+
+
+class RegionSummary (SummaryPyramid):
+    """
+    Binned counts and coverage of regions
+
+    count    -- number of regions overlapping each bin
+    coverage -- mean number of regions covering a base of each bin
+
+    Regions use 1-based inclusive coordinates (regionlib.Region) and should
+    be on the same sequence.
+    """
+
+    def __init__(self, regions, start=None, end=None, binsize=16, factor=4):
+        starts = np.sort(np.array([reg.start for reg in regions],
+                                  dtype=np.int64))
+        ends = np.sort(np.array([reg.end + 1 for reg in regions],
+                                dtype=np.int64))
+        if start is None:
+            start = int(starts[0]) if len(starts) else 0
+        if end is None:
+            end = int(ends[-1]) if len(ends) else start + 1
+        SummaryPyramid.__init__(self, start, end, binsize, factor)
+
+        self._starts = starts
+        self._ends = ends
+        self._start_sums = np.concatenate([[0], np.cumsum(starts)])
+        self._end_sums = np.concatenate([[0], np.cumsum(ends)])
+
+        for level in xrange(self.get_nlevels()):
+            self.levels.append(self._summarize(level))
+
+    def _covered(self, pos):
+        """Returns the number of covered bases before each position"""
+        nstarts = np.searchsorted(self._starts, pos, "left")
+        nends = np.searchsorted(self._ends, pos, "left")
+        return ((pos * nstarts - self._start_sums[nstarts]) -
+                (pos * nends - self._end_sums[nends]))
+
+    def _summarize(self, level):
+        width = self.get_binwidth(level)
+        edges = self.start + np.arange(self.get_nbins(level) + 1,
+                                       dtype=np.int64) * width
+        count = (np.searchsorted(self._starts, edges[1:], "left") -
+                 np.searchsorted(self._ends, edges[:-1], "right"))
+        coverage = np.diff(self._covered(edges)) / float(width)
+        return {"count": count, "coverage": coverage}
+
+
+class CurveSummary (SummaryPyramid):
+    """
+    Binned min, max and mean of a curve
+
+    min, max, mean -- statistics of the points in each bin (nan if empty)
+    count          -- number of points in each bin
+    """
+
+    def __init__(self, xdata, ydata, start=None, end=None, binsize=16,
+                 factor=4):
+        xdata = np.asarray(xdata, dtype=float)
+        ydata = np.asarray(ydata, dtype=float)
+        if len(xdata) > 1 and (np.diff(xdata) < 0).any():
+            order = np.argsort(xdata, kind="mergesort")
+            xdata = xdata[order]
+            ydata = ydata[order]
+        if start is None:
+            start = int(np.floor(xdata[0])) if len(xdata) else 0
+        if end is None:
+            end = int(np.floor(xdata[-1])) + 1 if len(xdata) else start + 1
+        SummaryPyramid.__init__(self, start, end, binsize, factor)
+
+        # level 0 from the points
+        edges = self.get_bin_starts(0, 0, self.get_nbins(0) + 1)
+        index = np.searchsorted(xdata, edges, "left")
+        count = np.diff(index)
+        nonempty = count > 0
+        first = index[:-1][nonempty]
+        low = np.empty(len(count))
+        low.fill(np.nan)
+        high = low.copy()
+        total = np.zeros(len(count))
+        if len(first):
+            low[nonempty] = np.minimum.reduceat(ydata, first)
+            high[nonempty] = np.maximum.reduceat(ydata, first)
+            total[nonempty] = np.add.reduceat(ydata, first)
+        self.levels.append({"min": low, "max": high, "count": count,
+                            "mean": _nan_divide(total, count)})
+
+        # merge levels
+        for level in xrange(1, self.get_nlevels()):
+            below = self.levels[-1]
+            count = _pad_bins(below["count"], factor, 0).sum(1)
+            total = _pad_bins(np.nan_to_num(below["mean"]) * below["count"],
+                              factor, 0).sum(1)
+            self.levels.append({
+                "min": np.fmin.reduce(_pad_bins(below["min"], factor,
+                                                np.nan), 1),
+                "max": np.fmax.reduce(_pad_bins(below["max"], factor,
+                                                np.nan), 1),
+                "count": count,
+                "mean": _nan_divide(total, count)})
+
+
+class AlignSummary (SummaryPyramid):
+    """
+    Binned consensus of every row of an alignment
+
+    consensus -- most frequent non-gap residue of each row in each bin
+                 (array of shape (nbins, nrows), gap if the bin is empty)
+    fill      -- fraction of non-gap residues of each row in each bin
+
+    Bins are over alignment columns, starting at column 0.  Residues are
+    compared case-insensitively.
+    """
+
+    # maximum number of residue counts held at once
+    BLOCK_SIZE = 1 << 22
+
+    def __init__(self, aln, binsize=16, factor=4, gap="-"):
+        self.keys = list(aln.keys())
+        codes = np.array([np.fromstring(aln[key].upper(), dtype=np.uint8)
+                          for key in self.keys], dtype=np.uint8)
+        if codes.ndim != 2:
+            codes = codes.reshape(len(self.keys), 0)
+        ncols = codes.shape[1]
+        SummaryPyramid.__init__(self, 0, ncols, binsize, factor)
+
+        gapcode = ord(gap)
+        symbols = [c for c in np.unique(codes) if c != gapcode]
+        self.symbols = np.array([chr(c) for c in symbols] + [gap])
+        self.gap = gap
+
+        nrows = len(self.keys)
+        for level in xrange(self.get_nlevels()):
+            nbins = self.get_nbins(level)
+            self.levels.append({
+                "consensus": np.empty((nbins, nrows),
+                                      dtype=self.symbols.dtype),
+                "fill": np.empty((nbins, nrows))})
+
+        # residue counts of shape (nbins, blocksize, nsymbols) are made for
+        # one block of rows at a time
+        blocksize = max(self.BLOCK_SIZE //
+                        max(self.get_nbins(0) * len(symbols), 1), 1)
+        for start in xrange(0, nrows, blocksize):
+            block = codes[start:start + blocksize].T
+            counts = np.zeros((self.get_nbins(0), block.shape[1],
+                               len(symbols)), dtype=np.int32)
+            for k, symbol in enumerate(symbols):
+                counts[:, :, k] = _pad_bins(block == symbol,
+                                            binsize, False).sum(1)
+
+            for level in xrange(self.get_nlevels()):
+                if level > 0:
+                    counts = _pad_bins(counts, factor, 0).sum(1)
+                summary = self._summarize(level, counts)
+                for key, value in summary.iteritems():
+                    self.levels[level][key][:, start:start + blocksize] = \
+                        value
+
+    def _summarize(self, level, counts):
+        width = self.get_binwidth(level)
+        starts = self.get_bin_starts(level)
+        widths = np.minimum(self.end - starts, width)
+
+        total = counts.sum(2)
+        if counts.shape[2]:
+            consensus = self.symbols[counts.argmax(2)]
+        else:
+            consensus = np.empty(total.shape, dtype=self.symbols.dtype)
+        consensus[total == 0] = self.gap
+        return {"consensus": consensus,
+                "fill": total / widths[:, np.newaxis].astype(float)}
@@ -25,7 +25,20 @@ def draw_tree(tree, labels={}, xscale=100, yscale=20, canvas=None,
               dupColor=(1, 0, 0),
               eventSize=4,
               legendScale=False, autoclose=None,
-              extendRoot=True, labelLeaves=True, drawHoriz=True, nodeSize=0):
+              extendRoot=True, labelLeaves=True, drawHoriz=True, nodeSize=0,
+              recon=None, events=None, losses=None,
+              collapse=None, maxleaves=None):
+    """
+    Draw a tree as SVG
+
+    recon, events, losses -- precomputed reconciliation to 'stree' (computed
+                             from 'gene2species' when not given)
+    collapse              -- nodes whose clades are drawn as triangles
+    maxleaves             -- collapse the smallest clades until at most
+                             'maxleaves' leaf rows are drawn
+    layout                -- precomputed coordinates, either a dict from
+                             nodes to [x, y] or a treelib.TreeLayout
+    """
     
     # set defaults
     fontRatio = 8. / 11.
@@ -49,31 +62,42 @@ def draw_tree(tree, labels={}, xscale=100, yscale=20, canvas=None,
     else:
         colormap(tree)
     
-    if stree and gene2species:
-        recon = phylo.reconcile(tree, stree, gene2species)
-        events = phylo.label_events(tree, recon)
-        losses = phylo.find_loss(tree, stree, recon)
-    else:
-        events = None
-        losses = None
-
-    if len(labels) > 0 or (stree and gene2species):
+    drawEvents = stree is not None and (
+        events is not None or recon is not None or gene2species is not None)
+    if drawEvents:
+        if recon is None and (events is None or losses is None):
+            recon = phylo.reconcile(tree, stree, gene2species)
+        if events is None:
+            events = phylo.label_events(tree, recon)
+        if losses is None:
+            losses = phylo.find_loss(tree, stree, recon)
+
+    if len(labels) > 0 or drawEvents:
         drawHoriz = True
     
     # layout tree
     if layout is None:
-        coords = treelib.layout_tree(tree, xscale, yscale, minlen, maxlen)
-    else:
+        if collapse is None:
+            collapse = ()
+            if maxleaves is not None:
+                collapse = treelib.find_collapsed_clades(tree, maxleaves)
+        coords = treelib.layout_tree_flat(tree, xscale, yscale, minlen,
+                                          maxlen, collapse=collapse)
+    elif isinstance(layout, treelib.TreeLayout):
         coords = layout
+    else:
+        coords = treelib.TreeLayout.from_coords(tree, layout)
     
-    xcoords, ycoords = zip(* coords.values())
-    maxwidth = max(xcoords)
-    maxheight = max(ycoords) + labelOffset
+    maxwidth = max(coords.x)
+    maxheight = max(coords.y) + labelOffset
     
     
     # initialize canvas
     if canvas == None:
-        canvas = svg.Svg(util.open_stream(filename, "w"))
+        if isinstance(filename, basestring) and filename.endswith(".svgz"):
+            canvas = svg.SvgWriter(filename)
+        else:
+            canvas = svg.SvgWriter(util.open_stream(filename, "w"))
         width = int(rmargin + maxwidth + lmargin)
         height = int(tmargin + maxheight + bmargin)
         
@@ -86,63 +110,101 @@ def draw_tree(tree, labels={}, xscale=100, yscale=20, canvas=None,
             autoclose = False
     
     
+    # branches of the same color share a path when possible
+    if isinstance(canvas, svg.SvgWriter):
+        batch = svg.PathBatch(canvas)
+        draw_line = batch.line
+    else:
+        batch = None
+
+        def draw_line(x1, y1, x2, y2, color):
+            canvas.line(x1, y1, x2, y2, color=color)
+
     # draw tree
-    def walk(node):
-        x, y = coords[node]
-        if node.parent:
-            parentx, parenty = coords[node.parent]
+    nodes = coords.nodes
+    parents = coords.parents
+    children = coords.children
+    xs = coords.x
+    ys = coords.y
+
+    def get_parent_coords(i):
+        if parents[i] != -1:
+            return xs[parents[i]], ys[parents[i]]
+        elif extendRoot:
+            return 0, ys[i]
         else:
-            if extendRoot:
-                parentx, parenty = 0, y
-            else:
-                parentx, parenty = x, y     # e.g. no branch
-        
+            return xs[i], ys[i]     # e.g. no branch
+
+    def draw_branch(i):
+        node = nodes[i]
+        x = xs[i]
+        y = ys[i]
+        parentx, parenty = get_parent_coords(i)
+
         # draw branch
         if drawHoriz:
-            canvas.line(parentx, y, x, y, color=node.color)
+            draw_line(parentx, y, x, y, node.color)
         else:
-            canvas.line(parentx, parenty, x, y, color=node.color)
+            draw_line(parentx, parenty, x, y, node.color)
+
+        # draw vertical part of branch
+        if drawHoriz and children[i] and i not in coords.collapsed:
+            top = ys[children[i][0]]
+            bot = ys[children[i][-1]]
+            draw_line(x, top, x, bot, node.color)
+
+    def draw_node(i):
+        node = nodes[i]
+        x = xs[i]
+        y = ys[i]
+        parentx, parenty = get_parent_coords(i)
 
         # draw branch labels
         if node.name in labels:
             branchlen = x - parentx
             lines = str(labels[node.name]).split("\n")
             labelwidth = max(map(len, lines))
-            labellen = min(labelwidth * fontRatio * fontSize, 
+            labellen = min(labelwidth * fontRatio * fontSize,
                            max(int(branchlen-1), 0))
-            
-            for i, line in enumerate(lines):
+
+            for k, line in enumerate(lines):
                 canvas.text(line,
-                            parentx + (branchlen - labellen)/2., 
-                            y + labelOffset 
-                            +(-len(lines)+1+i)*(labelSize+1),
+                            parentx + (branchlen - labellen)/2.,
+                            y + labelOffset
+                            +(-len(lines)+1+k)*(labelSize+1),
                             labelSize)
 
         # draw nodes
         if nodeSize > 0:
             canvas.circle(x, y, nodeSize, strokeColor=svg.null, fillColor=node.color)
 
-        # draw leaf labels or recur
-        if node.is_leaf():
+        # draw leaf labels or collapsed clades
+        if i in coords.collapsed:
+            height = max(yscale - 2, 1) / 2.0
+            canvas.polygon([x, y, x + leafPadding, y - height,
+                            x + leafPadding, y + height],
+                           strokeColor=node.color, fillColor=node.color)
+            if labelLeaves:
+                canvas.text("%s (%d leaves)" % (node.name,
+                                                coords.collapsed[i]),
+                            x + 2 * leafPadding, y+fontSize/2., fontSize,
+                            fillColor=node.color)
+        elif not children[i]:
             if labelLeaves:
-                canvas.text(leafFunc(node), 
+                canvas.text(leafFunc(node),
                             x + leafPadding, y+fontSize/2., fontSize,
                             fillColor=node.color)
-        else:
-            if drawHoriz:
-                # draw vertical part of branch
-                top = coords[node.children[0]][1]
-                bot = coords[node.children[-1]][1]
-                canvas.line(x, top, x, bot, color=node.color)
-                
-            # draw children
-            for child in node.children:
-                walk(child)
-    
+
+    # branches are drawn first, so that labels are drawn on top of them
     canvas.beginTransform(("translate", lmargin, tmargin))
-    walk(tree.root)
-        
-    if stree and gene2species:
+    for i in xrange(len(nodes)):
+        draw_branch(i)
+    if batch:
+        batch.flush()
+    for i in xrange(len(nodes)):
+        draw_node(i)
+
+    if drawEvents:
         draw_events(canvas, tree, coords, events, losses,
                     lossColor=lossColor,
                     dupColor=dupColor,
@@ -173,8 +235,10 @@ def draw_events(canvas, tree, coords, events, losses,
 
     # draw duplications
     for node in tree:
+        if node not in coords:
+            continue
         x, y = coords[node]
-        if events[node] == "dup":
+        if events.get(node) == "dup":
             canvas.rect(x - size/2.0, y - size/2.0,
                         size, size,  fillColor=dupColor, strokeColor=(0,0,0,0))
 
@@ -182,7 +246,7 @@ def draw_events(canvas, tree, coords, events, losses,
     losses_per_branch = util.hist_dict([node for node, schild in losses])
 
     for node, nlosses in losses_per_branch.iteritems():
-        if node.parent == None:
+        if node.parent is None or node not in coords:
             continue
 
         x1 = coords[node.parent][0]
@@ -20,6 +20,7 @@ from summon import hud
 class TreeViewer (sumtree.SumTree):
     def __init__(self, tree, stree=None, gene2species=None, recon=None,
                  dup_color=(1, 0, 0), loss_color=(0, 0, 1), 
+                 events=None, losses=None,
                  **options):
         sumtree.SumTree.__init__(self, tree, **options)
         
@@ -33,15 +34,22 @@ class TreeViewer (sumtree.SumTree):
         self.dup_color = dup_color
         self.loss_color = loss_color
         
-        self.setup_recon(recon)
+        self.setup_recon(recon, events, losses)
     
     
-    def set_tree(self, tree):
+    def set_tree(self, tree, recon=None, events=None, losses=None):
         sumtree.SumTree.set_tree(self, tree)
-        self.setup_recon()
+        self.setup_recon(recon, events, losses)
                     
     
-    def setup_recon(self, recon=None):
+    def setup_recon(self, recon=None, events=None, losses=None):
+        """
+        Setup the reconciliation of the tree
+
+        A precomputed reconciliation, events and losses may be given to
+        avoid recomputing them each time a tree is shown.
+        """
+        
         # construct default reconciliation
         if recon == None and self.stree and self.gene2species:
             self.recon = phylo.reconcile(self.tree, self.stree, self.gene2species)
@@ -50,8 +58,12 @@ class TreeViewer (sumtree.SumTree):
         
         # construct events
         if self.recon:
-            self.events = phylo.label_events(self.tree, self.recon)
-            self.losses = phylo.find_loss(self.tree, self.stree, self.recon)
+            if events is None:
+                events = phylo.label_events(self.tree, self.recon)
+            if losses is None:
+                losses = phylo.find_loss(self.tree, self.stree, self.recon)
+            self.events = events
+            self.losses = losses
         else:
             self.events = None
             self.losses = None
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from compbio import allelefreq
+from compbio import coal
+
+from rasmus.testing import fequal
+
+
+class FreqKernel (unittest.TestCase):
+
+    def test_cdf(self):
+        """Kernel CDF should match coal.freq_CDF"""
+
+        N = 1000
+        kernel = allelefreq.FreqKernel(N)
+        params = [(.3, 100, .4), (.1, 500, .9), (.5, 1000, .2)]
+        p, t, T = map(np.array, zip(*params))
+        cdfs = kernel.cdf(p, t, T)
+
+        for i, (p1, t1, T1) in enumerate(params):
+            fequal(cdfs[i], coal.freq_CDF(p1, N, t1, T1), 1e-6)
+            fequal(kernel.prob_range(p1, t1, .2, .6),
+                   coal.freq_prob_range(p1, N, t1, .2, .6), 1e-6)
+
+    def test_pdf(self):
+        """Kernel PDF should match coal.freq_pdf"""
+
+        N = 1000
+        kernel = allelefreq.FreqKernel(N)
+        for x, p, t in [(.45, .3, 100), (.2, .5, 1000), (.8, .1, 500)]:
+            fequal(kernel.pdf(x, p, t, k=8), coal.freq_pdf(x, p, N, t), 1e-6)
+
+    def test_prob_fix(self):
+        N = 1000
+        kernel = allelefreq.FreqKernel(N)
+        fequal(kernel.prob_fix(.5, 1000), coal.prob_fix(.5, N, 1000), 1e-6)
+        fequal(kernel.prob_extinct(.3, 500),
+               coal.prob_fix(.7, N, 500), 1e-6)
+
+    def test_sample(self):
+        """Sampled frequencies should follow the kernel CDF"""
+
+        kernel = allelefreq.FreqKernel(1000)
+        p, t = .3, 500
+        x = kernel.sample(np.repeat(p, 20000), t,
+                          rng=np.random.RandomState(1))
+
+        # allele frequency is a martingale
+        fequal(x.mean(), p, .02)
+        fequal((x == 0.0).mean(), kernel.prob_extinct(p, t), .1)
+        for T in [.1, .3, .5]:
+            fequal((x <= T).mean(), kernel.cdf(p, t, T), .05)
@@ -3,6 +3,7 @@ import StringIO
 import unittest
 
 from compbio import arglib
+from compbio import seqarray
 from rasmus import util
 from rasmus.common import izip
 from rasmus.rplotting import rp
@@ -100,6 +101,26 @@ class Arg (unittest.TestCase):
                 b = set(arglib.get_marginal_leaves(arg, node, mid))
                 self.assertEqual(a, b)
 
+    def test_align_splits(self):
+        """Alignment splits should be found once per site pattern"""
+
+        rho = 1.5e-8   # recomb/site/gen
+        mu = 2.5e-8    # mut/site/gen
+        l = 10000      # length of locus
+        k = 10         # number of lineages
+        n = 2*10000    # effective popsize
+
+        arg = arglib.sample_arg(k, n, rho, 0, l)
+        mutations = arglib.sample_arg_mutations(arg, mu)
+        aln = arglib.make_alignment(arg, mutations)
+        splits = list(arglib.iter_align_splits(aln))
+
+        sites = seqarray.SitePatterns(
+            seqarray.AlignMatrix.from_seqs(aln, "AC"))
+        self.assertEqual(sites.get_ncols(), l)
+        self.assertTrue(len(sites) <= len(mutations) + 1)
+        self.assertEqual(list(arglib.iter_align_splits(sites)), splits)
+
     #----------------------------------
     # SPRs
 
@@ -0,0 +1,64 @@
+import unittest
+
+from compbio import coalsim
+
+from rasmus import treelib
+from rasmus.testing import fequal
+
+
+class MultiCoalBatch (unittest.TestCase):
+
+    def test_tree_structure(self):
+        """Batch trees should be valid ultrametric gene trees"""
+
+        stree = treelib.parse_newick(
+            "((A:1000, B:1000):500, (C:700, D:700):800);")
+        leaf_counts = {"A": 3, "B": 1, "C": 2, "D": 2}
+        sampler = coalsim.MultiCoalSampler(stree, 500, leaf_counts)
+        batch = sampler.sample(50)
+
+        self.assertEqual(len(batch), 50)
+        for i in xrange(len(batch)):
+            tree, recon = batch.get_tree(i, stree)
+            self.assertEqual(sorted(tree.leaf_names()),
+                             sorted(batch.leaf_names))
+            self.assertTrue(treelib.is_binary(tree))
+            treelib.check_ages(tree, treelib.get_tree_ages(tree))
+
+            # coalescences occur above the species they reconcile to
+            ages = treelib.get_tree_ages(tree)
+            sages = treelib.get_tree_ages(stree)
+            for node in tree:
+                self.assertTrue(ages[node] >= sages[recon[node]] - 1e-6)
+
+            tree2 = treelib.parse_newick(batch.get_newick(i))
+            self.assertEqual(sorted(tree2.leaf_names()),
+                             sorted(tree.leaf_names()))
+
+    def test_root_age(self):
+        """Mean root age of two genes is the split time plus n"""
+
+        stree = treelib.parse_newick("(A:1000, B:1000);")
+        n = 500
+        batch = coalsim.sample_multicoal_trees(stree, n, 20000, seed=1)
+        fequal(batch.root_ages().mean(), 1000 + n, .05)
+
+    def test_bounded(self):
+        stree = treelib.parse_newick(
+            "((A:1000, B:1000):500, (C:700, D:700):800);")
+        T = 2000
+        batch = coalsim.sample_multicoal_trees(stree, 1000, 500, T=T, seed=2)
+        self.assertEqual(len(batch), 500)
+        self.assertTrue((batch.root_ages() < T).all())
+
+    def test_reproducible(self):
+        """Seeded sampling should not depend on the number of processes"""
+
+        stree = treelib.parse_newick(
+            "((A:1000, B:1000):500, (C:700, D:700):800);")
+        sampler = coalsim.MultiCoalSampler(stree, 1000)
+        trees1 = list(sampler.iter_newick(100, seed=3, batchsize=30))
+        trees2 = list(sampler.iter_newick(100, seed=3, batchsize=30,
+                                          nproc=2))
+        self.assertEqual(len(trees1), 100)
+        self.assertEqual(trees1, trees2)
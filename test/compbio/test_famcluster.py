@@ -0,0 +1,80 @@
+import os
+import unittest
+
+import numpy as np
+
+from compbio import famcluster
+
+from rasmus import tablelib
+from rasmus import treelib
+from rasmus.testing import make_clean_dir
+
+
+CONF = {"bitspersite": .5, "coveragesmall": .5, "coveragebig": .5,
+        "signif": 1e-5}
+
+
+def write_hits(filename, hits):
+    out = open(filename, "w")
+    out.write("# query subject ...\n")
+    for gene1, gene2, score in hits:
+        row = [gene1, gene2, 90.0, 100, 0, 0, 1, 101, 1, 101, 1e-20, score]
+        out.write("\t".join(map(str, row)) + "\n")
+    out.close()
+
+
+def make_data(path):
+    """Two gene families (x and y) in three species"""
+    stree = treelib.parse_newick("((A:1,B:1):1,C:2);")
+    genes = dict((sp + fam, {"length": 100})
+                 for sp in "ABC" for fam in "xy")
+    write_hits(os.path.join(path, "A_B.m8"), [
+        ("Ax", "Bx", 200), ("Ay", "By", 190), ("Ax", "By", 60)])
+    # file with species of the other side as query
+    write_hits(os.path.join(path, "C_A.m8"), [
+        ("Cx", "Ax", 150), ("Cy", "Ay", 140), ("Cx", "Ay", 55)])
+    write_hits(os.path.join(path, "B_C.m8"), [
+        ("Bx", "Cx", 150), ("By", "Cy", 140), ("By", "Cx", 55),
+        ("By", "Cx", 20)])
+    blastfiles = [os.path.join(path, x)
+                  for x in ("A_B.m8", "C_A.m8", "B_C.m8")]
+    return stree, genes, blastfiles
+
+
+class FamCluster (unittest.TestCase):
+
+    def test_cluster(self):
+        """Families should be recovered with and without spilling"""
+
+        path = "test/tmp/test_famcluster"
+        make_clean_dir(path)
+        stree, genes, blastfiles = make_data(path)
+        expected = [["Ax", "Bx", "Cx"], ["Ay", "By", "Cy"]]
+
+        for nproc, maxmem in ((1, 1e9), (1, 1), (2, 1)):
+            parts = famcluster.cluster_families(
+                CONF, genes, stree, blastfiles, nproc=nproc, maxmem=maxmem,
+                tmpdir=os.path.join(path, "tmp%d_%d" % (nproc, maxmem)))
+            self.assertEqual(sorted(map(sorted, parts)), expected)
+
+        famcluster.write_famtab(os.path.join(path, "fams.tab"), parts)
+        famtab = tablelib.read_table(os.path.join(path, "fams.tab"))
+        self.assertEqual(famtab.headers, ["famid", "genes"])
+        self.assertEqual(sorted(sorted(row["genes"].split(","))
+                                for row in famtab), expected)
+
+    def test_outgroup(self):
+        """Partitions should not merge if the outgroup scores better"""
+
+        hits = (np.array([0, 1]), np.array([2, 3]),
+                np.array([100., 10.]), np.array([True, True]))
+        outhits = (np.array([1]), np.array([50.]))
+        parts = famcluster.merge_parts([[0], [1]], [[2], [3]], hits,
+                                       outhits, 4)
+        self.assertEqual(sorted(map(sorted, parts)), [[0, 2], [1], [3]])
+
+        # without the outgroup, 1 and 3 merge
+        parts = famcluster.merge_parts(
+            [[0], [1]], [[2], [3]], hits,
+            (np.zeros(0, dtype=int), np.zeros(0)), 4)
+        self.assertEqual(sorted(map(sorted, parts)), [[0, 2], [1, 3]])
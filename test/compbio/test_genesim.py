@@ -0,0 +1,78 @@
+from math import exp
+import os
+import random
+import unittest
+
+from compbio import genesim
+
+from rasmus import treelib
+from rasmus.testing import fequal
+from rasmus.testing import make_clean_dir
+
+
+class GeneSim (unittest.TestCase):
+
+    def test_dl_size(self):
+        """Mean family size should match the birth-death process"""
+
+        stree = treelib.parse_newick("((A:1,B:1):1,(C:1.5,D:1.5):.5);")
+        timeline = genesim.SpeciesTimeline(stree)
+        duprate, lossrate = .3, .1
+        rng = random.Random(1)
+
+        sizes = []
+        for i in xrange(3000):
+            tree, brecon, doomed = genesim.sample_dltr_gene_tree(
+                timeline, duprate, lossrate, 0.0, 0.0, rng=rng)
+            sizes.append(len(tree.leaves()) if tree.root else 0)
+
+        fequal(sum(sizes) / float(len(sizes)),
+               4 * exp(2 * (duprate - lossrate)), .05)
+
+    def test_transfers(self):
+        stree = treelib.parse_newick("((A:1,B:1):1,(C:1.5,D:1.5):.5);")
+        timeline = genesim.SpeciesTimeline(stree)
+        rng = random.Random(2)
+
+        for i in xrange(200):
+            tree, brecon, doomed = genesim.sample_dltr_gene_tree(
+                timeline, .2, .2, .3, .1, rng=rng)
+            if tree.root is None:
+                continue
+
+            # every gene maps to its species
+            for leaf in tree.leaves():
+                self.assertEqual(brecon[leaf][-1][0].name,
+                                 leaf.name.split("_")[0])
+                self.assertEqual(brecon[leaf][-1][1], "gene")
+
+    def test_reproducible(self):
+        """Families should not depend on the number of processes"""
+
+        stree = treelib.parse_newick("((A:1,B:1):1,(C:1.5,D:1.5):.5);")
+        params = dict(duprate=.3, lossrate=.2, transrate=.1)
+        fams1 = list(genesim.iter_families(stree, range(20), seed=3,
+                                           **params))
+        fams2 = list(genesim.iter_families(stree, range(20), seed=3,
+                                           nproc=2, **params))
+        self.assertEqual(fams1, fams2)
+        self.assertEqual([famid for famid, outputs in fams1], range(20))
+
+        tree = treelib.parse_newick(fams1[0][1]["newick"])
+        self.assertTrue(len(tree.leaves()) >= 4)
+
+    def test_write_dirs(self):
+        """Outputs may be written under several extensions"""
+
+        make_clean_dir("test/tmp/test_genesim")
+        stree = treelib.parse_newick("((A:1,B:1):1,(C:1.5,D:1.5):.5);")
+        fams = genesim.iter_families(stree, range(2), seed=1, duprate=.3,
+                                     lossrate=.2, genelen=30)
+        genesim.write_family_dirs(
+            "test/tmp/test_genesim", fams,
+            {"tree": ".tree", "align": [".align", ".fasta"]})
+        for famid in range(2):
+            prefix = "test/tmp/test_genesim/%d/%d" % (famid, famid)
+            self.assertTrue(os.path.exists(prefix + ".tree"))
+            self.assertEqual(open(prefix + ".align").read(),
+                             open(prefix + ".fasta").read())
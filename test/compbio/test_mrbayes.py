@@ -0,0 +1,107 @@
+import os
+import random
+import unittest
+
+from rasmus import treelib
+from rasmus.testing import make_clean_dir
+from compbio import mrbayes
+from compbio import phylo
+
+
+NAMES = ["human", "chimp", "gorilla", "orangutan", "macaque", "marmoset"]
+
+
+def random_tree(rand):
+    """Returns a random unrooted newick tree of taxon numbers"""
+    nodes = ["%d:0.1" % (i + 1) for i in xrange(len(NAMES))]
+    while len(nodes) > 3:
+        a = nodes.pop(rand.randrange(len(nodes)))
+        b = nodes.pop(rand.randrange(len(nodes)))
+        nodes.append("(%s,%s):%.2f" % (a, b, rand.random()))
+    return "(%s);" % ",".join(nodes)
+
+
+def write_run(filename, trees, label="gen", step=100):
+    out = open(filename, "w")
+    out.write("#NEXUS\n[ID: 1234]\nbegin trees;\n   translate\n")
+    for i, name in enumerate(NAMES):
+        out.write("      %d %s%s\n" % (i + 1, name,
+                                       ";" if i == len(NAMES) - 1 else ","))
+    for i, tree in enumerate(trees):
+        out.write("   tree %s.%d = [&U] %s\n" % (label, i * step, tree))
+    out.write("end;\n")
+    out.close()
+
+
+class NexusTrees (unittest.TestCase):
+
+    def setUp(self):
+        self.path = "test/tmp/test_mrbayes"
+        make_clean_dir(self.path)
+        rand = random.Random(1)
+        self.trees = [random_tree(rand) for i in xrange(20)]
+        self.filename = os.path.join(self.path, "run1.t")
+        write_run(self.filename, self.trees)
+
+    def test_trees(self):
+        """Trees, newick strings and splits should agree"""
+
+        trees = list(mrbayes.read_nexus_trees(open(self.filename)))
+        newicks = list(mrbayes.NexusTreeReader(self.filename).iter_newick())
+        reader = mrbayes.NexusTreeReader(self.filename)
+        splits = list(reader.iter_splits())
+        self.assertEqual(len(trees), 20)
+        self.assertEqual(reader.names, NAMES)
+
+        for tree, newick, tree_splits in zip(trees, newicks, splits):
+            self.assertEqual(sorted(tree.leaf_names()), sorted(NAMES))
+            tree2 = treelib.parse_newick(newick)
+            self.assertEqual(sorted(phylo.find_splits(tree2)),
+                             sorted(phylo.find_splits(tree)))
+            self.assertEqual(len(tree_splits), 3)
+
+            expected = set(split[1] if "human" in split[0] else split[0]
+                           for split in phylo.find_splits(tree))
+            self.assertEqual(
+                set(tuple(sorted(reader.split_names(split)))
+                    for split in tree_splits),
+                expected)
+
+    def test_thin(self):
+        """Burn-in and thinning should select samples"""
+
+        reader = mrbayes.NexusTreeReader(self.filename, burnin=2, thin=3)
+        self.assertEqual([gen for gen, newick in reader.iter_lines()],
+                         [200, 500, 800, 1100, 1400, 1700])
+
+        reader = mrbayes.NexusTreeReader(self.filename, burnin=.25)
+        self.assertEqual(len(list(reader.iter_newick())), 15)
+
+        reader = mrbayes.NexusTreeReader(open(self.filename), genstep=500)
+        self.assertEqual([gen for gen, newick in reader.iter_lines()],
+                         [0, 500, 1000, 1500])
+
+        # old style labels
+        filename = os.path.join(self.path, "rep.t")
+        write_run(filename, self.trees, label="rep")
+        self.assertEqual(
+            list(mrbayes.NexusTreeReader(filename, thin=7).iter_newick()),
+            list(mrbayes.NexusTreeReader(self.filename,
+                                         thin=7).iter_newick()))
+
+    def test_convergence(self):
+        """Identical runs should have zero ASDSF"""
+
+        filename2 = os.path.join(self.path, "run2.t")
+        write_run(filename2, self.trees)
+        freqs = mrbayes.split_frequencies([self.filename, filename2],
+                                          nproc=2)
+        self.assertEqual(freqs[0], freqs[1])
+        self.assertAlmostEqual(sum(freqs[0].values()), 3.0)
+        self.assertEqual(mrbayes.avg_std_split_freq(freqs), 0.0)
+
+        filename3 = os.path.join(self.path, "run3.t")
+        write_run(filename3, self.trees[::-1][:5])
+        freqs = mrbayes.split_frequencies([self.filename, filename3])
+        self.assertTrue(mrbayes.avg_std_split_freq(freqs) > 0.0)
+        self.assertRaises(Exception, mrbayes.avg_std_split_freq, freqs[:1])
@@ -0,0 +1,70 @@
+import random
+import unittest
+
+import numpy as np
+
+from compbio import coal
+from compbio import nj
+from compbio import phylo
+
+from rasmus import treelib
+from rasmus.testing import fequals
+
+
+def make_additive_tree(ntips, seed):
+    """Returns a random tree with string leaf names and varied branches"""
+    random.seed(seed)
+    tree = coal.sample_coal_tree(ntips, 100)
+    for node in tree:
+        node.dist *= random.uniform(.5, 2)
+    for leaf in tree.leaves():
+        tree.rename(leaf.name, "g%d" % leaf.name)
+    return tree
+
+
+class NJ (unittest.TestCase):
+
+    def test_additive(self):
+        """NJ and BIONJ should recover an additive tree exactly"""
+
+        tree = make_additive_tree(30, 1)
+        leaves = tree.leaf_names()
+        distmat = np.array(phylo.tree2distmat(tree, leaves))
+
+        for bionj in (False, True):
+            tree2 = nj.neighborjoin(distmat, leaves, bionj=bionj,
+                                    blocksize=7)
+            self.assertEqual(phylo.robinson_foulds_error(tree, tree2), 0.0)
+            fequals(np.array(phylo.tree2distmat(tree2, leaves)).flatten(),
+                    distmat.flatten(), eabs=1e-8)
+
+    def test_usertree(self):
+        """Merging should follow the usertree and keep its rooting"""
+
+        tree = make_additive_tree(20, 2)
+        leaves = tree.leaf_names()
+        distmat = phylo.tree2distmat(tree, leaves)
+
+        # a distorted matrix still gives the usertree topology
+        rand = random.Random(3)
+        distmat = [[d * rand.uniform(.8, 1.2) for d in row]
+                   for row in distmat]
+        distmat = [[(distmat[i][j] + distmat[j][i]) / 2.0
+                    for j in range(len(leaves))]
+                   for i in range(len(leaves))]
+
+        tree2 = nj.neighborjoin(distmat, leaves, usertree=tree)
+        self.assertEqual(phylo.robinson_foulds_error(tree, tree2,
+                                                     rooted=True), 0.0)
+        self.assertEqual(len(tree2.root.children), 2)
+
+    def test_int_names(self):
+        """Integer gene names should not clash with internal names"""
+
+        tree = treelib.parse_newick("((0:1,1:2):3,(2:4,(3:1,4:2):1):2);")
+        leaves = tree.leaf_names()
+        distmat = phylo.tree2distmat(tree, leaves)
+        tree2 = nj.neighborjoin(distmat, leaves)
+        self.assertEqual(sorted(tree2.leaf_names()), sorted(leaves))
+        fequals(np.array(phylo.tree2distmat(tree2, leaves)).flatten(),
+                np.array(distmat).flatten(), eabs=1e-8)
@@ -0,0 +1,115 @@
+import os
+import stat
+import sys
+import unittest
+
+from rasmus import treelib
+from rasmus.testing import make_clean_dir
+from compbio import fasta
+from compbio import phylobatch
+
+
+# a stand-in for dnaml: builds a caterpillar tree of the sequences in
+# 'infile' and fails on alignments of three sequences
+STANDIN = """\
+#!%(python)s
+import sys
+open("stdin", "w").write(sys.stdin.read())
+names = [line.split()[0] for line in open("infile").readlines()[1:]]
+if len(names) == 3:
+    sys.exit(1)
+tree = names[0]
+for name in names[1:]:
+    tree = "(%%s:1,%%s:1)" %% (tree, name)
+open("outtree", "w").write(tree + ";\\n")
+open("outfile", "w").write("Ln Likelihood = %%f\\n" %% (-10.0 * len(names)))
+"""
+
+
+def make_align(nseqs):
+    aln = fasta.FastaDict()
+    for i in xrange(nseqs):
+        aln["seq%d" % i] = "ACGT"
+    return aln
+
+
+class PhyloBatch (unittest.TestCase):
+
+    def setUp(self):
+        self.path = "test/tmp/test_phylobatch"
+        make_clean_dir(self.path)
+        self.exe = os.path.abspath(os.path.join(self.path, "standin"))
+        out = open(self.exe, "w")
+        out.write(STANDIN % {"python": sys.executable})
+        out.close()
+        os.chmod(self.exe, stat.S_IRWXU)
+
+    def test_batch(self):
+        """Jobs should run concurrently in separate directories"""
+
+        program = phylobatch.PhylipProgram("dnaml", exe=self.exe)
+        fasta_file = os.path.join(self.path, "five.fa")
+        make_align(5).write(fasta_file)
+        jobs = [("job%d" % i, make_align(i)) for i in xrange(4, 10)]
+        jobs.append(("five", fasta_file))
+        jobs.append(("bad", make_align(3)))
+
+        output = os.path.join(self.path, "results.tab")
+        results = phylobatch.run_batch(program, jobs, output, nproc=3)
+        self.assertEqual(len(results), 8)
+        for i in xrange(4, 10):
+            result = results["job%d" % i]
+            self.assertEqual(result["status"], "done")
+            self.assertEqual(result["logl"], -10.0 * i)
+            self.assertEqual(sorted(result["tree"].leaf_names()),
+                             sorted(make_align(i).keys()))
+        self.assertEqual(results["five"]["logl"], -50.0)
+        self.assertEqual(results["bad"]["status"], "error")
+        self.assertEqual(results["bad"]["tree"], None)
+
+        # only the failed job keeps its working directory
+        self.assertEqual(os.listdir(output + ".jobs"), ["7.bad"])
+        self.assertFalse(os.path.exists("infile"))
+
+    def test_resume(self):
+        """Jobs already done should not be rerun"""
+
+        program = phylobatch.PhylipProgram("dnaml", exe=self.exe)
+        output = os.path.join(self.path, "results.tab")
+        jobs = [("a", make_align(4)), ("b", make_align(3))]
+        phylobatch.run_batch(program, jobs, output)
+
+        # fix the failed job and add a new one
+        jobs = [("a", make_align(4)), ("b", make_align(5)),
+                ("c", make_align(6))]
+        results = phylobatch.run_batch(program, jobs, output, nproc=2)
+        self.assertEqual([results[name]["status"] for name in "abc"],
+                         ["done"] * 3)
+        names = [line.split("\t")[0] for line in open(output)][1:]
+        self.assertEqual(sorted(names), ["a", "b", "b", "c"])
+
+        tree = treelib.parse_newick("(((seq0:1,seq1:1):1,seq2:1):1,seq3:1);")
+        self.assertEqual(results["a"]["tree"].get_one_line_newick(),
+                         tree.get_one_line_newick())
+
+    def test_extra(self):
+        """Extra arguments should be given to the program"""
+
+        # menu choices come before accepting the PHYLIP menu
+        program = phylobatch.get_program("dnaml", exe=self.exe,
+                                         extra=["j", "5", "3"])
+        jobdir = os.path.join(self.path, "extra")
+        result = phylobatch.run_job(program, "a", make_align(4), jobdir,
+                                    keep=True)
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(open(os.path.join(jobdir, "stdin")).read(),
+                         "j\n5\n3\ny\n")
+
+        # MrBayes commands run after the MCMC
+        program = phylobatch.get_program("mrbayes", "dna",
+                                         extra=["sump", "relburnin=no;"])
+        os.makedirs(os.path.join(self.path, "mb"))
+        program.setup(os.path.join(self.path, "mb"), make_align(4))
+        nexus = open(os.path.join(self.path, "mb", "infile.nex")).read()
+        self.assertTrue("sump relburnin=no; sumt contype=allcompat;" in
+                        nexus)
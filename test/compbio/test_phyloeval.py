@@ -0,0 +1,87 @@
+import os
+import unittest
+
+from rasmus import treelib
+from rasmus.testing import make_clean_dir
+from compbio import phylo
+from compbio import phyloeval
+
+
+STREE = "((A:1,B:1):1,C:2);"
+TREES = {
+    "fam1": "(((a1:1,b1:1):1,(a2:1,b2:1):1):1,c1:2);",
+    "fam2": "((a1:1,b1:1):1,c1:2);",
+    "fam3": "(((a1:1,a2:1):1,b1:1):1,c1:2);",
+}
+WRONG = {
+    "fam1": "(((a1:1,a2:1):1,(b1:1,b2:1):1):1,c1:2);",
+    "fam2": "((a1:1,c1:1):1,b1:2);",
+}
+
+
+def write_trees(path, ext, trees):
+    for name, newick in trees.iteritems():
+        os.makedirs(os.path.join(path, name))
+        treelib.parse_newick(newick).write(
+            os.path.join(path, name, name + ext))
+
+
+class PhyloEval (unittest.TestCase):
+
+    def setUp(self):
+        self.path = "test/tmp/test_phyloeval"
+        make_clean_dir(self.path)
+        write_trees(os.path.join(self.path, "data"), ".tree", TREES)
+        write_trees(os.path.join(self.path, "good"), ".tree", TREES)
+        write_trees(os.path.join(self.path, "bad"), ".tree", WRONG)
+
+        self.stree = os.path.join(self.path, "stree")
+        self.smap = os.path.join(self.path, "smap")
+        treelib.parse_newick(STREE).write(self.stree)
+        open(self.smap, "w").write("a*\tA\nb*\tB\nc*\tC\n")
+
+    def test_evaluate_trees(self):
+        stree = treelib.parse_newick(STREE)
+        gene2species = phylo.read_gene2species(self.smap)
+        row = phyloeval.evaluate_trees(
+            treelib.parse_newick(TREES["fam1"]),
+            treelib.parse_newick(WRONG["fam1"]), stree, gene2species)
+        self.assertEqual(row["top_correct"], 0)
+        self.assertEqual(row["dup_actual"], 1)
+        self.assertEqual(row["dup_pred"], 2)
+        self.assertEqual(row["dup_sn"], 0.0)
+        self.assertEqual(row["dup_error"], 1)
+        self.assertEqual(row["loss_error"], 0)
+        self.assertAlmostEqual(row["rooted_rf"], 2 / 3.)
+
+    def test_families(self):
+        """Methods should be evaluated and summarized in parallel"""
+
+        methods = [("good", os.path.join(self.path, "good"), ".tree"),
+                   ("bad", os.path.join(self.path, "bad"), ".tree")]
+        names = sorted(TREES)
+        tab = phyloeval.evaluate_families(
+            methods, names, os.path.join(self.path, "data"), ".tree",
+            stree=self.stree, gene2species=self.smap, nproc=2)
+
+        # bad has no tree for fam3
+        self.assertEqual(tab.cget("method", "tree"),
+                         [["good"] * 3 + ["bad"] * 2,
+                          names + names[:2]])
+        tab2 = phyloeval.evaluate_families(
+            methods, names, os.path.join(self.path, "data"), ".tree",
+            stree=treelib.read_tree(self.stree),
+            gene2species=phylo.read_gene2species(self.smap))
+        self.assertEqual(list(tab), list(tab2))
+
+        summary = phyloeval.summarize_evals(tab)
+        self.assertEqual(summary.cget("method"), ["good", "bad"])
+        good, bad = summary
+        self.assertEqual(good["nfams"], 3)
+        self.assertEqual(good["top_correct"], 1.0)
+        self.assertEqual(good["rf"], 0.0)
+        self.assertEqual(good["dup_error"], 0.0)
+        # the wrong fam2 tree only differs by its rooting
+        self.assertEqual(bad["top_correct"], 0.5)
+        self.assertTrue(bad["rooted_rf"] > 0.0)
+        self.assertTrue(bad["loss_error"] > 0.0)
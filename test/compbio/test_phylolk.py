@@ -0,0 +1,134 @@
+import itertools
+import math
+import random
+import unittest
+
+from rasmus import treelib
+from rasmus.treelib import parse_newick
+
+from compbio import fasta
+from compbio import phylo
+from compbio import phylolk
+from compbio import seqarray
+
+
+def brute_logl(tree, seqs, matrix_func, bgfreq):
+    """Sum the likelihood over every assignment of internal states"""
+    lookup = {"A": 0, "C": 1, "G": 2, "T": 3}
+    internal = [node for node in tree.postorder() if not node.is_leaf()]
+    logl = 0.0
+    for k in xrange(len(seqs.values()[0])):
+        total = 0.0
+        for states in itertools.product(range(4), repeat=len(internal)):
+            state = dict(zip(internal, states))
+            prob = bgfreq[state[tree.root]]
+            for node in tree:
+                if node == tree.root:
+                    continue
+                mat = matrix_func(node.dist)
+                if node.is_leaf():
+                    char = seqs[node.name][k]
+                    if char in lookup:
+                        prob *= mat[state[node.parent]][lookup[char]]
+                else:
+                    prob *= mat[state[node.parent]][state[node]]
+            total += prob
+        logl += math.log(total)
+    return logl
+
+
+class Likelihood (unittest.TestCase):
+
+    def setUp(self):
+        self.tree = parse_newick("((a:.1,b:.2):.05,(c:.3,d:.1):.2,e:.4);")
+        self.seqs = fasta.FastaDict()
+        self.seqs["a"] = "ACGTTA-CAAAC"
+        self.seqs["b"] = "ACGTTACCAAAC"
+        self.seqs["c"] = "AAGTTNCGAAAA"
+        self.seqs["d"] = "ACGATACGATAC"
+        self.seqs["e"] = "TCGTTACGAATC"
+
+    def test_logl(self):
+        """Likelihood should match the sum over internal states"""
+
+        lk = phylolk.TreeLikelihood(self.seqs)
+        self.assertEqual(lk.sites.patterns.shape, (5, 10))
+        self.assertEqual(lk.sites.counts.sum(), 12)
+        self.assertAlmostEqual(
+            lk.get_logl(self.tree),
+            brute_logl(self.tree, self.seqs, phylo.make_jc_matrix,
+                       [.25] * 4))
+
+        bgfreq = [.1, .2, .3, .4]
+
+        def matrix_func(t):
+            return phylo.make_hky_matrix(t, bgfreq, 3.0)
+
+        logl = phylolk.calc_tree_logl(self.tree, self.seqs, matrix_func,
+                                      bgfreq)
+        self.assertAlmostEqual(
+            logl, brute_logl(self.tree, self.seqs, matrix_func, bgfreq))
+
+        # the likelihood of a reversible model does not depend on the root
+        tree = treelib.reroot(self.tree, "c", newCopy=True)
+        self.assertAlmostEqual(
+            logl, phylolk.calc_tree_logl(tree, self.seqs, matrix_func,
+                                         bgfreq))
+
+    def test_patterns(self):
+        """Columns added to the site patterns should be scored"""
+
+        names = sorted(self.seqs.keys())
+        aln = seqarray.AlignMatrix.from_seqs(self.seqs)
+        sites = seqarray.SitePatterns(aln.select_columns(range(6)))
+        lk = phylolk.TreeLikelihood(sites)
+        lk(self.tree)
+
+        sites.add_columns(aln.matrix[:, 6:])
+        self.assertAlmostEqual(
+            lk(self.tree), phylolk.calc_tree_logl(self.tree, self.seqs))
+
+        # weights of a bootstrap replicate
+        weights = [0, 2, 0, 1, 1, 0, 3, 1, 0, 2, 1, 1]
+        rep = fasta.FastaDict()
+        for name in names:
+            rep[name] = "".join(char * weight for char, weight in
+                                zip(self.seqs[name], weights))
+        lk = phylolk.TreeLikelihood(sites, weights=weights)
+        self.assertAlmostEqual(
+            lk(self.tree), phylolk.calc_tree_logl(self.tree, rep))
+
+    def test_search(self):
+        """Only changed nodes should be recomputed during a search"""
+
+        random.seed(1)
+        tree = parse_newick(
+            "((((a:.1,b:.2):.1,c:.1):.2,(d:.1,e:.3):.1):.1,"
+            "((f:.2,g:.1):.1,(h:.1,i:.2):.3):.1);")
+        seqs = phylo.sim_seq_tree(tree, 200)
+        lk = phylolk.TreeLikelihood(seqs)
+        lk(tree)
+        self.assertEqual(lk.nupdates, 8)
+
+        search = phylo.TreeSearchMix(tree)
+        search.add_proposer(phylo.TreeSearchNni(tree), .5)
+        search.add_proposer(phylo.TreeSearchSpr(tree), .5)
+        for i in xrange(50):
+            search.propose()
+            nupdates = lk.nupdates
+            logl = lk(tree)
+            self.assertTrue(lk.nupdates - nupdates < 8)
+            self.assertAlmostEqual(logl,
+                                   phylolk.calc_tree_logl(tree, seqs))
+            search.revert()
+
+        # changed branch lengths are noticed too
+        tree.nodes["a"].dist = .5
+        logl = lk(tree)
+        self.assertAlmostEqual(logl, phylolk.calc_tree_logl(tree, seqs))
+
+        # score proposals in-process
+        search = phylo.TreeSearchPrescreen(
+            tree, phylo.TreeSearchNni(tree), lk, 10)
+        search.propose()
+        treelib.assert_tree(tree)
@@ -0,0 +1,222 @@
+from StringIO import StringIO
+import math
+import unittest
+
+from rasmus import util
+from rasmus.testing import make_clean_dir
+
+from compbio import alignlib
+from compbio import fasta
+from compbio import phylip
+from compbio import seqarray
+
+
+def count_weights(aln, weights):
+    return int(weights.sum())
+
+
+def calc_boot_dists(aln, weights):
+    return seqarray.calc_dist_matrix(aln, weights=weights)
+
+
+class Bootstrap (unittest.TestCase):
+
+    def setUp(self):
+        self.seqs = fasta.FastaDict()
+        self.seqs["a"] = "ACGTNNAC-T"
+        self.seqs["b"] = "ACGTTAACGT"
+        self.seqs["c"] = "TCGAXAACGT"
+        self.aln = seqarray.AlignMatrix.from_seqs(
+            self.seqs, seqarray.find_alphabet(self.seqs))
+
+    def test_weights(self):
+        """Replicates should be reproducible from the seed"""
+
+        sampler = seqarray.BootstrapSampler(self.aln, 20, seed=7)
+        weights = sampler.get_all_weights()
+        self.assertEqual(weights.shape, (20, 10))
+        self.assertTrue((weights.sum(1) == 10).all())
+        self.assertTrue((weights[5] == sampler.get_weights(5)).all())
+        self.assertFalse((weights[5] == weights[6]).all())
+
+        sampler2 = seqarray.BootstrapSampler(self.aln, 20, seed=7)
+        self.assertTrue((sampler2.get_all_weights() == weights).all())
+        self.assertEqual(sampler.map(count_weights), [10] * 20)
+        self.assertEqual(sampler.map(count_weights, nproc=2), [10] * 20)
+
+        # replicates keep every character
+        rep = sampler.get_replicate(3)
+        cols = sampler.get_columns(3)
+        for name, seq in rep.iter_seqs():
+            self.assertEqual(seq, "".join(self.seqs[name][j] for j in cols))
+
+    def test_write(self):
+        """Replicates should be written as seqboot would"""
+
+        out = StringIO()
+        sampler = seqarray.BootstrapSampler(self.aln, 3, seed=1)
+        labels = sampler.write_phylip(out)
+        self.assertEqual(labels, ["a", "b", "c"])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(lines[0], "3 10")
+        self.assertEqual(lines[4], "3 10")
+
+        seqs = phylip.read_phylip_align(StringIO("\n".join(lines[4:8])))
+        rep = sampler.get_replicate(1)
+        self.assertEqual(sorted(seqs.values()),
+                         sorted(rep.get_seq(i) for i in xrange(3)))
+
+        out2 = StringIO()
+        phylip.write_boot_align(out2, self.seqs, 3, seed=1)
+        self.assertEqual(out2.getvalue(), out.getvalue())
+
+        out = StringIO()
+        sampler.write_replicate(2, out)
+        out.seek(0)
+        rep = fasta.read_fasta(out)
+        self.assertEqual(rep.keys(), ["a", "b", "c"])
+        cols = sampler.get_columns(2)
+        self.assertEqual(rep["a"], "".join(self.seqs["a"][j] for j in cols))
+
+        # files opened from filenames are closed
+        make_clean_dir("test/tmp/seqarray")
+        streams = []
+        open_stream = util.open_stream
+
+        def open_stream2(filename, mode="r"):
+            stream = open_stream(filename, mode)
+            if isinstance(filename, str):
+                streams.append(stream)
+            return stream
+
+        util.open_stream = open_stream2
+        try:
+            filename = "test/tmp/seqarray/boot.phy"
+            sampler.write_phylip(filename)
+            for format in ("fasta", "phylip"):
+                sampler.write_replicate(2, filename + "." + format,
+                                        format=format)
+        finally:
+            util.open_stream = open_stream
+        self.assertEqual(len(streams), 3)
+        self.assertTrue(all(stream.closed for stream in streams))
+        self.assertEqual(open(filename).read(), out2.getvalue())
+
+
+class Patterns (unittest.TestCase):
+
+    def test_patterns(self):
+        """Alignments should be compressed into unique columns"""
+
+        seqs = fasta.FastaDict()
+        seqs["a"] = "AACAAC-"
+        seqs["b"] = "AAGAAGA"
+        aln = seqarray.AlignMatrix.from_seqs(seqs)
+        sites = seqarray.SitePatterns(aln)
+        self.assertEqual(len(sites), 3)
+        self.assertEqual(sites.get_ncols(), 7)
+        self.assertEqual(sites.counts.tolist(), [4, 2, 1])
+        self.assertEqual(sites.get_align().get_seq(0), "AC-")
+        self.assertTrue((sites.expand().matrix == aln.matrix).all())
+
+        # new columns keep the known patterns
+        more = seqarray.AlignMatrix.from_seqs({"a": "TA", "b": "TA"},
+                                              names=["a", "b"])
+        sites.add_columns(more.matrix, weights=[1, 2])
+        self.assertEqual(len(sites), 4)
+        self.assertEqual(sites.counts.tolist(), [6, 2, 1, 1])
+        self.assertEqual(sites.index.tolist(), [0, 0, 1, 0, 0, 1, 2, 3, 0])
+
+        weights = [0, 1, 2, 0, 0, 0, 0, 0, 3]
+        self.assertEqual(sites.get_counts(weights).tolist(), [4, 2, 0, 0])
+
+    def test_dists(self):
+        """Distances of patterns should be those of the alignment"""
+
+        seqs = fasta.FastaDict()
+        seqs["a"] = "ACGTACGTACACGT"
+        seqs["b"] = "GCGTACGTAAGCGT"
+        seqs["c"] = "GCGTAC--AAGCGT"
+        aln = seqarray.AlignMatrix.from_seqs(seqs)
+        sites = seqarray.SitePatterns(aln)
+        self.assertEqual(len(sites), 8)
+
+        for method in seqarray.DIST_METHODS:
+            self.assertEqual(seqarray.calc_dist_matrix(sites, method),
+                             seqarray.calc_dist_matrix(aln, method))
+        sampler = seqarray.BootstrapSampler(aln, 3, seed=2)
+        weights = sampler.get_weights(1)
+        self.assertEqual(
+            seqarray.calc_dist_matrix(sites, weights=weights, pairwise=False),
+            seqarray.calc_dist_matrix(sampler.get_replicate(1),
+                                      pairwise=False))
+
+
+class Distances (unittest.TestCase):
+
+    def setUp(self):
+        self.seqs = fasta.FastaDict()
+        self.seqs["a"] = "ACGTACGTAC"
+        self.seqs["b"] = "GCGTACGTAA"
+        self.seqs["c"] = "GCGTAC--AA"
+        self.aln = seqarray.AlignMatrix.from_seqs(self.seqs)
+
+    def test_counts(self):
+        """Pairs should be compared with pairwise deletion"""
+
+        sites, diffs, tsits = seqarray.count_diffs(self.aln, transitions=True)
+        self.assertEqual(sites.tolist(), [[10, 10, 8],
+                                          [10, 10, 8],
+                                          [8, 8, 8]])
+        self.assertEqual(diffs.tolist(), [[0, 2, 2],
+                                          [2, 0, 0],
+                                          [2, 0, 0]])
+        # A->G is a transition, C->A a transversion
+        self.assertEqual(tsits.tolist(), [[0, 1, 1],
+                                          [1, 0, 0],
+                                          [1, 0, 0]])
+
+    def test_dists(self):
+        """Distances should be corrected and capped"""
+
+        mat = seqarray.calc_dist_matrix(self.aln, "p")
+        self.assertEqual(mat[0], [0.0, 0.2, 0.25])
+        mat = seqarray.calc_dist_matrix(self.aln, "p", pairwise=False)
+        self.assertEqual(mat[0], [0.0, 0.25, 0.25])
+
+        mat = seqarray.calc_dist_matrix(self.aln, "jc")
+        self.assertAlmostEqual(mat[0][1],
+                               -.75 * math.log(1 - 4 / 3. * .2))
+        mat = seqarray.calc_dist_matrix(self.aln, "k2p")
+        self.assertAlmostEqual(mat[0][1],
+                               -.5 * math.log(1 - .2 - .1) -
+                               .25 * math.log(1 - .2))
+        mat2 = seqarray.calc_dist_matrix(self.aln, "k2p", nproc=2,
+                                         blocksize=1)
+        self.assertEqual(mat, mat2)
+
+        # saturated distances are -1 unless capped
+        dists = seqarray.correct_dists([10, 10], [1, 8], method="jc")
+        self.assertEqual(dists[1], -1)
+        self.assertEqual(phylip.correct_dist_matrix([dists]),
+                         [[dists[0], dists[0]]])
+
+        # bootstrap weights are the same as resampled columns
+        sampler = seqarray.BootstrapSampler(self.aln, 5, seed=3)
+        mats = sampler.map(calc_boot_dists)
+        for i, mat in enumerate(mats):
+            self.assertEqual(
+                mat, seqarray.calc_dist_matrix(sampler.get_replicate(i)))
+
+    def test_four_fold(self):
+        """Four-fold sites should be found for each pair"""
+
+        seqs = fasta.FastaDict()
+        seqs["a"] = "GCAGCAAAAGCA"
+        seqs["b"] = "GCTGCGAAG---"
+        seqs["c"] = "GCTCCANNNCCC"
+        mat = alignlib.calc_four_fold_dist_matrix(seqs)
+        self.assertEqual(mat, [[0.0, 1.0, 1.0],
+                               [1.0, 0.0, 0.5],
+                               [1.0, 0.5, 0.0]])
@@ -0,0 +1,71 @@
+from math import exp
+from StringIO import StringIO
+import unittest
+
+import numpy as np
+
+from compbio import fasta
+from compbio import phylo
+from compbio import seqsim
+
+from rasmus import treelib
+from rasmus.testing import fequal
+from rasmus.testing import fequals
+
+
+class SimSeq (unittest.TestCase):
+
+    def test_jc_branch(self):
+        """Substitution fraction should match Jukes-Cantor"""
+
+        rng = np.random.RandomState(1)
+        t = .3
+        seq = rng.randint(0, 4, 100000).astype(np.uint8)
+        seq2 = seqsim.sim_seq_branch(seq, t, phylo.make_jc_matrix, rng=rng)
+        fequal((seq != seq2).mean(), .75 * (1 - exp(-4 * t / 3.)), .02)
+
+    def test_hky_freqs(self):
+        """Long branches should reach the HKY background frequencies"""
+
+        bgfreq = [.1, .2, .3, .4]
+        rng = np.random.RandomState(2)
+
+        def matrix_func(t):
+            return phylo.make_hky_matrix(t, bgfreq, kappa=2.0)
+
+        seq = np.zeros(100000, dtype=np.uint8)
+        seq2 = seqsim.sim_seq_branch(seq, 20.0, matrix_func, rng=rng)
+        fequals(np.bincount(seq2, minlength=4) / float(len(seq2)),
+                bgfreq, .05)
+
+    def test_site_rates(self):
+        rates = seqsim.discrete_gamma_rates(.5, 4)
+        fequal(rates.mean(), 1.0)
+        self.assertTrue((np.diff(rates) > 0).all())
+
+        rng = np.random.RandomState(3)
+        site_rates = seqsim.sample_site_rates(1000, alpha=.5, rng=rng)
+        seq = np.zeros(1000, dtype=np.uint8)
+        seq2 = seqsim.sim_seq_branch(seq, .2, site_rates=site_rates, rng=rng)
+        self.assertEqual(len(seq2), 1000)
+
+    def test_sim_tree(self):
+        tree = treelib.parse_newick(
+            "(((a:.1,b:.2):.05,c:.3):.1,(d:.2,(e:.1,f:.1):.1):.1);")
+        aln = seqsim.sim_seq_tree(tree, 500, keep_internal=False,
+                                  rng=np.random.RandomState(4))
+        self.assertEqual(sorted(aln.names), sorted(tree.leaf_names()))
+        self.assertEqual(aln.matrix.shape, (6, 500))
+
+        # FASTA output should round trip
+        out = StringIO()
+        aln.write_fasta(out)
+        seqs = fasta.read_fasta(StringIO(out.getvalue()))
+        self.assertEqual(seqs.keys(), aln.names)
+        self.assertEqual(seqs["a"], aln.get_seq(aln.names.index("a")))
+
+        out = StringIO()
+        aln.write_phylip(out)
+        lines = out.getvalue().split("\n")
+        self.assertEqual(lines[0], "6 500")
+        self.assertEqual(lines[1], "_______0  " + aln.get_seq(0))
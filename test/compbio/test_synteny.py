@@ -0,0 +1,126 @@
+import random
+import unittest
+
+from compbio.regionlib import Region
+from compbio.synteny import fuzzy
+from compbio.synteny import strict
+
+from rasmus.sets import UnionFindArray
+
+
+def make_hits(nhits, seed):
+    """Random hits of equal length between two chromosome pairs"""
+    rand = random.Random(seed)
+    hits = []
+    for i in xrange(nhits):
+        start1 = rand.randint(0, 200000)
+        start2 = rand.randint(0, 200000)
+        hits.append((
+            Region("sp1", rand.choice("ab"), "gene", start1, start1 + 1000,
+                   rand.choice([1, -1])),
+            Region("sp2", rand.choice("xy"), "gene", start2, start2 + 1000,
+                   rand.choice([1, -1])),
+            i))
+    hits.sort(key=lambda hit: (hit[0].species, hit[0].seqname,
+                               hit[0].start))
+    return hits
+
+
+def make_genomes(nspecies, ngenes, seed):
+    """Genomes with shuffled segments of a shared gene order"""
+    rand = random.Random(seed)
+    regions = []
+    for sp in xrange(nspecies):
+        order = range(ngenes)
+        for k in xrange(3):
+            i, j = sorted(rand.sample(xrange(ngenes), 2))
+            order[i:j] = reversed(order[i:j])
+        for pos, gene in enumerate(order):
+            if rand.random() < .1:
+                continue
+            regions.append(Region(
+                "sp%d" % sp, "chr%d" % (pos * 2 // ngenes), "gene",
+                pos * 1000 + 1, pos * 1000 + 800, rand.choice([1, -1]),
+                {"ID": "sp%d_%d" % (sp, gene)}))
+    orths = [("sp%d_%d" % (a, gene), "sp%d_%d" % (b, gene))
+             for a in xrange(nspecies) for b in xrange(a + 1, nspecies)
+             for gene in xrange(ngenes)]
+    ids = set(region.data["ID"] for region in regions)
+    orths = [orth for orth in orths if orth[0] in ids and orth[1] in ids]
+    return regions, orths
+
+
+def block_key(block):
+    return (block.region1.species, block.region1.seqname,
+            block.region1.start, block.region1.end,
+            block.region2.species, block.region2.seqname,
+            block.region2.start, block.region2.end, block.dir)
+
+
+def get_clusters(clusters):
+    return set(frozenset(hit[2] for hit in cluster) for cluster in clusters)
+
+
+class FuzzySynteny (unittest.TestCase):
+
+    def test_grid_neighbors(self):
+        """Grid range queries should find the same neighbors as windows"""
+
+        hits = make_hits(2000, 1)
+        neighbors1 = sorted(
+            (hit[2], sorted(x[2] for x in syntenic))
+            for hit, syntenic in fuzzy.find_syntenic_neighbors(
+                hits, 3000, 5000))
+        neighbors2 = sorted(
+            (hit[2], sorted(x[2] for x in syntenic))
+            for hit, syntenic in fuzzy.find_syntenic_neighbors_grid(
+                hits, 3000, 5000))
+        self.assertEqual(neighbors1, neighbors2)
+
+    def test_grid_clusters(self):
+        hits = make_hits(2000, 2)
+        for samedir in (False, True):
+            self.assertEqual(
+                get_clusters(fuzzy.cluster_hits(
+                    hits, 3000, 5000, samedir=samedir)),
+                get_clusters(fuzzy.cluster_hits_grid(
+                    hits, 3000, 5000, samedir=samedir)))
+
+    def test_union_find_array(self):
+        sets = UnionFindArray(6)
+        sets.union(0, 3)
+        sets.union(4, 3)
+        sets.union(1, 5)
+        self.assertTrue(sets.same(0, 4))
+        self.assertFalse(sets.same(0, 1))
+        self.assertEqual(sets.components(), [[0, 3, 4], [1, 5], [2]])
+
+
+class StrictSynteny (unittest.TestCase):
+
+    def test_multi(self):
+        """Indexing all genomes once should give the pairwise blocks"""
+
+        regions, orths = make_genomes(4, 200, 3)
+        index = strict.SyntenyIndex(regions, orths)
+        pairs = index.get_species_pairs()
+        self.assertEqual(len(pairs), 6)
+
+        results = list(strict.iter_synteny(index, pairs))
+        results2 = list(strict.iter_synteny(index, pairs, nproc=2))
+        self.assertEqual(
+            [(pair, map(block_key, blocks)) for pair, blocks in results],
+            [(pair, map(block_key, blocks)) for pair, blocks in results2])
+
+        for (species1, species2), blocks in results:
+            regions1 = [x for x in regions if x.species == species1]
+            regions2 = [x for x in regions if x.species == species2]
+            pair = (species1, species2)
+            pair_orths = [orth for orth in orths
+                          if orth[0].split("_")[0] in pair and
+                          orth[1].split("_")[0] in pair]
+            blocks2 = strict.find_synteny(species1, species2,
+                                          regions1, regions2, pair_orths)
+            self.assertTrue(len(blocks) > 0)
+            self.assertEqual(map(block_key, blocks),
+                             map(block_key, blocks2))
@@ -0,0 +1,131 @@
+import random
+import unittest
+
+from rasmus import compress
+from rasmus import util
+from rasmus.testing import make_clean_dir
+
+
+def make_lines(nlines, seed=1):
+    rand = random.Random(seed)
+    return ["%d\t%s\n" % (i, "ACGT"[rand.randint(0, 3)] * rand.randint(1, 80))
+            for i in xrange(nlines)]
+
+
+class Compress (unittest.TestCase):
+
+    def test_roundtrip(self):
+        """Streams should be compressed by extension and detected by magic"""
+
+        make_clean_dir("test/tmp/test_compress")
+        lines = make_lines(20000)
+        formats = {".gz": compress.GZIP, ".bgz": compress.BGZF,
+                   ".bz2": compress.BZIP2, ".xz": compress.XZ}
+
+        for ext, fmt in formats.iteritems():
+            filename = "test/tmp/test_compress/lines.txt" + ext
+            out = util.open_stream(filename, "w", level=3)
+            out.writelines(lines)
+            out.close()
+
+            self.assertEqual(compress.detect_compression(filename), fmt)
+            self.assertEqual(list(util.open_stream(filename)), lines)
+
+            infile = util.open_stream(filename)
+            self.assertEqual(infile.readline(), lines[0])
+            self.assertEqual(infile.read(), "".join(lines[1:]))
+            infile.close()
+
+            # binary mode gives the raw bytes
+            infile = util.open_stream(filename, "rb")
+            self.assertEqual(compress.detect_compression_header(
+                infile.read(18)), fmt)
+            infile.close()
+
+        # plain files are unchanged
+        filename = "test/tmp/test_compress/lines.txt"
+        util.write_list(filename, [x.rstrip("\n") for x in lines])
+        self.assertEqual(compress.detect_compression(filename), None)
+        self.assertEqual(list(util.open_stream(filename)), lines)
+
+    def test_pipe_reader_errors(self):
+        """Truncated input should raise IOError from a decompressor"""
+
+        cmd = compress.find_program(compress.DECOMPRESSORS[compress.XZ],
+                                    threads=1)
+        if cmd is None:
+            return
+
+        make_clean_dir("test/tmp/test_compress")
+        lines = make_lines(20000, 3)
+        filename = "test/tmp/test_compress/lines.txt.xz"
+        out = compress.open_compressed(filename, "w")
+        out.writelines(lines)
+        out.close()
+
+        # stopping early is not an error
+        infile = compress.PipeReader(cmd, filename)
+        self.assertEqual(infile.readline(), lines[0])
+        infile.close()
+
+        data = open(filename, "rb").read()
+        open(filename, "wb").write(data[:len(data) // 2])
+
+        infile = compress.PipeReader(cmd, filename)
+        self.assertRaises(IOError, list, infile)
+        infile.close()
+
+        infile = compress.PipeReader(cmd, filename)
+        self.assertRaises(IOError, infile.read)
+        infile.close()
+
+        infile = util.open_stream(filename)
+        self.assertRaises(IOError, lambda: [line for line in iter(
+            infile.readline, "")])
+
+    def test_threaded_reader(self):
+        make_clean_dir("test/tmp/test_compress")
+        lines = make_lines(5000, 2)
+        filename = "test/tmp/test_compress/lines.txt.gz"
+        out = compress.open_compressed(filename, "w")
+        out.writelines(lines)
+        out.close()
+
+        import gzip
+        reader = compress.ThreadedReader(gzip.open(filename), chunksize=1000)
+        self.assertEqual(reader.read(10), "".join(lines)[:10])
+        self.assertEqual(reader.readline() + "".join(reader),
+                         "".join(lines)[10:])
+        reader.close()
+
+    def test_bgzf_index(self):
+        """BGZF files should support random access through an index"""
+
+        make_clean_dir("test/tmp/test_compress")
+        lines = make_lines(30000, 3)
+        text = "".join(lines)
+        filename = "test/tmp/test_compress/lines.bgz"
+        out = compress.BgzfWriter(filename)
+        out.writelines(lines)
+        out.close()
+
+        index = compress.make_bgzf_index(filename)
+        self.assertTrue(len(index) > 3)
+        compress.write_bgzf_index(filename + ".gzi", index)
+        self.assertEqual(compress.read_bgzf_index(filename + ".gzi"), index)
+
+        reader = compress.BgzfReader(filename)
+        rand = random.Random(4)
+        for i in xrange(50):
+            offset = rand.randint(0, len(text) - 1)
+            reader.seek(offset)
+            self.assertEqual(reader.tell(), offset)
+            self.assertEqual(reader.read(100000),
+                             text[offset:offset + 100000])
+
+        # line access from the start of a line
+        offset = len("".join(lines[:12345]))
+        reader.seek(offset)
+        self.assertEqual(reader.readline(), lines[12345])
+        self.assertEqual(reader.next(), lines[12346])
+        reader.close()
@@ -0,0 +1,91 @@
+from StringIO import StringIO
+import unittest
+
+from rasmus import delimlib
+from rasmus import matrixlib
+from rasmus import tablelib
+from rasmus import util
+
+
+TEXT = "a\t1\t2.5\tTrue\nb\t2\t-1\tFalse\n\nc\t3\t1e3\tTrue\n"
+
+
+class DelimLib (unittest.TestCase):
+
+    def test_converter(self):
+        """Compiled converters should match per-token conversion"""
+
+        types = [str, int, float, bool]
+        convert = delimlib.compile_converter(types)
+        self.assertEqual(convert(["a", "1", "2.5", "True"]),
+                         ["a", 1, 2.5, True])
+
+        # rows of other lengths are converted like izip()
+        self.assertEqual(convert(["a", "1"]), ["a", 1])
+        self.assertEqual(convert(["a", "1", "2", "False", "x"]),
+                         ["a", 1, 2.0, False])
+
+        self.assertEqual(delimlib.compile_converter(float)(["1", "2"]),
+                         [1.0, 2.0])
+        self.assertEqual(delimlib.compile_converter(None, parse=True)(
+            ["1", "2.5", "x"]), [1, 2.5, "x"])
+        self.assertEqual(delimlib.compile_converter(None), None)
+        self.assertRaises(ValueError, convert, ["a", "x", "2.5", "True"])
+
+    def test_rows(self):
+        """All tokenizer methods should give the same rows"""
+
+        lines = TEXT.splitlines(True)
+        expected = [line.rstrip("\n").split("\t") for line in lines]
+
+        for method in ("split", "csv"):
+            for chunksize in (1, 2, 1000):
+                rows = list(delimlib.iter_rows(
+                    StringIO(TEXT), chunksize=chunksize, method=method))
+                self.assertEqual(rows, expected)
+
+                chunks = list(delimlib.iter_chunks(
+                    StringIO(TEXT), chunksize=chunksize, method=method))
+                self.assertEqual(sum(chunks, []), expected)
+
+        self.assertEqual(util.read_delim(StringIO("1 2\n3 4\n"), " ",
+                                         parse=True), [[1, 2], [3, 4]])
+        reader = util.DelimReader(StringIO(TEXT), types=[str, int])
+        self.assertEqual(reader.next(), ["a", 1])
+        self.assertEqual(list(reader)[0], ["b", 2])
+
+    def test_table(self):
+        text = "##types:str\tint\tfloat\tbool\nname\tnum\tval\tflag\n" + TEXT
+        tab = tablelib.read_table(StringIO(text))
+        self.assertEqual(tab.cget("num", "val", "flag"),
+                         [[1, 2, 3], [2.5, -1.0, 1000.0],
+                          [True, False, True]])
+
+        text = "name\tnum\na\t1\nb\tx\n"
+        self.assertRaises(tablelib.TableException,
+                          tablelib.read_table, StringIO(text))
+
+    def test_arrays(self):
+        """numpy and python dense matrix readers should agree"""
+
+        text = "3\t2\n1\t2\n3.5\t4\n\n5\t-6e-2\n"
+        data = [[1.0, 2.0], [3.5, 4.0], [5.0, -0.06]]
+        self.assertEqual(matrixlib.read_dmat(StringIO(text), header=True),
+                         (3, 2, 6, data))
+
+        nrows, ncols, nnz, imat = matrixlib.iter_dmat(
+            StringIO(text), header=True)
+        self.assertEqual(list(imat), [(i, j, v) for i, row in enumerate(data)
+                                      for j, v in enumerate(row)])
+
+        for chunksize in (1, 2, 100):
+            mat = delimlib.read_array(StringIO(text), chunksize=chunksize)
+            self.assertEqual(mat.tolist(), [[3.0, 2.0]] + data)
+
+        # row lengths are checked by counting delimiters
+        text = "1\t2\n3\n4\t5\t6\n"
+        self.assertRaises(ValueError, delimlib.read_array,
+                          StringIO(text), delim="\t")
+        self.assertRaises(ValueError, matrixlib.read_dmat, StringIO(text))
+        self.assertRaises(ValueError, delimlib.read_array,
+                          StringIO("1 2\n3\n4 5\n"))
@@ -0,0 +1,77 @@
+from functools import partial
+import os
+import unittest
+
+from rasmus import depend
+from rasmus.testing import make_clean_dir
+
+
+def append_line(filename, line):
+    out = open(filename, "a")
+    out.write(line + "\n")
+    out.close()
+    return True
+
+
+def make_pipeline(statusdir, logfile):
+    """Make a diamond of function and shell jobs"""
+    pipeline = depend.EventPipeline(statusdir, background=False, nproc=2)
+    pipeline.add("a", partial(append_line, logfile, "a"))
+    pipeline.add("b", "echo b >> %s" % logfile, ["a"])
+    pipeline.add("c", partial(append_line, logfile, "c"), ["a"])
+    pipeline.add("d", lambda: append_line(logfile, "d"), ["b", "c"])
+    return pipeline
+
+
+class EventPipeline (unittest.TestCase):
+
+    def test_order(self):
+        """Jobs should run after their dependencies and only once"""
+
+        make_clean_dir("test/tmp/test_depend_order")
+        logfile = "test/tmp/test_depend_order/log"
+        statusdir = "test/tmp/test_depend_order/pipeline"
+
+        pipeline = make_pipeline(statusdir, logfile)
+        pipeline.run("d")
+        pipeline.process()
+
+        lines = open(logfile).read().split()
+        self.assertEqual(sorted(lines), ["a", "b", "c", "d"])
+        self.assertEqual(lines[0], "a")
+        self.assertEqual(lines[-1], "d")
+
+        # status is read back from the journal
+        pipeline = make_pipeline(statusdir, logfile)
+        pipeline.run("d")
+        pipeline.process()
+        self.assertEqual(len(open(logfile).read().split()), 4)
+        self.assertEqual(depend.StatusJournal(statusdir + "/journal").read(),
+                         dict((x, depend.STATUS_DONE) for x in "abcd"))
+
+        # undone jobs are run again
+        pipeline = make_pipeline(statusdir, logfile)
+        pipeline.undo("c")
+        pipeline.run("d")
+        pipeline.process()
+        self.assertEqual(open(logfile).read().split()[4:], ["c", "d"])
+
+    def test_error(self):
+        """A failed job should stop its descendants"""
+
+        make_clean_dir("test/tmp/test_depend_error")
+        logfile = "test/tmp/test_depend_error/log"
+        statusdir = "test/tmp/test_depend_error/pipeline"
+
+        pipeline = depend.EventPipeline(statusdir, background=False)
+        pipeline.add("a", "false")
+        pipeline.add("b", partial(append_line, logfile, "b"), ["a"])
+        pipeline.add("c", partial(append_line, logfile, "c"))
+        pipeline.run("b")
+        pipeline.run("c")
+        self.assertRaises(depend.PipelineException, pipeline.process)
+
+        self.assertEqual(pipeline.jobs["a"].status, depend.STATUS_ERROR)
+        self.assertEqual(pipeline.jobs["c"].status, depend.STATUS_DONE)
+        self.assertFalse(os.path.exists(logfile) and
+                         "b" in open(logfile).read().split())
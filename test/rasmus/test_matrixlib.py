@@ -0,0 +1,139 @@
+import os
+import random
+import unittest
+
+from rasmus import matrixlib
+from rasmus.testing import make_clean_dir
+
+
+def make_imat(nrows, ncols, density, seed):
+    """A random sparse matrix with values exactly representable in text"""
+    rand = random.Random(seed)
+    return [(i, j, float(rand.randint(1, 1000)))
+            for i in xrange(nrows) for j in xrange(ncols)
+            if rand.random() < density]
+
+
+class MatrixLib (unittest.TestCase):
+
+    def test_binary(self):
+        """Binary matrices should round trip with and without mmap"""
+
+        path = "test/tmp/test_matrixlib"
+        make_clean_dir(path)
+        imat = make_imat(30, 20, .2, 1)
+        dmat = matrixlib.imat2dmat(30, 20, len(imat), imat)
+
+        filename = os.path.join(path, "mat.csr")
+        matrixlib.write_csr(filename, 30, 20, None, iter(imat))
+        for mmap in (True, False):
+            nrows, ncols, nnz, csr = matrixlib.read_csr(filename, mmap=mmap)
+            self.assertEqual((nrows, ncols, nnz), (30, 20, len(imat)))
+            cols, vals = matrixlib.get_csr_row(csr, 3)
+            self.assertEqual(cols.tolist(),
+                             [j for i, j, v in imat if i == 3])
+        self.assertEqual(list(matrixlib.iter_csr(filename)[3]), imat)
+
+        # unordered entries need sorting
+        shuffled = list(imat)
+        random.Random(2).shuffle(shuffled)
+        self.assertRaises(ValueError, matrixlib.write_csr,
+                          filename, 30, 20, None, iter(shuffled))
+        self.assertFalse(os.path.exists(filename))
+        matrixlib.write_csr(filename, 30, 20, None, iter(shuffled),
+                            sort=True)
+        self.assertEqual(list(matrixlib.iter_csr(filename)[3]), imat)
+
+        filename = os.path.join(path, "mat.npy")
+        matrixlib.write_bdmat(filename, 30, 20, None, iter(shuffled))
+        nrows, ncols, nnz, mat = matrixlib.read_bdmat(filename)
+        self.assertEqual(mat.tolist(), dmat)
+        matrixlib.write_bdmat_blocks(filename, [dmat[:7], dmat[7:]])
+        self.assertEqual(matrixlib.open_bdmat(filename).tolist(), dmat)
+
+    def test_convert(self):
+        """Conversion through every format should preserve the matrix"""
+
+        path = "test/tmp/test_matrixlib"
+        make_clean_dir(path)
+        imat = make_imat(25, 25, .3, 3)
+        rowlabels = ["r%d" % i for i in xrange(25)]
+        collabels = ["c%d" % i for i in xrange(25)]
+
+        # shuffled labeled input
+        ilmat = list(matrixlib.imat2ilmat(imat, rowlabels, collabels))
+        random.Random(4).shuffle(ilmat)
+        out = open(os.path.join(path, "mat.lmat"), "w")
+        matrixlib.write_ilmat(out, ilmat)
+        out.close()
+        matrixlib.write_labels(os.path.join(path, "mat.lmat"),
+                               rowlabels, collabels)
+
+        last = ("lmat", "mat.lmat")
+        for k, fmt in enumerate(("csr", "imat", "bdmat", "dmat", "bdmat",
+                                 "rmat", "csr", "dmat", "lmat")):
+            filename = "mat%d.%s" % (k, fmt)
+            matrixlib.convert_matrix(os.path.join(path, last[1]), last[0],
+                                     os.path.join(path, filename), fmt,
+                                     rowlabels=rowlabels,
+                                     collabels=collabels)
+            last = (fmt, filename)
+
+            nrows, ncols, nnz, imat2, rows, cols = matrixlib.iter_matrix(
+                os.path.join(path, filename), fmt,
+                rowlabels=rowlabels, collabels=collabels)
+            self.assertEqual((nrows, ncols), (25, 25))
+            self.assertEqual(sorted(x for x in imat2 if x[2] != 0), imat,
+                             fmt)
+
+        # sidecar labels follow the binary formats
+        matrixlib.convert_matrix(os.path.join(path, "mat.lmat"), "lmat",
+                                 os.path.join(path, "mat.csr"), "csr")
+        self.assertEqual(matrixlib.read_labels(
+            os.path.join(path, "mat.csr")), (rowlabels, collabels))
+        self.assertEqual(
+            matrixlib.convert_matrix(os.path.join(path, "mat.csr"), "csr",
+                                     os.path.join(path, "mat.npy"), "bdmat"),
+            (rowlabels, collabels))
+
+    def test_repeats(self):
+        """Repeated lmat entries should be written once by sorted outputs"""
+
+        path = "test/tmp/test_matrixlib"
+        make_clean_dir(path)
+        filename = os.path.join(path, "repeat.lmat")
+        out = open(filename, "w")
+        out.write("a\tb\t1\nb\ta\t2\na\tb\t1\n")
+        out.close()
+
+        for fmt in ("dmat", "rmat", "csr"):
+            outfile = os.path.join(path, "repeat." + fmt)
+            matrixlib.convert_matrix(filename, "lmat", outfile, fmt)
+            nrows, ncols, nnz, imat, rows, cols = matrixlib.iter_matrix(
+                outfile, fmt)
+            self.assertEqual([x for x in imat if x[2] != 0],
+                             [(0, 0, 1.0), (1, 1, 2.0)], fmt)
+
+        # imat outputs keep entries as read, counted in a first pass
+        outfile = os.path.join(path, "repeat.imat")
+        matrixlib.convert_matrix(filename, "lmat", outfile, "imat")
+        nrows, ncols, nnz, imat = matrixlib.iter_imat(open(outfile))
+        self.assertEqual((nrows, ncols, nnz), (2, 2, 3))
+        self.assertEqual(list(imat),
+                         [(0, 0, 1.0), (1, 1, 2.0), (0, 0, 1.0)])
+
+    def test_rows(self):
+        imat = [(0, 1, 1.0), (2, 0, 2.0), (2, 2, 3.0)]
+        self.assertEqual(list(matrixlib.iter_imat_rows(4, imat)),
+                         [(0, [1], [1.0]), (1, [], []),
+                          (2, [0, 2], [2.0, 3.0]), (3, [], [])])
+        self.assertRaises(ValueError, list,
+                          matrixlib.iter_imat_rows(4, imat[::-1]))
+
+        make_clean_dir("test/tmp/test_matrixlib")
+        filename = "test/tmp/test_matrixlib/rows.rmat"
+        out = open(filename, "w")
+        matrixlib.write_rmat_iter(out, 4, 3, 3, iter(imat))
+        out.close()
+        self.assertEqual(matrixlib.read_rmat(open(filename))[3],
+                         [{1: 1.0}, {}, {0: 2.0, 2: 3.0}, {}])
@@ -0,0 +1,50 @@
+from StringIO import StringIO
+import unittest
+
+from rasmus import progress
+from rasmus import tablelib
+
+
+class Progress (unittest.TestCase):
+
+    def test_iter_progress(self):
+        """Wrapped iterables should be unchanged"""
+
+        items = range(100)
+        self.assertTrue(progress.iter_progress(items, enabled=False)
+                        is items)
+
+        out = StringIO()
+        self.assertEqual(list(progress.iter_progress(
+            items, name="test", out=out)), items)
+        self.assertEqual(out.getvalue().splitlines()[-1][:23],
+                         "test: 100/100 items (10")
+
+    def test_records(self):
+        """Progress records should be readable as a table"""
+
+        records = StringIO()
+        progress.write_record_header(records)
+        meter = progress.ProgressMeter(
+            name="loop", interval=0.0, out=StringIO(), records=records,
+            status=lambda: "x=%d" % meter.count)
+        for i in xrange(10):
+            meter.update(2)
+        meter.finish()
+        self.assertEqual(meter.count, 20)
+        self.assertTrue(meter.get_eta() is None)
+
+        records.seek(0)
+        tab = tablelib.read_table(records)
+        self.assertEqual(tab.headers, progress.RECORD_HEADERS)
+        self.assertEqual(tab[-1]["count"], 20)
+        self.assertEqual(tab[-1]["status"], "x=20")
+        self.assertTrue(len(tab) > 1)
+        self.assertTrue(all(row["rate"] >= 0 for row in tab))
+
+    def test_eta(self):
+        meter = progress.ProgressMeter(total=100, out=StringIO())
+        meter.start -= 10.0
+        meter._samples[0] = (meter.start, 0)
+        meter.update(25)
+        self.assertTrue(25 <= meter.get_eta() <= 35)
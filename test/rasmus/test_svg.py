@@ -0,0 +1,137 @@
+from StringIO import StringIO
+import gzip
+import os
+import struct
+import unittest
+import zlib
+from xml.dom import minidom
+
+from rasmus import plotting
+from rasmus import svg
+from rasmus import treelib
+from rasmus.testing import make_clean_dir
+from rasmus.vis import treesvg
+from compbio import phylo
+
+
+def decode_png(data):
+    """Returns (width, height, rows) of an unfiltered RGBA png"""
+    assert data[:8] == "\x89PNG\r\n\x1a\n"
+    pos = 8
+    chunks = {}
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos+4])
+        kind = data[pos+4:pos+8]
+        chunks[kind] = data[pos+8:pos+8+length]
+        pos += length + 12
+    width, height = struct.unpack(">II", chunks["IHDR"][:8])
+    raw = zlib.decompress(chunks["IDAT"])
+    rows = [raw[i*(4*width+1)+1:(i+1)*(4*width+1)] for i in xrange(height)]
+    return width, height, rows
+
+
+class Svg (unittest.TestCase):
+
+    def test_writer(self):
+        """Styles should be defined once and shared"""
+
+        out = StringIO()
+        out.close = lambda: None
+        s = svg.SvgWriter(out)
+        s.beginSvg(100, 100)
+        for i in xrange(10):
+            s.rect(i, 0, 1, 1, svg.black, svg.red)
+        s.text("label", 0, 0, 10)
+        batch = svg.PathBatch(s)
+        batch.line(0, 0, 10, 10, svg.blue)
+        batch.line(0, 5, 10, 5, svg.blue)
+        batch.box(0, 0, 2, 2, svg.red)
+        batch.flush()
+        s.endSvg()
+
+        text = out.getvalue()
+        dom = minidom.parseString(text)
+        self.assertEqual(len(dom.getElementsByTagName("rect")), 10)
+        self.assertEqual(len(dom.getElementsByTagName("path")), 2)
+        self.assertEqual(len(s.styles), 4)
+        self.assertEqual(text.count("<style"), 4)
+        self.assertTrue("d='M0 0L10 10M0 5L10 5'" in text)
+
+    def test_png(self):
+        pixels = [bytearray([255, 0, 0, 255, 0, 0, 255, 128]),
+                  bytearray([0, 0, 0, 0, 1, 2, 3, 4])]
+        width, height, rows = decode_png(svg.encode_png(pixels))
+        self.assertEqual((width, height), (2, 2))
+        self.assertEqual(map(bytearray, rows), pixels)
+
+        try:
+            import numpy as np
+        except ImportError:
+            return
+        self.assertEqual(
+            svg.encode_png(np.array([list(row) for row in pixels],
+                                    dtype=np.uint8).reshape(2, 2, 4)),
+            svg.encode_png(pixels))
+
+    def test_heatmap(self):
+        """Heatmap cells should be merged into runs or rasterized"""
+
+        path = "test/tmp/test_svg"
+        make_clean_dir(path)
+        matrix = [[0, 0, 0, 1],
+                  [1, 1, 0, 0],
+                  [0, 1, 1, 1]]
+        colormap = plotting.ColorMap([[0, plotting.white],
+                                      [1, plotting.black]])
+
+        filename = os.path.join(path, "heatmap.svgz")
+        plotting.heatmap(matrix, colormap=colormap, filename=filename,
+                         display=False)
+        text = gzip.open(filename).read()
+        dom = minidom.parseString(text)
+        self.assertEqual(len(dom.getElementsByTagName("path")), 2)
+        self.assertEqual(text.count("z"), 6)
+
+        filename = os.path.join(path, "heatmap.svg")
+        plotting.heatmap(matrix, colormap=colormap, filename=filename,
+                         display=False, raster=True, xdir=-1,
+                         maxcutoff=.5)
+        dom = minidom.parse(filename)
+        image = dom.getElementsByTagName("image")[0]
+        data = image.getAttribute("xlink:href").split(",", 1)[1]
+        width, height, rows = decode_png(data.decode("base64"))
+        self.assertEqual((width, height), (4, 3))
+        self.assertEqual(list(bytearray(rows[0])),
+                         [0, 0, 0, 0] + [255] * 12)
+
+    def test_draw_tree(self):
+        """Trees should be drawn from precomputed reconciliations"""
+
+        stree = treelib.parse_newick("((A,B),C);")
+        tree = treelib.parse_newick("(((a1,b1),(a2,b2)),c1);")
+        gene2species = lambda name: name[0].upper()
+        recon = phylo.reconcile(tree, stree, gene2species)
+
+        out = StringIO()
+        out.close = lambda: None
+        treesvg.draw_tree(tree, filename=out, stree=stree, recon=recon)
+        dom = minidom.parseString(out.getvalue())
+        self.assertEqual(len(dom.getElementsByTagName("rect")), 1)
+        self.assertEqual(len(dom.getElementsByTagName("text")), 5)
+
+        # labels are drawn on top of the branches
+        tags = [node.tagName for node in dom.getElementsByTagName("*")]
+        self.assertTrue("path" in tags)
+        self.assertTrue(len(tags) - tags[::-1].index("path") <
+                        tags.index("text"))
+
+        # collapse the duplicated clade
+        out = StringIO()
+        out.close = lambda: None
+        treesvg.draw_tree(tree, filename=out, stree=stree, recon=recon,
+                          maxleaves=2)
+        dom = minidom.parseString(out.getvalue())
+        self.assertEqual(len(dom.getElementsByTagName("rect")), 1)
+        self.assertEqual(len(dom.getElementsByTagName("polygon")), 1)
+        self.assertEqual(len(dom.getElementsByTagName("text")), 2)
+        self.assertTrue("(4 leaves)" in out.getvalue())
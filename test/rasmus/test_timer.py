@@ -0,0 +1,141 @@
+from StringIO import StringIO
+import threading
+import time
+import unittest
+
+from rasmus import decolib
+from rasmus import tablelib
+from rasmus import timer
+from rasmus.testing import fequal
+
+
+class Profiler (unittest.TestCase):
+
+    def test_sections(self):
+        """Sections should aggregate by path with self times"""
+
+        prof = timer.Profiler()
+
+        @prof.section("inner")
+        def inner():
+            time.sleep(.01)
+
+        for i in xrange(3):
+            with prof.section("outer"):
+                inner()
+                inner()
+        inner()
+
+        stats = dict((row["path"], row) for row in prof.get_table())
+        self.assertEqual(sorted(stats), ["inner", "outer", "outer/inner"])
+        self.assertEqual(stats["outer/inner"]["calls"], 6)
+        self.assertEqual(stats["inner"]["calls"], 1)
+        self.assertEqual(stats["outer"]["depth"], 1)
+        self.assertTrue(stats["outer"]["total"] >= .06)
+        self.assertTrue(stats["outer"]["self"] < stats["outer"]["total"])
+        fequal(stats["outer"]["total"],
+               stats["outer"]["self"] + stats["outer/inner"]["total"], 1e-6)
+        self.assertTrue(stats["outer"]["peak_rss"] > 0)
+
+        # exceptions close sections
+        def fail():
+            with prof.section("fail"):
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertRaises(ValueError, prof.section("fail")(fail))
+        self.assertEqual(prof._stack(), [])
+
+        # dump to tablelib
+        out = StringIO()
+        prof.write(out)
+        tab = tablelib.read_table(StringIO(out.getvalue()))
+        self.assertEqual(tab.cget("path", "calls"),
+                         [["fail", "fail/fail", "inner", "outer",
+                           "outer/inner"], [2, 1, 1, 3, 6]])
+
+        prof.reset()
+        self.assertEqual(len(prof.get_table()), 0)
+
+    def test_threads(self):
+        prof = timer.Profiler(usage=False)
+
+        def work():
+            for i in xrange(100):
+                with prof.section("work"):
+                    with prof.section("step"):
+                        pass
+        threads = [threading.Thread(target=work) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(prof.stats[("work",)][0], 400)
+        self.assertEqual(prof.stats[("work", "step")][0], 400)
+
+    def test_global(self):
+        """Timers and decorators should feed the global profiler"""
+
+        prof = timer.globalProfiler()
+        prof.reset()
+
+        @decolib.func_profiler
+        def work():
+            pass
+        work()
+        self.assertEqual(prof.stats, {})
+
+        prof.enabled = True
+        try:
+            work()
+            t = timer.Timer(StringIO())
+            t.setProfiler(prof)
+            t.start("timed")
+            work()
+            self.assertTrue(t.time() >= 0)
+            t.stop()
+        finally:
+            prof.enabled = False
+
+        self.assertEqual(sorted(prof.stats),
+                         [("timed",), ("timed", "work"), ("work",)])
+        self.assertEqual(work.__name__, "work")
+        prof.reset()
+
+    def test_toggle(self):
+        """Enabling or disabling inside an open section should be safe"""
+
+        prof = timer.Profiler(enabled=False)
+
+        @prof.section("func")
+        def func(enable):
+            prof.enabled = enable
+
+        # enabled inside sections that did not start
+        with prof.section("outer"):
+            func(True)
+            with prof.section("inner"):
+                pass
+        func(True)
+        self.assertEqual(sorted(prof.stats), [("func",), ("inner",)])
+
+        # disabled inside sections that did start
+        prof.reset()
+        with prof.section("outer"):
+            func(False)
+        prof.enabled = True
+        with prof.section("after"):
+            pass
+        self.assertEqual(prof.stats.keys().count(("after",)), 1)
+        self.assertEqual(sorted(prof.stats),
+                         [("after",), ("outer",), ("outer", "func")])
+        self.assertEqual(prof._stack(), [])
+
+        # timers with a profiler
+        t = timer.Timer(StringIO())
+        t.setProfiler(prof)
+        prof.enabled = False
+        t.start("timed")
+        prof.enabled = True
+        t.stop()
+        self.assertEqual(prof._stack(), [])
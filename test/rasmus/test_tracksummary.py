@@ -0,0 +1,101 @@
+import random
+import unittest
+
+from rasmus.vis import tracksummary
+from compbio import fasta
+from compbio.regionlib import Region
+
+
+class TrackSummary (unittest.TestCase):
+
+    def test_regions(self):
+        """Region counts and coverage should match every level"""
+
+        rand = random.Random(1)
+        regions = []
+        for i in xrange(200):
+            start = rand.randint(1, 5000)
+            regions.append(Region("sp", "chr1", "gene", start,
+                                  start + rand.randint(0, 300), 1))
+        summary = tracksummary.RegionSummary(regions, binsize=10, factor=3)
+        self.assertEqual(len(summary.levels[-1]["count"]), 1)
+
+        for level, data in enumerate(summary.levels):
+            width = summary.get_binwidth(level)
+            for i, start in enumerate(summary.get_bin_starts(level)):
+                end = start + width
+                overlaps = [(max(reg.start, start), min(reg.end + 1, end))
+                            for reg in regions
+                            if reg.start < end and reg.end >= start]
+                self.assertEqual(data["count"][i], len(overlaps))
+                self.assertAlmostEqual(
+                    data["coverage"][i] * width,
+                    sum(b - a for a, b in overlaps))
+
+    def test_curve(self):
+        """Curve min/max/mean should match every level"""
+
+        rand = random.Random(2)
+        xdata = sorted(rand.uniform(0, 1000) for i in xrange(500))
+        ydata = [rand.random() for x in xdata]
+        summary = tracksummary.CurveSummary(xdata, ydata, binsize=7,
+                                            factor=4)
+
+        for level, data in enumerate(summary.levels):
+            width = summary.get_binwidth(level)
+            for i, start in enumerate(summary.get_bin_starts(level)):
+                ys = [y for x, y in zip(xdata, ydata)
+                      if start <= x < start + width]
+                self.assertEqual(data["count"][i], len(ys))
+                if ys:
+                    self.assertEqual(data["min"][i], min(ys))
+                    self.assertEqual(data["max"][i], max(ys))
+                    self.assertAlmostEqual(data["mean"][i],
+                                           sum(ys) / len(ys))
+                else:
+                    self.assertTrue(data["mean"][i] != data["mean"][i])
+
+    def test_align(self):
+        """Alignment consensus should be the most common residue"""
+
+        aln = fasta.FastaDict()
+        aln["a"] = "ACTTTTaaNN--GGG"
+        aln["b"] = "---------------"
+        aln["c"] = "CCCCC-GGGG-TT--"
+        summary = tracksummary.AlignSummary(aln, binsize=4, factor=2)
+
+        data = summary.levels[0]
+        self.assertEqual(data["consensus"].T.tolist(),
+                         [list("TANG"), list("----"), list("CGGT")])
+        self.assertEqual(data["fill"][:, 2].tolist(),
+                         [1.0, .75, .75, 1 / 3.])
+        self.assertEqual(summary.levels[-1]["consensus"].tolist(),
+                         [["T", "-", "C"]])
+
+        # rows counted one at a time give the same summary
+        class RowSummary (tracksummary.AlignSummary):
+            BLOCK_SIZE = 1
+
+        summary2 = RowSummary(aln, binsize=4, factor=2)
+        self.assertEqual(len(summary2.levels), len(summary.levels))
+        for data, data2 in zip(summary.levels, summary2.levels):
+            self.assertEqual(data2["consensus"].tolist(),
+                             data["consensus"].tolist())
+            self.assertEqual(data2["fill"].tolist(), data["fill"].tolist())
+
+    def test_query(self):
+        """Levels should be picked by bases per pixel"""
+
+        summary = tracksummary.CurveSummary(range(1000), range(1000),
+                                            binsize=10, factor=2)
+        self.assertEqual(len(summary.levels), 8)
+        self.assertEqual(summary.get_level(5), None)
+        self.assertEqual(summary.query(0, 100, 5), None)
+        self.assertEqual(summary.get_level(10), 0)
+        self.assertEqual(summary.get_level(39.9), 1)
+        self.assertEqual(summary.get_level(1e6), 7)
+
+        level, binstarts, data = summary.query(95, 205, 20)
+        self.assertEqual(level, 1)
+        self.assertEqual(binstarts.tolist(), range(80, 220, 20))
+        self.assertEqual(data["min"].tolist(), range(80, 220, 20))
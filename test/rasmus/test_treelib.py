@@ -198,3 +198,70 @@ class Draw(unittest.TestCase):
       \--  D
 '''
         self.assertEqual(drawing, expected)
+
+
+class Layout(unittest.TestCase):
+
+    def make_caterpillar(self, nleaves):
+        tree = treelib.Tree()
+        node = tree.make_root()
+        for i in xrange(nleaves - 1):
+            leaf = tree.add_child(node, treelib.TreeNode("n%d" % i))
+            leaf.dist = 1.0
+            child = tree.add_child(node, treelib.TreeNode(tree.new_name()))
+            child.dist = 0.5
+            node = child
+        return tree
+
+    def test_layout_tree(self):
+        """Flat layouts should match layout_tree()"""
+        tree = treelib.parse_newick(
+            "(((a:1,b:2):0.5,(c:1,(d:3,e:1,f:2):1):2):1,g:4);")
+        coords = treelib.layout_tree(tree, 10, 20, 1, 25)
+        self.assertEqual(coords[tree.nodes["a"]], [26.0, 19])
+        self.assertEqual(coords[tree.nodes["g"]], [26, 139])
+        self.assertEqual(coords[tree.root], [1, 96.5])
+
+        layout = treelib.layout_tree_flat(tree, 10, 20, 1, 25)
+        self.assertEqual(layout.get_coords(), coords)
+        self.assertEqual(layout.nodes[0], tree.root)
+        self.assertEqual(layout.sizes[0], 7)
+        self.assertEqual([layout.nodes[i].name for i in layout.children[0]],
+                         [tree.root.children[0].name, "g"])
+
+        coords = treelib.layout_tree_hierarchical(tree, 10, 20)
+        self.assertEqual(coords[tree.nodes["d"]], [40, 79])
+        self.assertEqual(coords[tree.root], [0, 96.5])
+
+        layout2 = treelib.TreeLayout.from_coords(tree, coords)
+        self.assertEqual(layout2.get_coords(), coords)
+
+    def test_layout_deep(self):
+        """Deep trees should not hit the recursion limit"""
+        tree = self.make_caterpillar(20000)
+        layout = treelib.layout_tree_flat(tree, 1, 1)
+        self.assertEqual(len(layout), 39999)
+        self.assertEqual(layout[tree.nodes["n0"]],
+                         [1.0, 0.0])
+        self.assertEqual(max(layout.y), 19999.0)
+        self.assertEqual(max(layout.x), 10000.0)
+
+    def test_collapse(self):
+        """Collapsed clades should be laid out as leaves"""
+        tree = self.make_caterpillar(100)
+        collapse = treelib.find_collapsed_clades(tree, 10)
+        layout = treelib.layout_tree_flat(tree, 1, 1, collapse=collapse)
+        self.assertEqual(layout.sizes[0], 10)
+        self.assertEqual(len(layout.collapsed), 1)
+        self.assertEqual(layout.collapsed.values(), [91])
+        self.assertEqual(len(tree.leaves()), 100)
+
+        # collapsed deep clades should not hit the recursion limit
+        tree = self.make_caterpillar(20000)
+        collapse = treelib.find_collapsed_clades(tree, 100)
+        layout = treelib.layout_tree_flat(tree, 1, 1, collapse=collapse)
+        self.assertEqual(layout.sizes[0], 100)
+        self.assertEqual(layout.collapsed.values(), [19901])
+        coords = layout.get_coords()
+        layout2 = treelib.TreeLayout.from_coords(tree, coords)
+        self.assertEqual(layout2.collapsed.values(), [19901])
@@ -0,0 +1,71 @@
+"""
+
+Tests for bin-misc/runpar.
+
+"""
+
+import os
+import subprocess
+
+from rasmus.testing import make_clean_dir
+
+
+def run_runpar(args, input=None):
+    """Run runpar and return (stdout, stderr, retcode)"""
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    proc = subprocess.Popen(["python", "bin-misc/runpar"] + args, env=env,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    out, err = proc.communicate(input)
+    return out, err, proc.returncode
+
+
+def test_local():
+    """
+    Test running groups locally with --local.
+    """
+
+    outdir = "test/tmp/runpar"
+    tmpdir = os.path.join(outdir, "tmp")
+    make_clean_dir(outdir)
+    infile = os.path.join(outdir, "input")
+    lines = ["line%d\n" % i for i in range(10)]
+    with open(infile, "w") as out:
+        out.writelines(lines)
+
+    # each group is given as a file in the temp prefix
+    out, err, code = run_runpar(
+        ["--local", "-i", infile, "-g", "3", "-p", "2", "-t", tmpdir,
+         'test -f "$FILE" && dirname "$FILE" && cat "$FILE" | tr a-z A-Z'])
+    assert code == 0, err
+    assert out.split("\n").count(os.path.abspath(tmpdir)) == 4
+    assert [line for line in out.split("\n") if line.startswith("LINE")] == \
+        [line.upper().rstrip("\n") for line in lines]
+    assert os.listdir(tmpdir) == []
+
+    # commands without $FILE read their group from stdin, without temp files
+    out, err, code = run_runpar(
+        ["--local", "-i", "-", "-n", "2", "-t", tmpdir,
+         "ls %s | wc -l; wc -l" % tmpdir], "".join(lines))
+    assert code == 0, err
+    assert out.split() == ["0", "5", "0", "5"]
+
+    # a failed group is retried, and its runtime includes every attempt
+    counter = os.path.join(outdir, "counter")
+    cmd = ('echo >> %s; test $(wc -l < %s) -ge 2 || (sleep .5; false) '
+           '&& cat "$FILE"' % (counter, counter))
+    out, err, code = run_runpar(["--local", "-i", infile, "-n", "1",
+                                 "-r", "1", cmd])
+    assert code == 0, err
+    assert out == "".join(lines)
+    group, nlines, attempts, runtime, status = err.split("\n")[1].split()
+    assert (attempts, status) == ("2", "ok")
+    assert float(runtime) >= .5
+
+    # a group that fails every attempt is reported
+    os.remove(counter)
+    out, err, code = run_runpar(["--local", "-i", infile, "-n", "1",
+                                 "-r", "0", cmd])
+    assert code == 1
+    assert out == ""
+    assert "group 0 failed" in err